@@ -73,6 +73,7 @@ const GameViewComponent = ({
   gameResult,
   statusMessage,
   lastMove,
+  legalMoves,
   isSpectating,
   chatMessages,
   onSendChat,
@@ -132,6 +133,7 @@ const GameViewComponent = ({
           onMove={onMakeMove}
           isMyTurn={isMyTurn}
           lastMove={lastMove}
+          legalMoves={legalMoves}
         />
 
         {/* Timer Component - positioned absolutely via CSS */}
@@ -201,10 +203,12 @@ function App() {
   const [isMyTurn, setIsMyTurn] = useState(false);
   const [gameResult, setGameResult] = useState(null);
   const [lastMove, setLastMove] = useState(null);
+  const [legalMoves, setLegalMoves] = useState(null); // Server's legal move map for our turn: { fen, moves }
   const [inLobby, setInLobby] = useState(true);
   const [lobbyStatus, setLobbyStatus] = useState('');
   const [isSpectating, setIsSpectating] = useState(false);
   const [activeGamesList, setActiveGamesList] = useState([]);
+  const [thumbnails, setThumbnails] = useState({}); // Maps thumbnail key -> SVG markup
   const [chatMessages, setChatMessages] = useState([]);
   const [isWaitingForOpponent, setIsWaitingForOpponent] = useState(false);
   const [timeWhite, setTimeWhite] = useState(300);
@@ -244,6 +248,7 @@ function App() {
     // Reset all game-related state
     setGameId(null);
     setFen('start');
+    setLegalMoves(null);
     setPlayerColor(null);
     setIsMyTurn(false);
     setGameResult(null);
@@ -430,6 +435,7 @@ function App() {
 
             // Just update the game state without changing the UI
             setFen(message.fen);
+            setLegalMoves(message.legal_moves ? { fen: message.fen, moves: message.legal_moves } : null);
             setIsMyTurn(message.turn === message.color);
             setTimeWhite(message.time_white || 300); // Default to 5 minutes if not provided
             setTimeBlack(message.time_black || 300);
@@ -453,6 +459,7 @@ function App() {
 
           // Then update the game state
           setFen(message.fen || 'start');
+          setLegalMoves(message.legal_moves ? { fen: message.fen, moves: message.legal_moves } : null);
           setIsMyTurn(message.turn === message.color);
           setTimeWhite(message.time_white || 300);
           setTimeBlack(message.time_black || 300);
@@ -600,6 +607,11 @@ function App() {
           console.log(`Received FEN from server: ${message.fen}`);
           console.log(`Current FEN: ${fen}`);
 
+          // The side to move gets the legal move map once per ply: keep it with its position
+          if (message.legal_moves) {
+            setLegalMoves({ fen: message.fen, moves: message.legal_moves });
+          }
+
           // Only update the FEN if it's different from the current FEN
           if (message.fen !== fen) {
             console.log('Updating FEN state with server value');
@@ -832,6 +844,11 @@ function App() {
           gameResultObj.details = message.details;
         }
 
+        // Add the opening played, if one was recognized
+        if (message.opening) {
+          gameResultObj.opening = message.opening;
+        }
+
         // CRITICAL FIX: Log detailed information about the game result
         console.log('Created game result object:', gameResultObj);
         console.log('Player color:', playerColor);
@@ -927,6 +944,14 @@ function App() {
         if (Array.isArray(message.games)) {
           setActiveGamesList(message.games);
           setLobbyStatus(`Found ${message.games.length} active games`);
+
+          // Fetch the board thumbnails we don't have yet (identical positions share a key)
+          const missingThumbnails = [...new Set(message.games
+            .map(game => game.thumbnail)
+            .filter(key => key && !thumbnails[key]))];
+          if (missingThumbnails.length > 0) {
+            socketService.sendMessage({ type: 'get_thumbnails', keys: missingThumbnails });
+          }
           console.log(`Found ${message.games.length} active games:`, message.games);
         } else {
           console.error('Received invalid games list:', message.games);
@@ -935,6 +960,12 @@ function App() {
         }
         break;
 
+      case 'thumbnails':
+        if (message.svgs) {
+          setThumbnails(prev => ({ ...prev, ...message.svgs }));
+        }
+        break;
+
       case 'chat_message':
       case 'chat_update':  // Handle both message types (to match the working implementation)
         console.log(`Received chat message: ${message.text} from ${message.sender} for game ${message.game_id || 'unknown'}`);
@@ -1099,6 +1130,30 @@ function App() {
         }
         break;
 
+      case 'chat_history':
+        // Recent chat backfilled when joining a game in progress
+        if (message.messages && Array.isArray(message.messages)) {
+          console.log(`Received ${message.messages.length} chat history messages`);
+
+          setChatMessages(prev => {
+            const knownIds = new Set(prev.map(msg => msg.message_id));
+            const backfill = message.messages
+              .filter(msg => !knownIds.has(msg.message_id))
+              .map(msg => ({
+                sender: msg.sender || 'Unknown',
+                text: msg.text,
+                timestamp: msg.timestamp || Date.now(),
+                isSystem: msg.sender === 'System',
+                message_id: msg.message_id,
+                sender_role: msg.sender_role,
+                original_sender: msg.original_sender,
+                sender_id: msg.sender_id
+              }));
+            return [...backfill, ...prev];
+          });
+        }
+        break;
+
       case 'error':
         console.log('Received error message:', message.message);
 
@@ -1181,6 +1236,11 @@ function App() {
               console.log(`Resetting isMyTurn to true after illegal move error`);
               setIsMyTurn(true);
             }
+
+            // The server sends the current position with the error instead of a full state broadcast
+            if (message.fen) {
+              setFen(message.fen);
+            }
           }
         }
         break;
@@ -1878,6 +1938,7 @@ function App() {
     setIsMyTurn(false);
     setFen('start');
     setLastMove(null);
+    setLegalMoves(null);
     setChatMessages([]);
     setTimeWhite(300);
     setTimeBlack(300);
@@ -2000,6 +2061,7 @@ function App() {
               gameResult={null} /* Always pass null here since we're showing the result on a separate page */
               statusMessage={statusMessage}
               lastMove={lastMove}
+              legalMoves={!isSpectating && legalMoves && legalMoves.fen === fen ? legalMoves.moves : null}
               isSpectating={isSpectating}
               chatMessages={chatMessages}
               onSendChat={handleSendChat}
@@ -2047,6 +2109,7 @@ function App() {
             <Lobby
               lobbyStatus={lobbyStatus || statusMessage}
               activeGames={activeGamesList}
+              thumbnails={thumbnails}
               onJoinQueueClick={handleJoinLobby}
               onRefreshGamesClick={handleListGames}
               onSpectateGameClick={handleSpectateGame}
@@ -30,8 +30,10 @@ const boardStyles = {
  * @param {Function} props.onMove - Callback function when a move is made (uciMove) => void
  * @param {boolean} props.isMyTurn - Whether it's the player's turn
  * @param {string} props.lastMove - Last move in UCI notation (e.g., 'e2e4')
+ * @param {Object} props.legalMoves - Server's legal moves for this position, from-square -> destinations
+ *                                     (e.g. { e2: ['e3', 'e4'] }, promotions as 'e8q'), or null if not known
  */
-const ChessboardComponent = ({ initialFen, playerColor, onMove, isMyTurn, lastMove }) => {
+const ChessboardComponent = ({ initialFen, playerColor, onMove, isMyTurn, lastMove, legalMoves }) => {
   console.log('ChessboardComponent rendering with props:', { initialFen, playerColor, isMyTurn, lastMove });
 
   // Use a ref to track the current FEN to avoid unnecessary re-renders
@@ -50,6 +52,23 @@ const ChessboardComponent = ({ initialFen, playerColor, onMove, isMyTurn, lastMo
   // State for highlighted squares (for last move)
   const [highlightedSquares, setHighlightedSquares] = useState({});
 
+  // State for move hints (destinations of the piece being dragged)
+  const [hintSquares, setHintSquares] = useState({});
+
+  // Show the legal destinations of a piece, from the server's legal move map
+  const showMoveHints = (sourceSquare) => {
+    const destinations = (legalMoves && legalMoves[sourceSquare]) || [];
+    const newHintSquares = {};
+    destinations.forEach((destination) => {
+      // Promotions carry their piece suffix (e.g. 'e8q')
+      const square = destination.substring(0, 2);
+      newHintSquares[square] = game.get(square)
+        ? { background: 'radial-gradient(circle, transparent 58%, rgba(0, 0, 0, 0.2) 60%)' }
+        : { background: 'radial-gradient(circle, rgba(0, 0, 0, 0.2) 22%, transparent 24%)' };
+    });
+    setHintSquares(newHintSquares);
+  };
+
   // Function to update highlighted squares based on lastMove
   const updateHighlightedSquares = useCallback((move) => {
     if (!move || move.length < 4) {
@@ -152,6 +171,7 @@ const ChessboardComponent = ({ initialFen, playerColor, onMove, isMyTurn, lastMo
 
   // Handle piece drop
   const onDrop = (sourceSquare, targetSquare, piece) => {
+    setHintSquares({});
     console.log('=== PIECE DROP ATTEMPT ===');
     console.log('Move details:', { sourceSquare, targetSquare, piece });
     console.log('Current turn state:', { isMyTurn, playerColor });
@@ -198,6 +218,16 @@ const ChessboardComponent = ({ initialFen, playerColor, onMove, isMyTurn, lastMo
         (piece === 'wP' && targetSquare[1] === '8') ||
         (piece === 'bP' && targetSquare[1] === '1');
 
+      // Check the move against the server's legal move map when we have it:
+      // an illegal move never makes a round trip to the server
+      if (legalMoves) {
+        const destination = isPawnPromotion ? `${targetSquare}q` : targetSquare;
+        if (!(legalMoves[sourceSquare] || []).includes(destination)) {
+          console.log('Move is illegal according to the server\'s legal move map');
+          return false;
+        }
+      }
+
       // Create the move object
       const moveObj = {
         from: sourceSquare,
@@ -273,9 +303,12 @@ const ChessboardComponent = ({ initialFen, playerColor, onMove, isMyTurn, lastMo
         id="chessboard"
         position={game.fen()}
         onPieceDrop={onDrop}
+        onPieceDragBegin={(piece, sourceSquare) => showMoveHints(sourceSquare)}
+        onPieceDragEnd={() => setHintSquares({})}
         boardOrientation={playerColor === 'black' ? 'black' : 'white'}
         customSquareStyles={{
           ...highlightedSquares,
+          ...hintSquares,
           ...boardStyle
         }}
         customLightSquareStyle={boardStyle.lightSquareStyle}
@@ -231,6 +231,12 @@ const GameResultPage = ({
 
         {getResultDetails()}
 
+        {gameResult.opening && (
+          <p className="result-opening">
+            Opening: {gameResult.opening.eco} {gameResult.opening.name}
+          </p>
+        )}
+
         <div className="game-result-actions">
           <button
             className="back-to-lobby-btn"
@@ -9,6 +9,7 @@ import './Lobby.css';
  * @param {Object} props - Component props
  * @param {string} props.lobbyStatus - Status message to display in the lobby
  * @param {Array} props.activeGames - List of active games
+ * @param {Object} props.thumbnails - Board thumbnail SVGs by thumbnail key
  * @param {Function} props.onJoinQueueClick - Callback when Join Game Queue button is clicked
  * @param {Function} props.onSpectateGameClick - Callback when Spectate button is clicked (gameId) => void
  * @param {Function} props.onRefreshGamesClick - Callback when Refresh Games List button is clicked
@@ -19,6 +20,7 @@ import './Lobby.css';
 const Lobby = ({
   lobbyStatus,
   activeGames,
+  thumbnails = {},
   onJoinQueueClick,
   onSpectateGameClick,
   onRefreshGamesClick,
@@ -181,12 +183,27 @@ const Lobby = ({
           <ul className="games-list">
             {activeGames.map((game) => (
               <li key={game.id} className="game-item">
+                {game.thumbnail && thumbnails[game.thumbnail] && (
+                  <img
+                    className="game-thumbnail"
+                    src={`data:image/svg+xml;utf8,${encodeURIComponent(thumbnails[game.thumbnail])}`}
+                    alt="Board position"
+                  />
+                )}
                 <div className="game-info">
-                  <span className="game-id">Game ID: {game.id.substring(0, 8)}...</span>
+                  <span className="game-id">
+                    Game ID: {game.id.substring(0, 8)}...
+                    {game.featured && <span className="game-featured">Featured</span>}
+                  </span>
                   <span className="game-status">Status: {game.status}</span>
                   <span className="game-players">
                     Players: {game.players ? game.players.length : 0}
                   </span>
+                  {game.opening && (
+                    <span className="game-opening">
+                      Opening: {game.opening.eco} {game.opening.name}
+                    </span>
+                  )}
                 </div>
 
                 <button
@@ -0,0 +1,91 @@
+// client_react/src/services/messagePack.js
+
+/**
+ * Minimal MessagePack decoder for the server's binary frames
+ * (see server/codec.py). Decodes to the same objects as the JSON frames.
+ */
+
+const textDecoder = new TextDecoder();
+
+/**
+ * Decode a MessagePack frame
+ * @param {ArrayBuffer} buffer - The binary frame
+ * @returns {*} - The decoded message
+ */
+const decodeMessagePack = (buffer) => {
+  const bytes = new Uint8Array(buffer);
+  const view = new DataView(bytes.buffer, bytes.byteOffset, bytes.byteLength);
+  let offset = 0;
+
+  const readString = (length) => {
+    const value = textDecoder.decode(bytes.subarray(offset, offset + length));
+    offset += length;
+    return value;
+  };
+
+  const readBinary = (length) => {
+    const value = bytes.slice(offset, offset + length);
+    offset += length;
+    return value;
+  };
+
+  const readArray = (length) => {
+    const array = new Array(length);
+    for (let i = 0; i < length; i++) {
+      array[i] = read();
+    }
+    return array;
+  };
+
+  const readMap = (length) => {
+    const map = {};
+    for (let i = 0; i < length; i++) {
+      const key = read();
+      map[key] = read();
+    }
+    return map;
+  };
+
+  const read = () => {
+    const type = bytes[offset++];
+
+    if (type <= 0x7f) return type;                      // positive fixint
+    if (type >= 0xe0) return type - 0x100;              // negative fixint
+    if ((type & 0xf0) === 0x80) return readMap(type & 0x0f);
+    if ((type & 0xf0) === 0x90) return readArray(type & 0x0f);
+    if ((type & 0xe0) === 0xa0) return readString(type & 0x1f);
+
+    let value;
+    switch (type) {
+      case 0xc0: return null;
+      case 0xc2: return false;
+      case 0xc3: return true;
+      case 0xc4: value = view.getUint8(offset); offset += 1; return readBinary(value);
+      case 0xc5: value = view.getUint16(offset); offset += 2; return readBinary(value);
+      case 0xc6: value = view.getUint32(offset); offset += 4; return readBinary(value);
+      case 0xca: value = view.getFloat32(offset); offset += 4; return value;
+      case 0xcb: value = view.getFloat64(offset); offset += 8; return value;
+      case 0xcc: value = view.getUint8(offset); offset += 1; return value;
+      case 0xcd: value = view.getUint16(offset); offset += 2; return value;
+      case 0xce: value = view.getUint32(offset); offset += 4; return value;
+      case 0xcf: value = Number(view.getBigUint64(offset)); offset += 8; return value;
+      case 0xd0: value = view.getInt8(offset); offset += 1; return value;
+      case 0xd1: value = view.getInt16(offset); offset += 2; return value;
+      case 0xd2: value = view.getInt32(offset); offset += 4; return value;
+      case 0xd3: value = Number(view.getBigInt64(offset)); offset += 8; return value;
+      case 0xd9: value = view.getUint8(offset); offset += 1; return readString(value);
+      case 0xda: value = view.getUint16(offset); offset += 2; return readString(value);
+      case 0xdb: value = view.getUint32(offset); offset += 4; return readString(value);
+      case 0xdc: value = view.getUint16(offset); offset += 2; return readArray(value);
+      case 0xdd: value = view.getUint32(offset); offset += 4; return readArray(value);
+      case 0xde: value = view.getUint16(offset); offset += 2; return readMap(value);
+      case 0xdf: value = view.getUint32(offset); offset += 4; return readMap(value);
+      default:
+        throw new Error(`Unsupported MessagePack type 0x${type.toString(16)} at offset ${offset - 1}`);
+    }
+  };
+
+  return read();
+};
+
+export { decodeMessagePack };
@@ -1,5 +1,7 @@
 // client_react/src/socketService.js
 
+import { decodeMessagePack } from './messagePack';
+
 /**
  * Socket service for WebSocket communication with the chess server
  */
@@ -15,6 +17,21 @@ let onMessageCallback = null;
 let onOpenCallback = null;
 let onCloseCallback = null;
 
+// Reconnection attempts left to resume a game after the server went away (e.g. a failover)
+const MAX_RESUME_ATTEMPTS = 10;
+const RESUME_RETRY_DELAY_MS = 500;
+
+// Close code of a server that restarts (drains into a new process): reconnect after a random delay
+const SERVICE_RESTART_CODE = 1012;
+const RESTART_RECONNECT_JITTER_MS = 2000;
+let resumeAttemptsLeft = MAX_RESUME_ATTEMPTS;
+
+// Wire formats (WebSocket subprotocols, see server/codec.py). Binary MessagePack frames
+// are opt-in: set localStorage 'chess_binary_frames' to 'true' to ask the server for them
+const MSGPACK_SUBPROTOCOL = 'chess.msgpack';
+const JSON_SUBPROTOCOL = 'chess.json';
+const useBinaryFrames = localStorage.getItem('chess_binary_frames') === 'true';
+
 // Client ID for identifying this client
 // Use a stored client ID if available, otherwise generate a new one
 let clientId = localStorage.getItem('chess_client_id') || Date.now().toString();
@@ -75,12 +92,25 @@ const connect = (url) => {
     // This prevents caching issues and helps with server-side identification
     // Use the persistent client ID from the module scope
     const timestampedUrl = `${url}?t=${Date.now()}&clientId=${clientId}`;
-    socket = new WebSocket(timestampedUrl);
+    // Offer JSON as well, so a server with binary frames disabled still accepts the connection
+    socket = useBinaryFrames
+      ? new WebSocket(timestampedUrl, [MSGPACK_SUBPROTOCOL, JSON_SUBPROTOCOL])
+      : new WebSocket(timestampedUrl);
+    socket.binaryType = 'arraybuffer';
     console.log('WebSocket object created with client ID:', clientId);
 
     // Set up event handlers
     socket.onopen = (event) => {
-      console.log('WebSocket connection established!');
+      console.log(`WebSocket connection established! (wire format: ${socket.protocol || JSON_SUBPROTOCOL})`);
+      resumeAttemptsLeft = MAX_RESUME_ATTEMPTS;
+
+      // Take our seat back in a game interrupted by a lost connection (e.g. a server failover)
+      const resumeGameId = localStorage.getItem('currentGameId');
+      const resumeToken = localStorage.getItem('currentGameToken');
+      if (resumeGameId && resumeToken) {
+        console.log(`Resuming game ${resumeGameId}`);
+        sendMessage({ type: 'resume_game', game_id: resumeGameId, token: resumeToken });
+      }
 
       if (onOpenCallback) {
         onOpenCallback(event);
@@ -108,8 +138,18 @@ const connect = (url) => {
         onCloseCallback(event);
       }
 
-      // Do NOT attempt to reconnect automatically
-      console.log('WebSocket connection closed. Manual refresh required to reconnect.');
+      // Only reconnect automatically to resume a game the server can hand back to us,
+      // or when the server restarts (spread out, so clients don't all come back at once)
+      const canResume = localStorage.getItem('currentGameId') && localStorage.getItem('currentGameToken');
+      if (!isNormalClosure && (canResume || event.code === SERVICE_RESTART_CODE) && resumeAttemptsLeft > 0) {
+        resumeAttemptsLeft -= 1;
+        const delay = RESUME_RETRY_DELAY_MS +
+          (event.code === SERVICE_RESTART_CODE ? Math.random() * RESTART_RECONNECT_JITTER_MS : 0);
+        console.log(`Reconnecting in ${Math.round(delay)} ms (${resumeAttemptsLeft} attempts left)`);
+        setTimeout(() => connect(currentSocketUrl), delay);
+      } else {
+        console.log('WebSocket connection closed. Manual refresh required to reconnect.');
+      }
 
       // Remove any reconnection flags to prevent automatic reconnection
       localStorage.removeItem('needsReconnect');
@@ -122,14 +162,22 @@ const connect = (url) => {
 
     socket.onmessage = (event) => {
       try {
-        // Parse the message as JSON
-        const message = JSON.parse(event.data);
+        // Text frames are JSON, binary frames MessagePack
+        const message = typeof event.data === 'string'
+          ? JSON.parse(event.data)
+          : decodeMessagePack(event.data);
         console.log('Received message:', message);
 
         // Handle ping messages
         if (message.type === 'ping') {
-          // Respond with a pong message
-          sendMessage({ type: 'pong' });
+          // Respond with a pong message, echoing the clock-sync fields
+          // and adding our own clock so the server can estimate RTT and offset
+          sendMessage({
+            type: 'pong',
+            sync_id: message.sync_id,
+            server_time: message.server_time,
+            client_time: Date.now()
+          });
           console.log('Received ping, sent pong');
           return; // Don't process ping messages further
         }
@@ -140,6 +188,11 @@ const connect = (url) => {
           localStorage.setItem('currentGameId', message.game_id);
           console.log(`Game started with ID: ${message.game_id}`);
 
+          // Keep the token that lets us resume the game on a new connection
+          if (message.resume_token) {
+            localStorage.setItem('currentGameToken', message.resume_token);
+          }
+
           // Log detailed information about the game start
           console.log('Game start details:');
           console.log(`- Game ID: ${message.game_id}`);
@@ -151,6 +204,7 @@ const connect = (url) => {
         } else if (message.type === 'game_over' || message.type === 'opponent_disconnected') {
           // Clear the game ID when the game ends
           localStorage.removeItem('currentGameId');
+          localStorage.removeItem('currentGameToken');
           console.log('Game ended, cleared game ID');
         } else if (message.type === 'error') {
           // Check if this is an invalid game ID error
@@ -161,6 +215,7 @@ const connect = (url) => {
             )) {
             console.log('Received invalid game ID error, clearing stored game ID');
             localStorage.removeItem('currentGameId');
+            localStorage.removeItem('currentGameToken');
           }
         }
 
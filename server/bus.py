@@ -0,0 +1,351 @@
+# server/bus.py
+import os
+import json
+import uuid
+import asyncio
+import itertools
+from collections import deque
+from config import BUS_BACKEND, BUS_SOCKET_PATH, BUS_RETAINED_MESSAGES
+
+# Delivery modes
+AT_MOST_ONCE = "at_most_once"    # Dropped if the broker is unreachable or a subscriber lags behind
+AT_LEAST_ONCE = "at_least_once"  # Retried until the broker has it, replayed to subscribers that reconnect
+
+# Bytes a subscriber may have queued before at-most-once messages to it are dropped
+MAX_SUBSCRIBER_BUFFER = 4 * 1024 * 1024
+
+# Seconds between attempts to reach the broker
+RECONNECT_DELAY = 1.0
+
+
+class MessageBus:
+    """
+    Topic-based publish/subscribe between server processes.
+
+    Subscribers are coroutine functions called as callback(topic, data) in the
+    subscribing process. Messages published by a process are delivered to its own
+    subscribers directly and to other processes' subscribers through the backend.
+    """
+
+    def __init__(self):
+        self.subscribers = {}  # Maps topic -> list of callbacks
+        self.published = 0     # Number of messages published (for metrics)
+        self.delivered = 0     # Number of callback invocations (for metrics)
+
+    async def start(self):
+        """Connect the backend, if it needs to."""
+
+    async def close(self):
+        """Disconnect the backend, if it needs to."""
+
+    def subscribe(self, topic, callback):
+        """
+        Subscribe to a topic.
+
+        Args:
+            topic: The topic name
+            callback: Coroutine function called as callback(topic, data)
+        """
+        callbacks = self.subscribers.setdefault(topic, [])
+        if callback not in callbacks:
+            callbacks.append(callback)
+
+    def unsubscribe(self, topic, callback):
+        """Remove a subscription added with subscribe()."""
+        callbacks = self.subscribers.get(topic)
+        if callbacks is None or callback not in callbacks:
+            return
+        callbacks.remove(callback)
+        if not callbacks:
+            del self.subscribers[topic]
+
+    async def publish(self, topic, data, delivery=AT_MOST_ONCE):
+        """
+        Publish a message.
+
+        Args:
+            topic: The topic name
+            data: JSON-serializable payload
+            delivery: AT_MOST_ONCE or AT_LEAST_ONCE
+        """
+        self.published += 1
+        await self._dispatch(topic, data)
+
+    async def _dispatch(self, topic, data):
+        """Call this process's subscribers of a topic."""
+        for callback in list(self.subscribers.get(topic, ())):
+            self.delivered += 1
+            try:
+                await callback(topic, data)
+            except Exception as e:
+                print(f"Error delivering bus message on {topic}: {str(e)}")
+
+    def get_stats(self):
+        """Return counters for the stats endpoint."""
+        return {"topics": len(self.subscribers), "published": self.published, "delivered": self.delivered}
+
+
+class InProcessBus(MessageBus):
+    """Bus for a single process: publishing calls the subscribers directly (both modes)."""
+
+
+class UnixSocketBus(MessageBus):
+    """
+    Bus backed by a BusBroker on a Unix socket (a stand-in for Redis pub/sub).
+
+    Frames are newline-delimited JSON. The broker numbers at-least-once messages
+    per topic and retains the latest ones: a process re-subscribing after a lost
+    connection asks for everything after the last sequence number it saw, and
+    drops duplicates. At-least-once publishes are kept until the broker acks them
+    and re-sent after a reconnect; they carry the bus's publisher ID and a publish
+    ID, so the broker relays a message whose ack was lost only once.
+    """
+
+    def __init__(self, path=BUS_SOCKET_PATH):
+        """
+        Initialize the bus.
+
+        Args:
+            path: Path of the broker's Unix socket
+        """
+        super().__init__()
+        self.path = path
+        self._writer = None
+        self._connector = None
+        self._epoch = None       # Broker instance the sequence numbers below belong to
+        self._last_seq = {}      # Maps topic -> last sequence number delivered
+        self._unacked = {}       # Maps publish ID -> frame of at-least-once messages not yet acked
+        self._publish_ids = itertools.count(1)
+        self.publisher_id = uuid.uuid4().hex  # Identifies this bus's publishes to the broker
+        self.dropped = 0         # At-most-once messages published while disconnected
+
+    async def start(self):
+        if self._connector is None:
+            self._connector = asyncio.create_task(self._connection_loop())
+
+    async def close(self):
+        if self._connector is not None:
+            self._connector.cancel()
+            self._connector = None
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    def _send(self, frame):
+        """Write a frame to the broker. Returns False if not connected."""
+        if self._writer is None:
+            return False
+        self._writer.write(json.dumps(frame).encode() + b"\n")
+        return True
+
+    def subscribe(self, topic, callback):
+        first = topic not in self.subscribers
+        super().subscribe(topic, callback)
+        if first:
+            self._send({"op": "sub", "topic": topic, "since": self._last_seq.get(topic)})
+
+    def unsubscribe(self, topic, callback):
+        super().unsubscribe(topic, callback)
+        if topic not in self.subscribers:
+            self._last_seq.pop(topic, None)
+            self._send({"op": "unsub", "topic": topic})
+
+    async def publish(self, topic, data, delivery=AT_MOST_ONCE):
+        self.published += 1
+        frame = {"op": "pub", "topic": topic, "data": data}
+        if delivery == AT_LEAST_ONCE:
+            frame["publisher"] = self.publisher_id
+            frame["id"] = next(self._publish_ids)
+            self._unacked[frame["id"]] = frame
+        if not self._send(frame) and delivery == AT_MOST_ONCE:
+            self.dropped += 1
+        # The broker doesn't echo messages back to their publisher
+        await self._dispatch(topic, data)
+
+    async def _connection_loop(self):
+        """Keep a connection to the broker, re-subscribing and re-sending after reconnects."""
+        while True:
+            try:
+                reader, writer = await asyncio.open_unix_connection(self.path)
+            except OSError as e:
+                print(f"Message bus broker unreachable at {self.path}: {str(e)}")
+                await asyncio.sleep(RECONNECT_DELAY)
+                continue
+
+            self._writer = writer
+            print(f"Connected to message bus broker at {self.path}")
+            try:
+                for topic in self.subscribers:
+                    self._send({"op": "sub", "topic": topic, "since": self._last_seq.get(topic)})
+                for frame in self._unacked.values():
+                    self._send(frame)
+                await self._read_loop(reader)
+            except (OSError, asyncio.IncompleteReadError) as e:
+                print(f"Lost connection to message bus broker: {str(e)}")
+            finally:
+                self._writer = None
+                writer.close()
+            await asyncio.sleep(RECONNECT_DELAY)
+
+    async def _read_loop(self, reader):
+        async for line in reader:
+            frame = json.loads(line)
+            op = frame.get("op")
+            if op == "msg":
+                topic, seq = frame["topic"], frame.get("seq")
+                if seq is not None:
+                    if seq <= self._last_seq.get(topic, 0):
+                        continue  # Already delivered before a reconnect
+                    self._last_seq[topic] = seq
+                await self._dispatch(topic, frame["data"])
+            elif op == "ack":
+                self._unacked.pop(frame["id"], None)
+            elif op == "hello":
+                if frame["epoch"] != self._epoch:
+                    # A new broker numbers messages from scratch
+                    self._epoch = frame["epoch"]
+                    self._last_seq.clear()
+
+    def get_stats(self):
+        stats = super().get_stats()
+        stats.update(connected=self._writer is not None, unacked=len(self._unacked), dropped=self.dropped)
+        return stats
+
+
+class BusBroker:
+    """
+    Unix-socket broker relaying messages between UnixSocketBus clients.
+
+    At-least-once messages get a per-topic sequence number and the latest
+    BUS_RETAINED_MESSAGES of them are retained for replay. Publish IDs only
+    grow per publisher and a connection delivers them in order, so a publish
+    at or below the last ID relayed for its publisher is a re-send after a lost
+    ack: it is acked again but not relayed.
+    """
+
+    def __init__(self, path=BUS_SOCKET_PATH, retained=BUS_RETAINED_MESSAGES):
+        """
+        Initialize the broker.
+
+        Args:
+            path: Path of the Unix socket to listen on
+            retained: At-least-once messages retained per topic
+        """
+        self.path = path
+        self.retained = retained
+        self.epoch = uuid.uuid4().hex
+        self.topics = {}  # Maps topic -> set of subscribed writers
+        self._seq = {}    # Maps topic -> last sequence number
+        self._log = {}    # Maps topic -> deque of (seq, encoded msg frame)
+        self._last_publish_id = {}  # Maps publisher ID -> last at-least-once publish ID relayed
+        self.duplicates = 0         # Re-sent publishes not relayed again
+        self._server = None
+
+    async def start(self):
+        """Start listening."""
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self._server = await asyncio.start_unix_server(self._handle_client, self.path)
+        print(f"Message bus broker listening on {self.path}")
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+
+    async def _handle_client(self, reader, writer):
+        writer.write(json.dumps({"op": "hello", "epoch": self.epoch}).encode() + b"\n")
+        subscribed = set()
+        try:
+            async for line in reader:
+                frame = json.loads(line)
+                op = frame.get("op")
+                if op == "pub":
+                    self._publish(frame, writer)
+                elif op == "sub":
+                    topic = frame["topic"]
+                    self.topics.setdefault(topic, set()).add(writer)
+                    subscribed.add(topic)
+                    since = frame.get("since")
+                    if since is not None:
+                        for seq, encoded in self._log.get(topic, ()):
+                            if seq > since:
+                                writer.write(encoded)
+                elif op == "unsub":
+                    self._unsubscribe(frame["topic"], writer)
+                    subscribed.discard(frame["topic"])
+                await writer.drain()
+        except (OSError, ValueError) as e:
+            print(f"Message bus client error: {str(e)}")
+        finally:
+            for topic in subscribed:
+                self._unsubscribe(topic, writer)
+            writer.close()
+
+    def _unsubscribe(self, topic, writer):
+        writers = self.topics.get(topic)
+        if writers is not None:
+            writers.discard(writer)
+            if not writers:
+                del self.topics[topic]
+
+    def _publish(self, frame, publisher):
+        topic = frame["topic"]
+        message = {"op": "msg", "topic": topic, "data": frame["data"]}
+        reliable = "id" in frame
+        if reliable:
+            publisher_id = frame.get("publisher")
+            if publisher_id is not None:
+                if frame["id"] <= self._last_publish_id.get(publisher_id, 0):
+                    self.duplicates += 1
+                    publisher.write(json.dumps({"op": "ack", "id": frame["id"]}).encode() + b"\n")
+                    return
+                self._last_publish_id[publisher_id] = frame["id"]
+            seq = self._seq.get(topic, 0) + 1
+            self._seq[topic] = seq
+            message["seq"] = seq
+        encoded = json.dumps(message).encode() + b"\n"
+        if reliable:
+            log = self._log.get(topic)
+            if log is None:
+                log = self._log[topic] = deque(maxlen=self.retained)
+            log.append((seq, encoded))
+
+        for writer in self.topics.get(topic, ()):
+            if writer is publisher:
+                continue
+            if not reliable and writer.transport.get_write_buffer_size() > MAX_SUBSCRIBER_BUFFER:
+                continue
+            writer.write(encoded)
+
+        if reliable:
+            publisher.write(json.dumps({"op": "ack", "id": frame["id"]}).encode() + b"\n")
+
+
+# Message bus of this process
+_message_bus = None
+
+
+def get_message_bus():
+    """
+    Get the process-wide message bus (see BUS_BACKEND).
+
+    Returns:
+        MessageBus: The shared bus
+    """
+    global _message_bus
+    if _message_bus is None:
+        _message_bus = UnixSocketBus() if BUS_BACKEND == "unix" else InProcessBus()
+    return _message_bus
+
+
+if __name__ == "__main__":
+    # Run a standalone broker
+    async def run_broker():
+        await BusBroker().start()
+        await asyncio.Future()
+
+    try:
+        asyncio.run(run_broker())
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,92 @@
+# server/chat_expiry.py
+import heapq
+import asyncio
+import itertools
+
+# Seconds a chat message waits for a response before it is deleted
+CHAT_RESPONSE_TIMEOUT = 60
+
+
+class ChatExpiryScheduler:
+    """
+    Process-wide scheduler for chat message expiry.
+
+    Pending messages of every game go into a single min-heap keyed by their
+    deadline, and one event-loop timer is armed for the earliest deadline.
+    Nothing runs while no message is pending. Entries for messages that got a
+    response are not removed from the heap; they are skipped when they expire.
+    """
+
+    def __init__(self):
+        self._heap = []  # (deadline, seq, session, sender_id, message_id)
+        self._counter = itertools.count()  # Tie-breaker so sessions are never compared
+        self._timer = None
+        self._timer_deadline = None
+        self._tasks = set()  # Running deletion notifications
+
+    def schedule(self, session, sender_id, message_id, timeout=CHAT_RESPONSE_TIMEOUT):
+        """
+        Schedule a pending message to expire. Must be called from the event loop.
+
+        Args:
+            session: GameSession the message belongs to
+            sender_id: Client ID of the sender
+            message_id: ID of the pending message
+            timeout: Seconds until the message expires
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        heapq.heappush(self._heap, (deadline, next(self._counter), session, sender_id, message_id))
+        if self._timer is None or deadline < self._timer_deadline:
+            self._arm(loop)
+
+    def _arm(self, loop):
+        """(Re)arm the timer for the earliest deadline, if any."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._heap:
+            self._timer_deadline = self._heap[0][0]
+            self._timer = loop.call_at(self._timer_deadline, self._fire)
+
+    def _fire(self):
+        """Expire every entry whose deadline has passed."""
+        self._timer = None
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+
+        while self._heap and self._heap[0][0] <= now:
+            _, _, session, sender_id, message_id = heapq.heappop(self._heap)
+            try:
+                deletion = session.expire_chat_message(sender_id, message_id)
+            except Exception as e:
+                print(f"Error expiring chat message {message_id}: {str(e)}")
+                continue
+
+            if deletion is not None:
+                task = loop.create_task(deletion)
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+
+        self._arm(loop)
+
+    def pending_count(self):
+        """Return the number of scheduled entries (including ones already answered)."""
+        return len(self._heap)
+
+
+# Shared scheduler instance for all game sessions
+_chat_expiry = None
+
+
+def get_chat_expiry():
+    """
+    Get the process-wide chat expiry scheduler.
+
+    Returns:
+        ChatExpiryScheduler: The shared scheduler
+    """
+    global _chat_expiry
+    if _chat_expiry is None:
+        _chat_expiry = ChatExpiryScheduler()
+    return _chat_expiry
@@ -0,0 +1,119 @@
+# server/chat_history.py
+from collections import namedtuple
+
+
+class ChatRecord(namedtuple("ChatRecord", "message_id timestamp sender sender_role sender_id text")):
+    """Compact chat message as stored in a room's history."""
+
+    __slots__ = ()
+
+    def to_message(self, game_id):
+        """
+        Expand the record into the chat_update message sent to clients.
+
+        Args:
+            game_id: The room the message belongs to
+
+        Returns:
+            dict: The chat_update message
+        """
+        return {
+            "type": "chat_update",  # IMPORTANT: Must be 'chat_update' to match working implementation
+            "sender": self.sender,
+            "text": self.text,
+            "game_id": game_id,
+            "timestamp": self.timestamp,  # Add timestamp for message ordering
+            "original_sender": self.sender,  # Use display_sender (username) for client-side identification
+            "sender_role": self.sender_role,  # Include the sender's role (white, black, or spectator)
+            "sender_id": self.sender_id,  # Include the client ID for filtering on the client side
+            "message_id": self.message_id,  # Unique (per room) integer message ID
+            "username": self.sender  # Include the username explicitly
+        }
+
+
+class ChatHistory:
+    """
+    Fixed-capacity ring buffer of a room's most recent chat messages.
+
+    Message IDs are consecutive integers, so the slot of a message is its ID
+    modulo the capacity and lookups don't need an index. Once the buffer is
+    full, each new message overwrites the oldest one. The buffer is only
+    allocated with the first message, as most rooms never chat.
+    """
+
+    __slots__ = ("capacity", "_slots", "_next_id")
+
+    def __init__(self, capacity):
+        """
+        Initialize an empty history.
+
+        Args:
+            capacity: Maximum number of messages kept
+        """
+        self.capacity = max(1, capacity)
+        self._slots = ()
+        self._next_id = 1
+
+    def append(self, timestamp, sender, sender_role, sender_id, text):
+        """
+        Store a new message, evicting the oldest one if the buffer is full.
+
+        Returns:
+            ChatRecord: The stored record, with its newly assigned message ID
+        """
+        record = ChatRecord(self._next_id, timestamp, sender, sender_role, sender_id, text)
+        if not self._slots:
+            self._slots = [None] * self.capacity
+        self._slots[self._next_id % self.capacity] = record
+        self._next_id += 1
+        return record
+
+    def get(self, message_id):
+        """
+        Look up a message by ID.
+
+        Args:
+            message_id: The integer message ID
+
+        Returns:
+            ChatRecord or None: The record, or None if it was deleted or evicted
+        """
+        if not isinstance(message_id, int) or not self._slots:
+            return None
+        record = self._slots[message_id % self.capacity]
+        return record if record is not None and record.message_id == message_id else None
+
+    def remove(self, message_id):
+        """
+        Delete a message.
+
+        Args:
+            message_id: The integer message ID
+
+        Returns:
+            ChatRecord or None: The removed record, or None if it wasn't stored
+        """
+        record = self.get(message_id)
+        if record is not None:
+            self._slots[message_id % self.capacity] = None
+        return record
+
+    def recent(self, limit=None):
+        """
+        Get the most recent messages, oldest first.
+
+        Args:
+            limit: Maximum number of messages (defaults to the whole buffer)
+
+        Returns:
+            list: ChatRecord objects
+        """
+        if not self._slots:
+            return []
+        limit = self.capacity if limit is None else min(limit, self.capacity)
+        first_id = max(1, self._next_id - limit)
+        records = (self._slots[message_id % self.capacity] for message_id in range(first_id, self._next_id))
+        return [record for record in records if record is not None]
+
+    def __len__(self):
+        return sum(1 for record in self._slots if record is not None)
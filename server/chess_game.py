@@ -1,45 +1,77 @@
 # server/chess_game.py
 import chess
-import asyncio
+from opening_book import get_opening_book
+from eco import OpeningCursor, get_eco_table
+from clock import ChessClock, TimeControl
 
 class ChessGame:
-    def __init__(self, time_control_seconds=300):
+    __slots__ = (
+        "board", "players", "player_colors", "time_control", "clock", "_timed_out_player",
+        "_adjudicated_result", "version", "last_move_was_capture", "captured_piece",
+        "_legal_move_set", "_legal_move_map", "in_book", "opening_cursor"
+    )
+
+    def __init__(self, time_control_seconds=300, time_control=None):
+        """
+        Initialize a new game.
+
+        Args:
+            time_control_seconds: Base time per side in seconds (used if time_control is None)
+            time_control: TimeControl or specification string such as "180+2" or "40/5400+30:1800+30"
+        """
         self.board = chess.Board()
         self.players = {'white': None, 'black': None}  # To store player identifiers
         self.player_colors = {}  # To map player_id to chess.WHITE or chess.BLACK
-        self.time_control_seconds = time_control_seconds
-
-        # Initialize all time variables to the exact same value
-        # This ensures all time values are consistent at the start of the game
-        self.time_white = time_control_seconds
-        self.time_black = time_control_seconds
-        self.time_at_last_move_white = time_control_seconds
-        self.time_at_last_move_black = time_control_seconds
-
-        # IMPORTANT FIX: Add new variables for exact time tracking
-        # These will be used to ensure precise time calculations
-        self.exact_time_white_at_move = time_control_seconds
-        self.exact_time_black_at_move = time_control_seconds
-        self.exact_move_timestamp = None
-
-        # CRITICAL FIX: Add new variables to store the exact time values for each player
-        # These will be used to ensure the timer continues from where it left off
-        self.stored_white_time = time_control_seconds
-        self.stored_black_time = time_control_seconds
-        self.last_white_move_time = None
-        self.last_black_move_time = None
-
-        self.last_move_timestamp = None
+
+        # A single clock engine holds all time state; remaining times are computed on demand.
+        # Parsed time controls are shared by every game using the same specification
+        if time_control is None:
+            time_control = time_control_seconds
+        if not isinstance(time_control, TimeControl):
+            time_control = TimeControl.parse(time_control)
+        self.time_control = time_control
+        self.clock = ChessClock(time_control)
+
         self._timed_out_player = None
+        self._adjudicated_result = None  # Result agreed by both players (e.g. from a tablebase)
+
+        # Incremented on every change of the position or result, for snapshot caches
+        self.version = 0
 
         # Track if the last move was a capture and what piece was captured
         self.last_move_was_capture = False
         self.captured_piece = None
 
-        print(f"Game initialized with time control: {time_control_seconds}s")
+        # Legal moves of the current position, computed at most once per ply
+        self._legal_move_set = None  # Set of UCI strings for O(1) validation
+        self._legal_move_map = None  # Maps from-square -> list of destinations (with promotion suffix)
+
+        # Opening book tracking: once a game leaves the book it is never probed again
+        self.in_book = get_opening_book().contains(self.board)
+
+        # ECO opening classification, advanced incrementally on every move
+        self.opening_cursor = OpeningCursor(get_eco_table())
+
+        print(f"Game initialized with time control: {self.time_control.to_spec()}")
         print(f"Initial time values - White: {self.time_white:.1f}s, Black: {self.time_black:.1f}s")
-        print(f"Initial time_at_last_move values - White: {self.time_at_last_move_white:.1f}s, Black: {self.time_at_last_move_black:.1f}s")
-        print(f"Initial stored time values - White: {self.stored_white_time:.1f}s, Black: {self.stored_black_time:.1f}s")
+
+    @property
+    def time_white(self):
+        """White's remaining time in seconds, computed from the clock."""
+        return self.clock.display_time(chess.WHITE)
+
+    @property
+    def time_black(self):
+        """Black's remaining time in seconds, computed from the clock."""
+        return self.clock.display_time(chess.BLACK)
+
+    def start_clock(self):
+        """Start the clock of the side to move (called when the session starts)."""
+        self.clock.start(self.board.turn)
+
+    def stop_clock(self):
+        """Freeze both clocks (called when the game ends)."""
+        self.clock.stop()
 
     def assign_player(self, player_id, color_preference=None):
         """
@@ -61,10 +93,13 @@ class ChessGame:
         """Return chess.WHITE or chess.BLACK for the player_id."""
         return self.player_colors.get(player_id)
 
-    def make_move(self, uci_move_string, player_id):
+    def make_move(self, uci_move_string, player_id, charge_time=True, lag_compensation=0.0):
         """
         Makes a move if it's legal and the player's turn.
         Returns True if move is made, False otherwise.
+
+        If charge_time is False (premoves), no clock time is charged for the move.
+        lag_compensation is the mover's estimated network latency, which is not charged.
         """
         if self.is_game_over():
             print(f"Move rejected: Game is already over")
@@ -91,33 +126,12 @@ class ChessGame:
         # Store the current turn before making the move
         current_turn = self.board.turn
 
-        # Get the current time
-        current_time = asyncio.get_event_loop().time()
-
         try:
             # Parse and validate the move
-            move = chess.Move.from_uci(uci_move_string)
-            if move not in self.board.legal_moves:
+            if not self.is_legal_uci(uci_move_string):
                 print(f"Illegal move: {uci_move_string}")
                 return False
-
-            # Calculate and store the current player's time
-            if self.last_move_timestamp is not None:
-                # Calculate time taken for this move
-                time_taken = current_time - self.last_move_timestamp
-                print(f"Time taken for this move: {time_taken:.2f}s")
-
-                # Store the current time values before making the move
-                if current_turn == chess.WHITE:
-                    # Store white's current time
-                    self.time_at_last_move_white = self.time_white
-                    print(f"Stored white's time: {self.time_at_last_move_white:.2f}s")
-                else:
-                    # Store black's current time
-                    self.time_at_last_move_black = self.time_black
-                    print(f"Stored black's time: {self.time_at_last_move_black:.2f}s")
-            else:
-                print("First move of the game, no time taken")
+            move = chess.Move.from_uci(uci_move_string)
 
             # Check if this move is a capture
             is_capture = self.board.is_capture(move)
@@ -145,14 +159,18 @@ class ChessGame:
                 print(f"Capture detected! Piece captured: {captured_piece_type}")
 
             # Make the move
-            self.board.push(move)
+            self._push_move(move)
 
             # Store capture information
             self.last_move_was_capture = is_capture
             self.captured_piece = captured_piece_type
 
-            # Update the timestamp for the next move
-            self.last_move_timestamp = current_time
+            # Charge the mover's clock and start the opponent's
+            time_taken = self.clock.press(current_turn, charge_time=charge_time,
+                                          lag_compensation=lag_compensation)
+            print(f"Time taken for this move: {time_taken:.2f}s")
+            if self.board.is_game_over():
+                self.clock.stop()
 
             print(f"Move made: {uci_move_string}")
             print(f"Turn changed to: {self.get_turn_color_string()}")
@@ -165,6 +183,92 @@ class ChessGame:
             print(f"Invalid UCI move string: {uci_move_string}")
             return False
 
+    def _push_move(self, move):
+        """Play a validated move and advance the per-position caches and classifications."""
+        self.board.push(move)
+        self._legal_move_set = None
+        self._legal_move_map = None
+        self.version += 1
+
+        # Update opening book status (a single binary search while in book)
+        if self.in_book:
+            self.in_book = get_opening_book().contains(self.board)
+
+        # Advance the opening classification
+        self.opening_cursor.advance(self.board, move)
+
+    def replay_move(self, uci_move_string, clock_anchor=None):
+        """
+        Apply a move already validated and timed by another process (a replicated game).
+
+        Args:
+            uci_move_string: The move in UCI notation
+            clock_anchor: Clock state after the move (ChessClock.to_anchor()), if known
+        """
+        move = chess.Move.from_uci(uci_move_string)
+        self.last_move_was_capture = self.board.is_capture(move)
+        self.captured_piece = None
+        self._push_move(move)
+        if clock_anchor is not None:
+            self.clock.restore_anchor(clock_anchor)
+
+    def _compute_legal_moves(self):
+        """Generate the legal moves of the current position once and cache them."""
+        move_set = set()
+        move_map = {}
+        for move in self.board.legal_moves:
+            uci = move.uci()
+            move_set.add(uci)
+            move_map.setdefault(uci[:2], []).append(uci[2:])
+        self._legal_move_set = move_set
+        self._legal_move_map = move_map
+
+    def is_legal_uci(self, uci_move_string):
+        """
+        Check whether a UCI move is legal in the current position.
+
+        Args:
+            uci_move_string: The move in UCI notation (e.g. "e2e4", "e7e8q")
+
+        Returns:
+            bool: True if the move is legal
+        """
+        if self._legal_move_set is None:
+            self._compute_legal_moves()
+        return uci_move_string in self._legal_move_set
+
+    def get_legal_move_map(self):
+        """
+        Get the legal moves of the current position grouped by origin square.
+
+        Returns:
+            dict: Maps from-square (e.g. "e2") -> list of destinations (e.g. ["e3", "e4"]),
+                  promotions carry their piece suffix (e.g. "e8q")
+        """
+        if self._legal_move_map is None:
+            self._compute_legal_moves()
+        return self._legal_move_map
+
+    def get_book_move(self):
+        """
+        Get a weighted book move for the side to move.
+
+        Returns:
+            str or None: UCI move from the opening book, or None if out of book
+        """
+        if not self.in_book:
+            return None
+        return get_opening_book().pick_move(self.board)
+
+    def get_opening(self):
+        """
+        Get the opening reached so far.
+
+        Returns:
+            dict or None: {"eco": ..., "name": ...} or None if no known opening matched
+        """
+        return self.opening_cursor.get_opening()
+
     def get_board_fen(self):
         """Return the FEN string representing the board state."""
         return self.board.fen()
@@ -201,42 +305,28 @@ class ChessGame:
 
     # Time tracking is now handled in the timer loop in game_session.py
 
-    def check_timeout(self):
+    def check_timeout(self, grace_time=0.1):
         """
         Check if the current player has timed out.
         Returns the color of the timed out player or None.
 
-        Includes a small buffer (0.1s) to account for network latency and processing time.
+        Args:
+            grace_time: Seconds past zero to wait before flagging, so a move already
+                        in flight isn't lost (the player's measured latency when known)
         """
-        if self.board.is_game_over() or self.last_move_timestamp is None:
+        if self.is_game_over() or self.clock.running is None:
             return None
 
-        # Use a small buffer to avoid false timeouts due to network latency
-        buffer_time = 0.1  # 100ms buffer
-
         # Check if the current player's time has run out
-        if self.board.turn == chess.WHITE:
-            # Check white's time with buffer
-            if self.time_white <= -buffer_time:  # Allow a small negative buffer
-                self._timed_out_player = chess.WHITE
-                print(f"WHITE player has timed out! Final time: {self.time_white:.2f}s")
-                # Set time to exactly 0 for display purposes
-                self.time_white = 0
-                return self._timed_out_player
-            elif self.time_white <= 5:
-                # Log when time is getting low
-                print(f"WHITE player time is low: {self.time_white:.2f}s")
-        else:
-            # Check black's time with buffer
-            if self.time_black <= -buffer_time:  # Allow a small negative buffer
-                self._timed_out_player = chess.BLACK
-                print(f"BLACK player has timed out! Final time: {self.time_black:.2f}s")
-                # Set time to exactly 0 for display purposes
-                self.time_black = 0
-                return self._timed_out_player
-            elif self.time_black <= 5:
-                # Log when time is getting low
-                print(f"BLACK player time is low: {self.time_black:.2f}s")
+        color = self.board.turn
+        remaining = self.clock.remaining_time(color)
+        if remaining <= -grace_time:  # Allow for the move still being in transit
+            self._timed_out_player = color
+            self.version += 1
+            # Show exactly 0 for the flagged side
+            self.clock.flag(color)
+            print(f"{'WHITE' if color == chess.WHITE else 'BLACK'} player has timed out! Final time: {remaining:.2f}s")
+            return self._timed_out_player
 
         return None
 
@@ -245,6 +335,10 @@ class ChessGame:
         Return the game result as a dictionary.
         Returns None if the game is not over.
         """
+        # An adjudicated result overrides the board state
+        if self._adjudicated_result is not None:
+            return self._adjudicated_result
+
         # Check for timeout first
         if self._timed_out_player is not None:
             # CRITICAL FIX: Check for insufficient material when timeout occurs
@@ -318,9 +412,22 @@ class ChessGame:
         # Otherwise, it's sufficient material
         return False
 
+    def adjudicate(self, result):
+        """
+        End the game with an externally decided result.
+
+        Args:
+            result: Result dictionary in the same format as get_game_result()
+        """
+        self._adjudicated_result = result
+        self.version += 1
+        self.clock.stop()
+        print(f"Game adjudicated: {result}")
+
     def is_game_over(self):
         """Return True if the game is over for any reason."""
-        return self.board.is_game_over() or self._timed_out_player is not None
+        return self.board.is_game_over() or self._timed_out_player is not None or \
+            self._adjudicated_result is not None
 
     def reset_game(self):
         """Reset the game to its initial state."""
@@ -328,33 +435,26 @@ class ChessGame:
         self.players = {'white': None, 'black': None}
         self.player_colors = {}
 
-        # Reset all time variables to the initial time control value
-        # This ensures all time values are consistent at the start of the game
-        initial_time = self.time_control_seconds
-        self.time_white = initial_time
-        self.time_black = initial_time
-        self.time_at_last_move_white = initial_time
-        self.time_at_last_move_black = initial_time
-
-        # IMPORTANT FIX: Reset the exact time tracking variables
-        self.exact_time_white_at_move = initial_time
-        self.exact_time_black_at_move = initial_time
-        self.exact_move_timestamp = None
-
-        # CRITICAL FIX: Reset the stored time values
-        self.stored_white_time = initial_time
-        self.stored_black_time = initial_time
-        self.last_white_move_time = None
-        self.last_black_move_time = None
-
-        self.last_move_timestamp = None
+        # Reset the clock to the initial time control
+        self.clock = ChessClock(self.time_control)
+
         self._timed_out_player = None
+        self._adjudicated_result = None
+        self.version += 1
 
         # Reset capture tracking
         self.last_move_was_capture = False
         self.captured_piece = None
 
-        print(f"Game reset with time control: {initial_time}s")
+        # Reset the legal move cache
+        self._legal_move_set = None
+        self._legal_move_map = None
+
+        # Reset opening book tracking
+        self.in_book = get_opening_book().contains(self.board)
+
+        # Reset opening classification
+        self.opening_cursor = OpeningCursor(get_eco_table())
+
+        print(f"Game reset with time control: {self.time_control.to_spec()}")
         print(f"Initial time values - White: {self.time_white:.1f}s, Black: {self.time_black:.1f}s")
-        print(f"Initial time_at_last_move values - White: {self.time_at_last_move_white:.1f}s, Black: {self.time_at_last_move_black:.1f}s")
-        print(f"Initial stored time values - White: {self.stored_white_time:.1f}s, Black: {self.stored_black_time:.1f}s")
\ No newline at end of file
@@ -0,0 +1,275 @@
+# server/clock.py
+import time
+import chess
+
+
+class ClockStage:
+    """One stage of a time control, e.g. "40 moves in 90 minutes, +30s per move"."""
+
+    __slots__ = ("base_seconds", "moves", "increment", "delay")
+
+    def __init__(self, base_seconds, moves=None, increment=0.0, delay=0.0):
+        """
+        Initialize a stage.
+
+        Args:
+            base_seconds: Time added to the clock when the stage starts
+            moves: Number of moves in this stage (None for the last, sudden-death stage)
+            increment: Fischer increment added after every move
+            delay: Bronstein delay, up to this much of the time used is given back after every move
+        """
+        self.base_seconds = float(base_seconds)
+        self.moves = moves
+        self.increment = float(increment)
+        self.delay = float(delay)
+
+    def to_spec(self):
+        """Return the stage in the TimeControl.parse() format."""
+        spec = f"{self.base_seconds:g}"
+        if self.moves:
+            spec = f"{self.moves}/{spec}"
+        if self.increment:
+            spec += f"+{self.increment:g}"
+        if self.delay:
+            spec += f"d{self.delay:g}"
+        return spec
+
+
+class TimeControl:
+    """
+    A sequence of clock stages; the last stage lasts until the end of the game.
+
+    Time controls are immutable, so parse() hands out one shared instance per
+    specification.
+    """
+
+    __slots__ = ("stages",)
+
+    # Parsed time controls, by specification string
+    _parsed = {}
+
+    def __init__(self, stages):
+        """
+        Initialize the time control.
+
+        Args:
+            stages: Non-empty sequence of ClockStage
+        """
+        if not stages:
+            raise ValueError("A time control needs at least one stage")
+        self.stages = tuple(stages)
+
+    @classmethod
+    def parse(cls, spec):
+        """
+        Parse a time control specification.
+
+        Stages are separated by ':' and each stage is "[moves/]base[+increment][d<delay>]",
+        all times in seconds. Examples: "300", "180+2", "300d3", "40/5400+30:1800+30".
+
+        Args:
+            spec: The specification string (or a number of seconds)
+
+        Returns:
+            TimeControl: The parsed time control (shared with other games using the same spec)
+        """
+        spec = str(spec)
+        time_control = cls._parsed.get(spec)
+        if time_control is not None:
+            return time_control
+
+        stages = []
+        for stage_spec in spec.split(":"):
+            moves = None
+            delay = 0.0
+            increment = 0.0
+
+            if "/" in stage_spec:
+                moves_part, stage_spec = stage_spec.split("/", 1)
+                moves = int(moves_part)
+            if "d" in stage_spec:
+                stage_spec, delay_part = stage_spec.split("d", 1)
+                delay = float(delay_part)
+            if "+" in stage_spec:
+                stage_spec, increment_part = stage_spec.split("+", 1)
+                increment = float(increment_part)
+
+            stages.append(ClockStage(float(stage_spec), moves, increment, delay))
+        time_control = cls._parsed[spec] = cls(stages)
+        return time_control
+
+    def to_spec(self):
+        """Return the time control in the parse() format."""
+        return ":".join(stage.to_spec() for stage in self.stages)
+
+
+class ChessClock:
+    """
+    Two-sided game clock driven by move timestamps.
+
+    Each side has a single anchor: its remaining time when its turn started.
+    Remaining time is computed on demand from the monotonic clock, so nothing
+    needs to tick it down. Per-side state is kept in two-item lists indexed by
+    color (chess.BLACK is 0, chess.WHITE is 1).
+    """
+
+    __slots__ = ("time_control", "now_fn", "remaining", "stage_index", "moves_in_stage", "running", "turn_started")
+
+    def __init__(self, time_control, now_fn=time.monotonic):
+        """
+        Initialize the clock. Neither side's clock runs until start() is called.
+
+        Args:
+            time_control: TimeControl for the game
+            now_fn: Monotonic time source (the event loop's clock uses time.monotonic)
+        """
+        self.time_control = time_control
+        self.now_fn = now_fn
+        first_stage = time_control.stages[0]
+        self.remaining = [first_stage.base_seconds, first_stage.base_seconds]
+        self.stage_index = [0, 0]
+        self.moves_in_stage = [0, 0]
+        self.running = None      # Color whose clock is running, or None
+        self.turn_started = None  # Timestamp at which the running side's turn started
+
+    def start(self, color, now=None):
+        """
+        Start a side's clock.
+
+        Args:
+            color: chess.WHITE or chess.BLACK
+            now: Start timestamp (defaults to now_fn())
+        """
+        self.running = color
+        self.turn_started = self.now_fn() if now is None else now
+
+    def elapsed(self, now=None):
+        """
+        Get the time used so far in the current turn.
+
+        Args:
+            now: Timestamp to compute at (defaults to now_fn())
+
+        Returns:
+            float: Seconds since the running side's turn started (0 if stopped)
+        """
+        if self.running is None:
+            return 0.0
+        now = self.now_fn() if now is None else now
+        return max(0.0, now - self.turn_started)
+
+    def remaining_time(self, color, now=None):
+        """
+        Get a side's remaining time.
+
+        Args:
+            color: chess.WHITE or chess.BLACK
+            now: Timestamp to compute at (defaults to now_fn())
+
+        Returns:
+            float: Remaining seconds (may be negative once the side has flagged)
+        """
+        if color != self.running:
+            return self.remaining[color]
+        return self.remaining[color] - self.elapsed(now)
+
+    def press(self, color, now=None, charge_time=True, lag_compensation=0.0):
+        """
+        End a side's turn: charge the time used, apply increment/delay and start the opponent's clock.
+
+        Args:
+            color: The side that just moved
+            now: Timestamp of the move (defaults to now_fn())
+            charge_time: If False (premoves), no time is charged for this turn
+            lag_compensation: Estimated network transit time of the move, not charged to the mover
+
+        Returns:
+            float: Seconds charged for the move
+        """
+        now = self.now_fn() if now is None else now
+        used = 0.0
+        if charge_time and self.running == color:
+            used = max(0.0, self.elapsed(now) - lag_compensation)
+
+        stage = self.time_control.stages[self.stage_index[color]]
+        self.remaining[color] -= used
+        self.remaining[color] += stage.increment + min(used, stage.delay)
+
+        # Move on to the next stage once this one's move quota is reached
+        self.moves_in_stage[color] += 1
+        if stage.moves and self.moves_in_stage[color] >= stage.moves and \
+                self.stage_index[color] + 1 < len(self.time_control.stages):
+            self.stage_index[color] += 1
+            self.moves_in_stage[color] = 0
+            self.remaining[color] += self.time_control.stages[self.stage_index[color]].base_seconds
+
+        self.start(not color, now)
+        return used
+
+    def stop(self, now=None):
+        """
+        Stop the clock, freezing both sides' remaining time.
+
+        Args:
+            now: Timestamp to stop at (defaults to now_fn())
+        """
+        if self.running is not None:
+            self.remaining[self.running] = self.remaining_time(self.running, now)
+            self.running = None
+            self.turn_started = None
+
+    def flag(self, color):
+        """
+        Stop the clock after a side ran out of time, showing exactly 0 for that side.
+
+        Args:
+            color: The side that ran out of time
+        """
+        self.stop()
+        self.remaining[color] = 0.0
+
+    def display_time(self, color, now=None):
+        """Return a side's remaining time clamped at 0, for sending to clients."""
+        return max(0.0, self.remaining_time(color, now))
+
+    def to_anchor(self, now=None):
+        """
+        Export the clock's state, independent of this process's time source.
+
+        Args:
+            now: Timestamp to export at (defaults to now_fn())
+
+        Returns:
+            dict: Remaining time, stage and moves in stage per side (white first), the
+                running side and the time it has used so far in its turn
+        """
+        running = None
+        if self.running is not None:
+            running = "white" if self.running == chess.WHITE else "black"
+        return {
+            "remaining": [self.remaining[chess.WHITE], self.remaining[chess.BLACK]],
+            "stage": [self.stage_index[chess.WHITE], self.stage_index[chess.BLACK]],
+            "moves": [self.moves_in_stage[chess.WHITE], self.moves_in_stage[chess.BLACK]],
+            "running": running,
+            "elapsed": self.elapsed(now)
+        }
+
+    def restore_anchor(self, anchor, now=None):
+        """
+        Set the clock to a state exported with to_anchor().
+
+        Args:
+            anchor: The exported state
+            now: Timestamp the anchor's elapsed time is counted back from (defaults to now_fn())
+        """
+        now = self.now_fn() if now is None else now
+        for index, color in enumerate((chess.WHITE, chess.BLACK)):
+            self.remaining[color] = anchor["remaining"][index]
+            self.stage_index[color] = anchor["stage"][index]
+            self.moves_in_stage[color] = anchor["moves"][index]
+        if anchor["running"] is None:
+            self.running = None
+            self.turn_started = None
+        else:
+            self.running = chess.WHITE if anchor["running"] == "white" else chess.BLACK
+            self.turn_started = now - anchor["elapsed"]
@@ -0,0 +1,317 @@
+# server/codec.py
+import json
+import struct
+from collections import Counter
+from config import JSON_ENCODER, BINARY_FRAMES_ENABLED
+
+# WebSocket subprotocols naming the wire format of a connection. Connections that
+# don't ask for one (or ask for JSON) get JSON text frames.
+JSON_SUBPROTOCOL = "chess.json"
+MSGPACK_SUBPROTOCOL = "chess.msgpack"
+
+# Frames encoded by codec name (for the stats endpoint)
+ENCODE_STATS = Counter()
+
+
+def _stdlib_dumps(message):
+    return json.dumps(message, separators=(",", ":"))
+
+
+def _load_json_encoder(name):
+    """
+    Pick the JSON encoder for text frames.
+
+    Args:
+        name: "auto", "orjson", "ujson" or "json" (standard library)
+
+    Returns:
+        tuple: (encoder name, function encoding a message to a str)
+    """
+    if name in ("auto", "orjson"):
+        try:
+            import orjson
+        except ImportError:
+            pass
+        else:
+            options = orjson.OPT_NON_STR_KEYS
+
+            def orjson_dumps(message):
+                try:
+                    return orjson.dumps(message, option=options).decode()
+                except TypeError:
+                    # orjson is stricter than json about a few types (e.g. int subclasses)
+                    return _stdlib_dumps(message)
+            return "orjson", orjson_dumps
+    if name in ("auto", "ujson"):
+        try:
+            import ujson
+        except ImportError:
+            pass
+        else:
+            def ujson_dumps(message):
+                return ujson.dumps(message, ensure_ascii=False, escape_forward_slashes=False)
+            return "ujson", ujson_dumps
+    if name not in ("auto", "json"):
+        print(f"JSON encoder {name} is not available, using the standard library")
+    return "json", _stdlib_dumps
+
+
+JSON_ENCODER_NAME, encode_json = _load_json_encoder(JSON_ENCODER)
+
+# Start of every game_update text frame (messages put their type first)
+GAME_UPDATE_PREFIX = encode_json({"type": "game_update"})[:-1]
+
+
+def _pack(obj, out):
+    """Append the MessagePack encoding of obj to out (list of bytes)."""
+    if obj is None:
+        out.append(b"\xc0")
+    elif obj is True:
+        out.append(b"\xc3")
+    elif obj is False:
+        out.append(b"\xc2")
+    elif isinstance(obj, str):
+        data = obj.encode()
+        size = len(data)
+        if size < 32:
+            out.append(bytes((0xa0 | size,)))
+        elif size <= 0xff:
+            out.append(struct.pack(">BB", 0xd9, size))
+        elif size <= 0xffff:
+            out.append(struct.pack(">BH", 0xda, size))
+        else:
+            out.append(struct.pack(">BI", 0xdb, size))
+        out.append(data)
+    elif isinstance(obj, int):
+        if 0 <= obj < 0x80:
+            out.append(bytes((obj,)))
+        elif -32 <= obj < 0:
+            out.append(struct.pack(">b", obj))
+        elif obj >= 0:
+            if obj <= 0xff:
+                out.append(struct.pack(">BB", 0xcc, obj))
+            elif obj <= 0xffff:
+                out.append(struct.pack(">BH", 0xcd, obj))
+            elif obj <= 0xffffffff:
+                out.append(struct.pack(">BI", 0xce, obj))
+            else:
+                out.append(struct.pack(">BQ", 0xcf, obj))
+        elif obj >= -0x80:
+            out.append(struct.pack(">Bb", 0xd0, obj))
+        elif obj >= -0x8000:
+            out.append(struct.pack(">Bh", 0xd1, obj))
+        elif obj >= -0x80000000:
+            out.append(struct.pack(">Bi", 0xd2, obj))
+        else:
+            out.append(struct.pack(">Bq", 0xd3, obj))
+    elif isinstance(obj, float):
+        out.append(struct.pack(">Bd", 0xcb, obj))
+    elif isinstance(obj, dict):
+        size = len(obj)
+        if size < 16:
+            out.append(bytes((0x80 | size,)))
+        elif size <= 0xffff:
+            out.append(struct.pack(">BH", 0xde, size))
+        else:
+            out.append(struct.pack(">BI", 0xdf, size))
+        for key, value in obj.items():
+            # Keys become strings, as in JSON
+            _pack(key if isinstance(key, str) else json.dumps(key), out)
+            _pack(value, out)
+    elif isinstance(obj, (list, tuple)):
+        size = len(obj)
+        if size < 16:
+            out.append(bytes((0x90 | size,)))
+        elif size <= 0xffff:
+            out.append(struct.pack(">BH", 0xdc, size))
+        else:
+            out.append(struct.pack(">BI", 0xdd, size))
+        for item in obj:
+            _pack(item, out)
+    elif isinstance(obj, (bytes, bytearray)):
+        size = len(obj)
+        if size <= 0xff:
+            out.append(struct.pack(">BB", 0xc4, size))
+        elif size <= 0xffff:
+            out.append(struct.pack(">BH", 0xc5, size))
+        else:
+            out.append(struct.pack(">BI", 0xc6, size))
+        out.append(bytes(obj))
+    else:
+        raise TypeError(f"Object of type {type(obj).__name__} is not MessagePack serializable")
+
+
+def _builtin_packb(message):
+    out = []
+    _pack(message, out)
+    return b"".join(out)
+
+
+try:
+    import msgpack
+except ImportError:
+    MSGPACK_ENCODER_NAME, _packb = "builtin", _builtin_packb
+else:
+    MSGPACK_ENCODER_NAME = "msgpack"
+
+    def _packb(message):
+        return msgpack.packb(message, use_bin_type=True)
+
+
+class JsonCodec:
+    """JSON text frames (the default wire format)."""
+
+    name = "json"
+    binary = False
+
+    def encode(self, message):
+        """
+        Encode a message.
+
+        Args:
+            message: The message dictionary
+
+        Returns:
+            str: The text frame
+        """
+        ENCODE_STATS[self.name] += 1
+        return encode_json(message)
+
+
+class MessagePackCodec:
+    """
+    MessagePack binary frames, for clients that ask for MSGPACK_SUBPROTOCOL.
+
+    Messages have the same structure as in JSON; game_update frames come out
+    about a quarter smaller. The msgpack package is used when installed; the
+    built-in encoder is slower than JSON, but broadcast frames are encoded once
+    per codec, not per recipient.
+    """
+
+    name = "msgpack"
+    binary = True
+
+    def encode(self, message):
+        """
+        Encode a message.
+
+        Args:
+            message: The message dictionary
+
+        Returns:
+            bytes: The binary frame
+        """
+        ENCODE_STATS[self.name] += 1
+        return _packb(message)
+
+
+JSON_CODEC = JsonCodec()
+MSGPACK_CODEC = MessagePackCodec()
+
+# Maps negotiated subprotocol -> codec
+_CODECS = {JSON_SUBPROTOCOL: JSON_CODEC, MSGPACK_SUBPROTOCOL: MSGPACK_CODEC}
+
+# Subprotocols the server accepts, preferred first
+SUBPROTOCOLS = (MSGPACK_SUBPROTOCOL, JSON_SUBPROTOCOL) if BINARY_FRAMES_ENABLED else (JSON_SUBPROTOCOL,)
+
+
+def select_subprotocol(connection, subprotocols):
+    """
+    `select_subprotocol` hook for websockets.serve(): pick the connection's wire format.
+
+    Unlike the websockets default, clients that offer no subprotocol are
+    accepted (with JSON frames).
+
+    Args:
+        connection: The ServerConnection being opened
+        subprotocols: Subprotocols offered by the client
+
+    Returns:
+        str or None: The selected subprotocol
+    """
+    for subprotocol in SUBPROTOCOLS:
+        if subprotocol in subprotocols:
+            return subprotocol
+    return None
+
+
+def get_codec(websocket):
+    """
+    Get the codec negotiated for a connection.
+
+    Args:
+        websocket: The WebSocket connection
+
+    Returns:
+        JsonCodec or MessagePackCodec: The connection's codec
+    """
+    return _CODECS.get(websocket.subprotocol, JSON_CODEC)
+
+
+async def send_message(websocket, message):
+    """
+    Encode a message in the connection's wire format and send it.
+
+    Args:
+        websocket: The WebSocket connection
+        message: The message dictionary
+    """
+    await websocket.send(get_codec(websocket).encode(message))
+
+
+class Frame:
+    """
+    A message sent to several connections, encoded at most once per codec.
+
+    A frame is built from the message or from its JSON text (frames that went
+    through the message bus or were kept for later, e.g. delayed spectator
+    updates); the JSON text is decoded again only if a binary connection needs it.
+    """
+
+    __slots__ = ("_message", "_text", "_binary")
+
+    def __init__(self, message=None, text=None):
+        """
+        Initialize the frame.
+
+        Args:
+            message: The message dictionary
+            text: The message's JSON text, if already encoded
+        """
+        self._message = message
+        self._text = text
+        self._binary = None
+
+    @property
+    def text(self):
+        """The JSON text of the message (what goes over the message bus)."""
+        if self._text is None:
+            self._text = JSON_CODEC.encode(self._message)
+        return self._text
+
+    def for_connection(self, websocket):
+        """
+        Get the frame in a connection's wire format.
+
+        Args:
+            websocket: The WebSocket connection
+
+        Returns:
+            str or bytes: The encoded frame
+        """
+        if websocket.subprotocol != MSGPACK_SUBPROTOCOL:
+            return self.text
+        if self._binary is None:
+            if self._message is None:
+                self._message = json.loads(self._text)
+            self._binary = MSGPACK_CODEC.encode(self._message)
+        return self._binary
+
+
+def get_stats():
+    """Return the encoders in use and frame counts for the stats endpoint."""
+    return {
+        "json_encoder": JSON_ENCODER_NAME,
+        "msgpack_encoder": MSGPACK_ENCODER_NAME if BINARY_FRAMES_ENABLED else None,
+        "encoded": dict(ENCODE_STATS)
+    }
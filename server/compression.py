@@ -0,0 +1,265 @@
+# server/compression.py
+import time
+from collections import Counter
+from websockets.protocol import State
+from websockets.frames import Opcode, CTRL_OPCODES
+from websockets.extensions.permessage_deflate import PerMessageDeflate, ServerPerMessageDeflateFactory
+from config import COMPRESSION_PROFILE, COMPRESSION_MIN_SIZE, COMPRESSION_MEMORY_BUDGET_MB, MAX_MESSAGE_SIZE, \
+    MAX_QUEUE
+
+# zlib bookkeeping on top of the window and hash tables (bytes, rounded up)
+DEFLATE_OVERHEAD = 6 * 1024
+INFLATE_OVERHEAD = 7 * 1024
+
+# Bytes and CPU time of compressed and uncompressed frames, across all connections
+COMPRESSION_STATS = Counter()
+
+
+class CompressionProfile:
+    """
+    permessage-deflate settings offered to a connection.
+
+    With context takeover, each connection keeps a compressor and a decompressor
+    for its whole lifetime (better ratios on the similar frames of a game);
+    without it, they only exist while a message is being compressed.
+    """
+
+    __slots__ = ("name", "window_bits", "context_takeover", "mem_level")
+
+    def __init__(self, name, window_bits, context_takeover, mem_level):
+        """
+        Initialize the profile.
+
+        Args:
+            name: Profile name
+            window_bits: LZ77 window of both sides, in bits (9 to 15)
+            context_takeover: Keep the compression context between messages
+            mem_level: zlib memLevel of the server's compressor (1 to 9)
+        """
+        self.name = name
+        self.window_bits = window_bits
+        self.context_takeover = context_takeover
+        self.mem_level = mem_level
+
+    def memory_estimate(self):
+        """
+        Estimate the compression state a connection holds between messages.
+
+        Returns:
+            int: Bytes (0 without context takeover)
+        """
+        if not self.context_takeover:
+            return 0
+        deflate = (1 << (self.window_bits + 2)) + (1 << (self.mem_level + 9)) + DEFLATE_OVERHEAD
+        inflate = (1 << self.window_bits) + INFLATE_OVERHEAD
+        return deflate + inflate
+
+    def extension_factory(self):
+        """Build the server's permessage-deflate offer for this profile."""
+        return MeteredDeflateFactory(
+            server_no_context_takeover=not self.context_takeover,
+            client_no_context_takeover=not self.context_takeover,
+            server_max_window_bits=self.window_bits,
+            client_max_window_bits=self.window_bits,
+            compress_settings={"memLevel": self.mem_level},
+            # Without it the client's window (and our decompressor) could be 32 KB
+            require_client_max_window_bits=True
+        )
+
+
+# Profiles from the most to the least memory per connection ("off" negotiates no compression)
+PROFILES = [
+    CompressionProfile("max", 15, True, 8),
+    CompressionProfile("balanced", 12, True, 5),
+    CompressionProfile("low_memory", 10, False, 4),
+]
+PROFILE_NAMES = [profile.name for profile in PROFILES] + ["off"]
+
+
+class MeteredPerMessageDeflate(PerMessageDeflate):
+    """
+    permessage-deflate that leaves small frames uncompressed and meters the rest.
+
+    Frames under COMPRESSION_MIN_SIZE (most game updates) gain little and would
+    cost a compressor pass per recipient, so they go out as is (RFC 7692 lets
+    any message be sent uncompressed).
+    """
+
+    def encode(self, frame):
+        if frame.opcode in CTRL_OPCODES:
+            return frame
+        size = len(frame.data)
+        if frame.fin and frame.opcode is not Opcode.CONT and size < COMPRESSION_MIN_SIZE:
+            COMPRESSION_STATS["frames_uncompressed"] += 1
+            COMPRESSION_STATS["bytes_uncompressed"] += size
+            return frame
+        started = time.perf_counter()
+        encoded = super().encode(frame)
+        COMPRESSION_STATS["compress_seconds"] += time.perf_counter() - started
+        COMPRESSION_STATS["frames_compressed"] += 1
+        COMPRESSION_STATS["bytes_before"] += size
+        COMPRESSION_STATS["bytes_after"] += len(encoded.data)
+        return encoded
+
+    def decode(self, frame, *, max_size=None):
+        if frame.opcode in CTRL_OPCODES or not (frame.rsv1 or self.decode_cont_data):
+            return frame
+        started = time.perf_counter()
+        decoded = super().decode(frame, max_size=max_size)
+        COMPRESSION_STATS["decompress_seconds"] += time.perf_counter() - started
+        COMPRESSION_STATS["bytes_received_compressed"] += len(frame.data)
+        COMPRESSION_STATS["bytes_received_inflated"] += len(decoded.data)
+        return decoded
+
+
+class MeteredDeflateFactory(ServerPerMessageDeflateFactory):
+    """Server permessage-deflate factory creating MeteredPerMessageDeflate extensions."""
+
+    def process_request_params(self, params, accepted_extensions):
+        response_params, extension = super().process_request_params(params, accepted_extensions)
+        return response_params, MeteredPerMessageDeflate(
+            extension.remote_no_context_takeover,
+            extension.local_no_context_takeover,
+            extension.remote_max_window_bits,
+            extension.local_max_window_bits,
+            extension.compress_settings
+        )
+
+
+class ConnectionProfiles:
+    """
+    Assigns each WebSocket connection a compression profile within the worker's memory budget.
+
+    Connections get the configured profile while the estimated compression
+    state of all connections stays within COMPRESSION_MEMORY_BUDGET_MB, and the
+    next cheaper profile that fits otherwise ("low_memory" keeps no state
+    between messages, so it always fits). The receive buffer of every
+    connection is bounded separately by MAX_MESSAGE_SIZE and MAX_QUEUE.
+    """
+
+    def __init__(self, profile=COMPRESSION_PROFILE, budget_mb=COMPRESSION_MEMORY_BUDGET_MB):
+        """
+        Initialize the profiles.
+
+        Args:
+            profile: Name of the preferred profile
+            budget_mb: Memory budget of the compression state (MB, 0 for no limit)
+        """
+        if profile not in PROFILE_NAMES:
+            print(f"Unknown compression profile {profile}, using balanced")
+            profile = "balanced"
+        self.preferred = profile
+        self.budget = int(budget_mb * 1024 * 1024)
+        self.reserved = {}         # Maps connection -> (profile name, estimated bytes)
+        self.used = 0              # Estimated bytes of compression state held
+        self.assigned = Counter()  # Connections by profile
+        self.downgraded = 0        # Connections given a cheaper profile to stay within the budget
+        # One extension factory per profile, shared by its connections
+        self._factories = {profile.name: [profile.extension_factory()] for profile in PROFILES}
+        self._profiles = {profile.name: profile for profile in PROFILES}
+
+    def assign(self, connection):
+        """
+        Choose the profile of a connection before its handshake.
+
+        Args:
+            connection: The ServerConnection being opened
+
+        Returns:
+            str: Name of the assigned profile
+        """
+        self._sweep()
+        name = "off"
+        if self.preferred != "off":
+            candidates = PROFILE_NAMES[PROFILE_NAMES.index(self.preferred):-1]
+            for candidate in candidates:
+                cost = self._profiles[candidate].memory_estimate()
+                if self.budget <= 0 or self.used + cost <= self.budget:
+                    name = candidate
+                    break
+
+        connection.protocol.available_extensions = self._factories.get(name, [])
+        cost = self._profiles[name].memory_estimate() if name != "off" else 0
+        self.reserved[connection] = (name, cost)
+        self.used += cost
+        self.assigned[name] += 1
+        return name
+
+    def connected(self, connection):
+        """
+        Note a completed handshake: release the reservation if the client declined compression.
+
+        Args:
+            connection: The opened ServerConnection
+
+        Returns:
+            str: The profile in effect ("off" without compression)
+        """
+        name, cost = self.reserved.get(connection, ("off", 0))
+        if name == "off":
+            return name
+        if not connection.protocol.extensions:
+            self.used -= cost
+            self.reserved[connection] = ("off", 0)
+            self.assigned[name] -= 1
+            self.assigned["off"] += 1
+            return "off"
+        if name != self.preferred:
+            self.downgraded += 1
+        return name
+
+    def release(self, connection):
+        """
+        Forget a closed connection.
+
+        Args:
+            connection: The ServerConnection
+        """
+        entry = self.reserved.pop(connection, None)
+        if entry is not None:
+            name, cost = entry
+            self.used -= cost
+            self.assigned[name] -= 1
+
+    def _sweep(self):
+        """Release connections whose handshake failed (the handler never ran for them)."""
+        for connection in [connection for connection in self.reserved if connection.state is State.CLOSED]:
+            self.release(connection)
+
+    def get_stats(self):
+        """Return the profile usage and the bandwidth saved versus the CPU spent, for the stats endpoint."""
+        before = COMPRESSION_STATS["bytes_before"]
+        after = COMPRESSION_STATS["bytes_after"]
+        return {
+            "preferred": self.preferred,
+            "connections": {name: count for name, count in self.assigned.items() if count},
+            "downgraded": self.downgraded,
+            "memory_budget_bytes": self.budget,
+            "memory_estimate_bytes": self.used,
+            "receive_buffer_bound_bytes": MAX_MESSAGE_SIZE * MAX_QUEUE * len(self.reserved),
+            "frames_compressed": COMPRESSION_STATS["frames_compressed"],
+            "frames_uncompressed": COMPRESSION_STATS["frames_uncompressed"],
+            "bytes_saved": before - after,
+            "ratio": round(after / before, 3) if before else None,
+            "compress_ms": round(COMPRESSION_STATS["compress_seconds"] * 1000, 1),
+            "decompress_ms": round(COMPRESSION_STATS["decompress_seconds"] * 1000, 1),
+            "bytes_received_saved": COMPRESSION_STATS["bytes_received_inflated"] -
+                                    COMPRESSION_STATS["bytes_received_compressed"]
+        }
+
+
+# Connection profiles of this process
+_connection_profiles = None
+
+
+def get_connection_profiles():
+    """
+    Get the process-wide connection profiles.
+
+    Returns:
+        ConnectionProfiles: The shared instance
+    """
+    global _connection_profiles
+    if _connection_profiles is None:
+        _connection_profiles = ConnectionProfiles()
+    return _connection_profiles
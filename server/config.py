@@ -0,0 +1,143 @@
+# server/config.py
+import os
+import tempfile
+
+# Directory holding optional data files (opening book, ECO table, ...)
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+
+# Polyglot opening book used for book-move lookups.
+# The file is only memory-mapped on the first lookup, so startup cost does not
+# depend on the size of the book (and a missing book simply disables lookups).
+OPENING_BOOK_PATH = os.environ.get("CHESS_OPENING_BOOK", os.path.join(DATA_DIR, "book.bin"))
+
+# ECO opening table (eco, name, pgn columns) used to label games with their opening
+ECO_TABLE_PATH = os.environ.get("CHESS_ECO_TABLE", os.path.join(DATA_DIR, "eco.tsv"))
+
+# Optional Syzygy tablebase directory (.rtbw/.rtbz files) for endgame adjudication
+SYZYGY_PATH = os.environ.get("CHESS_SYZYGY_PATH", os.path.join(DATA_DIR, "syzygy"))
+
+# Include the from-square -> destinations legal move map in updates sent to the side to move
+SEND_LEGAL_MOVE_HINTS = os.environ.get("CHESS_LEGAL_MOVE_HINTS", "1") == "1"
+
+# Default time control for new games, e.g. "300", "180+2", "300d3" or "40/5400+30:1800+30"
+DEFAULT_TIME_CONTROL = os.environ.get("CHESS_TIME_CONTROL", "300")
+
+# Seconds between clock-sync pings on a connection (piggybacked on client traffic)
+CLOCK_SYNC_INTERVAL = float(os.environ.get("CHESS_CLOCK_SYNC_INTERVAL", "10"))
+
+# Upper bound (seconds) on the lag credited back to a player per move and on the flag grace
+MAX_LAG_COMPENSATION = float(os.environ.get("CHESS_MAX_LAG_COMPENSATION", "0.5"))
+
+# Chat messages kept per game room, and how many of them are backfilled to late joiners
+CHAT_HISTORY_SIZE = int(os.environ.get("CHESS_CHAT_HISTORY_SIZE", "100"))
+CHAT_BACKFILL_SIZE = int(os.environ.get("CHESS_CHAT_BACKFILL_SIZE", "50"))
+
+# Per-connection rate limits as (messages per second, burst) by message type.
+# Types not listed share the "default" bucket; pongs answering server pings are never limited.
+RATE_LIMIT_ENABLED = os.environ.get("CHESS_RATE_LIMIT", "1") == "1"
+RATE_LIMITS = {
+    "chat_message": (1.0, 5),
+    "request_game_state": (2.0, 4),
+    "list_games": (1.0, 3),
+    "make_move": (10.0, 20),
+    "default": (20.0, 40),
+}
+
+# Largest inbound WebSocket message (bytes), and the limits of individual message types (types not
+# listed get "default"); larger messages are rejected before they are handled
+MAX_MESSAGE_SIZE = int(os.environ.get("CHESS_MAX_MESSAGE_SIZE", "65536"))
+MESSAGE_SIZE_LIMITS = {
+    "make_move": 256,
+    "pong": 256,
+    "chat_message": 8192,
+    "tv_subscribe": 16384,
+    "get_thumbnails": 16384,
+    "default": 4096,
+}
+# Incoming frames a connection buffers before reading pauses (bounds its receive buffer to
+# MAX_QUEUE * MAX_MESSAGE_SIZE)
+MAX_QUEUE = int(os.environ.get("CHESS_MAX_QUEUE", "4"))
+
+# Per-connection compression (see compression.py): profile offered to clients ("off", "low_memory",
+# "balanced" or "max"), smallest frame worth compressing (bytes), and the memory budget (MB) of the
+# compression state of a worker's connections; beyond it, new connections get cheaper profiles
+COMPRESSION_PROFILE = os.environ.get("CHESS_COMPRESSION", "balanced")
+COMPRESSION_MIN_SIZE = int(os.environ.get("CHESS_COMPRESSION_MIN_SIZE", "512"))
+COMPRESSION_MEMORY_BUDGET_MB = float(os.environ.get("CHESS_COMPRESSION_BUDGET_MB", "256"))
+
+# Spectator delay for games (0 disables): spectators see updates only once they are this
+# many seconds old and/or the live game is this many plies ahead
+SPECTATOR_DELAY_SECONDS = float(os.environ.get("CHESS_SPECTATOR_DELAY", "0"))
+SPECTATOR_DELAY_PLIES = int(os.environ.get("CHESS_SPECTATOR_DELAY_PLIES", "0"))
+
+# TV channel: seconds between batched frames and maximum number of games per viewer
+TV_TICK_SECONDS = float(os.environ.get("CHESS_TV_TICK", "0.5"))
+TV_MAX_GAMES = int(os.environ.get("CHESS_TV_MAX_GAMES", "16"))
+
+# Number of featured games highlighted in the lobby
+FEATURED_GAMES_COUNT = int(os.environ.get("CHESS_FEATURED_GAMES", "5"))
+
+# Lobby board thumbnails: in-memory LRU size, optional directory for evicted SVGs, size in pixels
+THUMBNAIL_CACHE_SIZE = int(os.environ.get("CHESS_THUMBNAIL_CACHE", "256"))
+THUMBNAIL_SPILL_DIR = os.environ.get("CHESS_THUMBNAIL_SPILL_DIR") or None
+THUMBNAIL_SIZE = int(os.environ.get("CHESS_THUMBNAIL_SIZE", "160"))
+
+# Worker processes (1 runs the classic single-process server). With more than one, every worker
+# binds the port with SO_REUSEPORT, owns the games whose ID hashes to its shard index and reaches
+# the other workers over Unix sockets in SHARD_SOCKET_DIR
+WORKER_COUNT = int(os.environ.get("CHESS_WORKERS", "1"))
+# Additional workers that own no games: they only hold spectators (relaying the owners'
+# frames from the message bus) and proxy everything else
+RELAY_WORKER_COUNT = int(os.environ.get("CHESS_RELAY_WORKERS", "0"))
+# When sharded, spectators of another worker's game stay on the worker they connected to
+# and are fed through the message bus, instead of being proxied to the game's owner.
+# Spectators landing on the owner itself are handed to a relay worker, if there is one
+SPECTATOR_RELAY = os.environ.get("CHESS_SPECTATOR_RELAY", "1") == "1"
+SHARD_INDEX = int(os.environ["CHESS_SHARD_INDEX"]) if "CHESS_SHARD_INDEX" in os.environ else None
+SHARD_SOCKET_DIR = os.environ.get("CHESS_SHARD_SOCKET_DIR") or tempfile.gettempdir()
+
+# Message bus between server processes: "memory" (single process) or "unix" (broker on a Unix
+# socket, started by the worker supervisor or with `python bus.py`)
+BUS_BACKEND = os.environ.get("CHESS_BUS") or ("unix" if WORKER_COUNT + RELAY_WORKER_COUNT > 1 else "memory")
+BUS_SOCKET_PATH = os.environ.get("CHESS_BUS_SOCKET") or os.path.join(SHARD_SOCKET_DIR, "chess-bus.sock")
+# At-least-once messages the broker retains per topic for subscribers that reconnect
+BUS_RETAINED_MESSAGES = int(os.environ.get("CHESS_BUS_RETAINED", "256"))
+
+# Hot standby: a "primary" streams its games' events to standbys over REPLICATION_SOCKET_PATH; a
+# "standby" keeps replicas of those games and takes over the port once the primary goes away.
+# When sharded, each shard uses REPLICATION_SOCKET_PATH.<shard index>, followed by the same shard
+REPLICATION_ROLE = os.environ.get("CHESS_REPLICATION", "")
+REPLICATION_SOCKET_PATH = os.environ.get("CHESS_REPLICATION_SOCKET") or \
+    os.path.join(tempfile.gettempdir(), "chess-replication.sock")
+REPLICATION_HEARTBEAT = float(os.environ.get("CHESS_REPLICATION_HEARTBEAT", "0.5"))
+# Seconds the players of a failed-over game have to reconnect before the absent side forfeits
+RESUME_GRACE_SECONDS = float(os.environ.get("CHESS_RESUME_GRACE", "30"))
+
+# Session lifecycle (see reaper.py): a side that doesn't make its first move within FIRST_MOVE_TIMEOUT
+# seconds aborts the game, a player who drops out of a running game forfeits unless they resume it within
+# DISCONNECT_GRACE_SECONDS (0 forfeits right away), and finished games are dropped FINISHED_GAME_TTL
+# seconds after their result
+FIRST_MOVE_TIMEOUT = float(os.environ.get("CHESS_FIRST_MOVE_TIMEOUT", "30"))
+DISCONNECT_GRACE_SECONDS = float(os.environ.get("CHESS_DISCONNECT_GRACE", "10"))
+FINISHED_GAME_TTL = float(os.environ.get("CHESS_FINISHED_GAME_TTL", "120"))
+# Most game sessions a process holds (0 for no limit); beyond that, matchmaking waits for a free slot
+MAX_SESSIONS = int(os.environ.get("CHESS_MAX_SESSIONS", "10000"))
+
+# Graceful drain (SIGTERM/SIGINT, SIGHUP to restart on the same listening socket, or the admin_drain
+# command): no new matches are made, active games get DRAIN_TIMEOUT seconds to finish, and the rest
+# are checkpointed to CHECKPOINT_PATH for the next process to resume
+DRAIN_TIMEOUT = float(os.environ.get("CHESS_DRAIN_TIMEOUT", "60"))
+# Seconds over which a draining server closes connections, so clients don't all reconnect at once
+DRAIN_SPREAD_SECONDS = float(os.environ.get("CHESS_DRAIN_SPREAD", "5"))
+CHECKPOINT_PATH = os.environ.get("CHESS_CHECKPOINT") or os.path.join(tempfile.gettempdir(), "chess-checkpoint.json")
+# Listening socket inherited from the process this one replaces (set by a draining server)
+LISTEN_FD = int(os.environ["CHESS_LISTEN_FD"]) if "CHESS_LISTEN_FD" in os.environ else None
+# Process that handed over the listening socket; it may still checkpoint games for this one
+PREDECESSOR_PID = int(os.environ["CHESS_PREDECESSOR_PID"]) if "CHESS_PREDECESSOR_PID" in os.environ else None
+# Token authorizing the admin_drain WebSocket command (the command is disabled when empty)
+ADMIN_TOKEN = os.environ.get("CHESS_ADMIN_TOKEN", "")
+
+# Wire format (see codec.py): JSON encoder used for text frames ("auto" picks orjson or ujson when
+# installed, else the standard library), and whether clients may opt into MessagePack binary frames
+JSON_ENCODER = os.environ.get("CHESS_JSON_ENCODER", "auto")
+BINARY_FRAMES_ENABLED = os.environ.get("CHESS_BINARY_FRAMES", "1") == "1"
@@ -0,0 +1,306 @@
+# server/drain.py
+import os
+import sys
+import json
+import time
+import socket
+import random
+import asyncio
+import subprocess
+from replication import describe_game, replay_game
+from sharding import get_shard_router
+from codec import send_message
+from config import DRAIN_TIMEOUT, DRAIN_SPREAD_SECONDS, CHECKPOINT_PATH, LISTEN_FD, PREDECESSOR_PID
+
+# Seconds between checks of the games still running while draining
+DRAIN_POLL_INTERVAL = 1.0
+
+# Seconds between checks for a checkpoint left by the process this one replaces
+CHECKPOINT_POLL_INTERVAL = 0.25
+
+# Longest wait (seconds) for the successor to pick up the checkpoint before sending the players to it
+CHECKPOINT_HANDOFF_TIMEOUT = 2.0
+
+# Close code telling clients the server restarts: they reconnect (and resume their game, if any)
+SERVICE_RESTART = 1012
+
+# Backlog of the listening socket
+LISTEN_BACKLOG = 128
+
+
+def open_listening_socket(host, port, reuse_port=False):
+    """
+    Get the socket the WebSocket server listens on.
+
+    A server started by a draining one inherits its listening socket (LISTEN_FD),
+    so connections arriving during the hand-off are queued rather than refused.
+
+    Args:
+        host: Address to bind
+        port: Port to bind
+        reuse_port: Set SO_REUSEPORT (workers of a sharded server share the port)
+
+    Returns:
+        socket.socket: The listening socket
+    """
+    if LISTEN_FD is not None:
+        sock = socket.socket(fileno=LISTEN_FD)
+        print(f"Listening on the socket inherited from the previous server: {sock.getsockname()}")
+        return sock
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if reuse_port:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((host, port))
+    sock.listen(LISTEN_BACKLOG)
+    return sock
+
+
+class DrainController:
+    """
+    Graceful drain and zero-downtime restart of the server process.
+
+    Draining stops matchmaking and accepting connections, sends away the
+    connections that have no game running (spread over DRAIN_SPREAD_SECONDS so
+    they don't reconnect all at once) and waits for the active games to finish.
+    Games still running after DRAIN_TIMEOUT are checkpointed to disk with their
+    clocks stopped; the next process restores them and the players resume them
+    with their resume tokens, as after a failover. For a restart, the successor
+    is spawned first and inherits the listening socket, so connections keep
+    being accepted throughout.
+    """
+
+    def __init__(self, timeout=DRAIN_TIMEOUT, spread=DRAIN_SPREAD_SECONDS, checkpoint_path=CHECKPOINT_PATH):
+        """
+        Initialize the controller.
+
+        Args:
+            timeout: Seconds active games get to finish
+            spread: Seconds over which connections are closed
+            checkpoint_path: File the remaining games are checkpointed to
+        """
+        shard_router = get_shard_router()
+        if shard_router.enabled:
+            # Game IDs hash to the same shard after a restart, so each shard keeps its own checkpoint
+            checkpoint_path = f"{checkpoint_path}.{shard_router.shard_index}"
+        self.timeout = timeout
+        self.spread = spread
+        self.checkpoint_path = checkpoint_path
+        self.game_manager = None
+        self.lobby = None
+        self.connected_clients = None
+        self.server = None
+        self.listen_socket = None
+        self.draining = False
+        self.stopped = None      # Future resolved once the drain is complete
+        self.successor = None    # Process taking over the listening socket
+        self.released = set()    # Connections sent away
+        self.checkpointed = 0    # Games handed to the next process (for metrics)
+        self.restored = 0        # Games restored from a checkpoint (for metrics)
+        self._force = False
+        self._tasks = set()
+        self._watch_task = None
+
+    def bind(self, game_manager, lobby, connected_clients):
+        """
+        Attach the controller to the server's state.
+
+        Args:
+            game_manager: The GameManager
+            lobby: The Lobby
+            connected_clients: Set of open WebSocket connections
+        """
+        self.game_manager = game_manager
+        self.lobby = lobby
+        self.connected_clients = connected_clients
+
+    def attach_server(self, server, listen_socket):
+        """
+        Attach the running WebSocket server.
+
+        Args:
+            server: The websockets Server
+            listen_socket: Its listening socket (handed to the successor on restart)
+        """
+        self.server = server
+        self.listen_socket = listen_socket
+        self.stopped = asyncio.get_running_loop().create_future()
+        if PREDECESSOR_PID is not None:
+            # The process we replace may still checkpoint games for us
+            self._watch_task = self._start(self._watch_predecessor(PREDECESSOR_PID))
+
+    def _start(self, coroutine):
+        task = asyncio.create_task(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    def request(self, restart=False):
+        """
+        Start draining (signal handler and admin_drain command).
+
+        A second request while draining checkpoints the remaining games right away.
+
+        Args:
+            restart: Spawn a successor process on the same listening socket first
+        """
+        if self.draining:
+            print("Drain requested again, checkpointing the remaining games now")
+            self._force = True
+            return
+        self.draining = True
+        self._start(self._drain(restart))
+
+    async def _drain(self, restart):
+        print(f"Draining: no new matches, active games get {self.timeout:g}s to finish")
+        waiting_players = self.lobby.start_draining()
+        if self._watch_task is not None:
+            self._watch_task.cancel()
+
+        if restart:
+            if get_shard_router().enabled:
+                print("Sharded workers are restarted by their supervisor, draining only")
+            else:
+                self._spawn_successor()
+
+        # Stop accepting connections; the open ones stay up
+        self.server.close(close_connections=False)
+
+        for websocket in waiting_players:
+            self._release(websocket)
+
+        deadline = time.monotonic() + self.timeout
+        while True:
+            ongoing = self._ongoing_games()
+            busy = set()
+            for session in ongoing:
+                busy.update(session.clients)
+                busy.update(session.spectators)
+            for websocket in list(self.connected_clients):
+                if websocket not in busy:
+                    self._release(websocket)
+            if not ongoing or self._force or time.monotonic() >= deadline:
+                break
+            await asyncio.sleep(DRAIN_POLL_INTERVAL)
+
+        if ongoing:
+            await self._checkpoint(ongoing)
+            if self.successor is not None:
+                # The successor removes the checkpoint once it has restored the games
+                handoff_deadline = time.monotonic() + CHECKPOINT_HANDOFF_TIMEOUT
+                while os.path.exists(self.checkpoint_path) and time.monotonic() < handoff_deadline:
+                    await asyncio.sleep(CHECKPOINT_POLL_INTERVAL / 2)
+
+        for websocket in list(self.connected_clients):
+            self._release(websocket)
+        while self._tasks - {asyncio.current_task()}:
+            await asyncio.wait(self._tasks - {asyncio.current_task()})
+        print(f"Drain complete ({len(self.released)} connections released, {self.checkpointed} games checkpointed)")
+        self.stopped.set_result(None)
+
+    def _ongoing_games(self):
+        return [session for session in self.game_manager.active_games.values()
+                if not session.chess_game.is_game_over()]
+
+    def _spawn_successor(self):
+        """Start a new server process that inherits the listening socket."""
+        fd = self.listen_socket.fileno()
+        env = dict(os.environ, CHESS_LISTEN_FD=str(fd), CHESS_PREDECESSOR_PID=str(os.getpid()))
+        self.successor = subprocess.Popen([sys.executable, os.path.abspath(sys.argv[0])] + sys.argv[1:],
+                                          env=env, pass_fds=(fd,))
+        print(f"Started successor process {self.successor.pid} on the listening socket")
+
+    def _release(self, websocket):
+        """Send a connection away after a random part of the spread (once)."""
+        if websocket in self.released:
+            return
+        self.released.add(websocket)
+        self._start(self._close_connection(websocket, random.uniform(0, self.spread)))
+
+    async def _close_connection(self, websocket, delay):
+        await asyncio.sleep(delay)
+        try:
+            await send_message(websocket, {
+                "type": "server_draining",
+                "message": "The server is restarting. Reconnecting..."
+            })
+            await websocket.close(SERVICE_RESTART, "Server restarting")
+        except Exception:
+            pass  # Already gone
+
+    async def _checkpoint(self, sessions):
+        """Write the games still running to the checkpoint and close them here without a result."""
+        games = []
+        for session in sessions:
+            session.chess_game.stop_clock()
+            games.append(describe_game(session))
+
+        temporary_path = f"{self.checkpoint_path}.tmp"
+        with open(temporary_path, "w") as f:
+            json.dump({"games": games}, f)
+        os.replace(temporary_path, self.checkpoint_path)
+        self.checkpointed += len(games)
+        print(f"Checkpointed {len(games)} games to {self.checkpoint_path}")
+
+        for session in sessions:
+            await self.game_manager.release_game(session.game_id)
+
+    def load_checkpoint(self):
+        """
+        Restore the games checkpointed by a previous process, if any.
+
+        Returns:
+            int: Number of games restored
+        """
+        try:
+            with open(self.checkpoint_path) as f:
+                games = json.load(f)["games"]
+        except FileNotFoundError:
+            return 0
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Error reading checkpoint {self.checkpoint_path}: {str(e)}")
+            return 0
+        os.unlink(self.checkpoint_path)
+
+        restored = 0
+        for game in games:
+            if game["id"] not in self.game_manager.active_games:
+                self.game_manager.restore_game(game["id"], replay_game(game), game["tokens"])
+                restored += 1
+        self.restored += restored
+        print(f"Restored {restored} games from checkpoint {self.checkpoint_path}")
+        return restored
+
+    async def _watch_predecessor(self, predecessor_pid):
+        """Pick up the checkpoint of the process this one replaces, until that process exits."""
+        while os.getppid() == predecessor_pid:
+            self.load_checkpoint()
+            await asyncio.sleep(CHECKPOINT_POLL_INTERVAL)
+        self.load_checkpoint()
+
+    def get_stats(self):
+        """Return counters for the stats endpoint."""
+        return {
+            "draining": self.draining,
+            "released": len(self.released),
+            "checkpointed": self.checkpointed,
+            "restored": self.restored
+        }
+
+
+# Drain controller of this process
+_drain_controller = None
+
+
+def get_drain_controller():
+    """
+    Get the process-wide drain controller.
+
+    Returns:
+        DrainController: The shared controller
+    """
+    global _drain_controller
+    if _drain_controller is None:
+        _drain_controller = DrainController()
+    return _drain_controller
@@ -0,0 +1,157 @@
+# server/eco.py
+import csv
+import chess
+import chess.polyglot
+from config import ECO_TABLE_PATH
+
+
+class EcoNode:
+    """A node in the opening trie. Children are keyed by UCI move."""
+
+    def __init__(self):
+        self.children = {}
+        self.eco = None   # ECO code if a named opening ends at this node
+        self.name = None  # Opening name if a named opening ends at this node
+
+
+class EcoTable:
+    """
+    Trie of ECO opening move sequences plus a position index.
+
+    The trie lets a game advance through known openings with one dict lookup per
+    move. The position index (Zobrist hash -> node) catches transpositions into
+    a known line from a different move order.
+    """
+
+    def __init__(self):
+        self.root = EcoNode()
+        self.by_position = {}  # Maps zobrist hash -> EcoNode
+        self.max_plies = 0     # Depth of the longest line, no lookups are needed past it
+        self.num_openings = 0
+
+    def add(self, eco, name, san_moves):
+        """
+        Add an opening line to the table.
+
+        Args:
+            eco: ECO code (e.g. "C50")
+            name: Opening name
+            san_moves: List of moves in SAN, starting from the initial position
+        """
+        board = chess.Board()
+        node = self.root
+        for san in san_moves:
+            move = board.parse_san(san)
+            board.push(move)
+            uci = move.uci()
+            child = node.children.get(uci)
+            if child is None:
+                child = EcoNode()
+                node.children[uci] = child
+                self.by_position.setdefault(chess.polyglot.zobrist_hash(board), child)
+            node = child
+
+        node.eco = eco
+        node.name = name
+        self.max_plies = max(self.max_plies, len(san_moves))
+        self.num_openings += 1
+
+    @classmethod
+    def load(cls, path):
+        """
+        Build the table from a TSV file with eco, name and pgn columns.
+
+        Args:
+            path: Path to the TSV file
+
+        Returns:
+            EcoTable: The loaded table (empty if the file can't be read)
+        """
+        table = cls()
+        try:
+            with open(path, encoding="utf-8", newline="") as tsv_file:
+                for row in csv.DictReader(tsv_file, delimiter="\t"):
+                    # Drop move numbers ("1.", "2.") and keep the SAN tokens
+                    san_moves = [token for token in row["pgn"].split() if not token.endswith(".")]
+                    try:
+                        table.add(row["eco"], row["name"], san_moves)
+                    except ValueError as e:
+                        print(f"Skipping invalid ECO line {row['eco']} {row['name']}: {str(e)}")
+        except OSError as e:
+            print(f"ECO table unavailable ({path}): {str(e)}")
+
+        print(f"Loaded {table.num_openings} ECO openings ({len(table.by_position)} positions)")
+        return table
+
+
+class OpeningCursor:
+    """
+    Tracks the opening of a single game as moves are made.
+
+    Advancing along the trie is a single dict lookup; the position index is only
+    probed when the game leaves the trie, and only while it is still shallow
+    enough to transpose back into a known line.
+    """
+
+    __slots__ = ("table", "node", "eco", "name")
+
+    def __init__(self, table):
+        """
+        Initialize the cursor at the root of the table.
+
+        Args:
+            table: The EcoTable to follow
+        """
+        self.table = table
+        self.node = table.root
+        self.eco = None
+        self.name = None
+
+    def advance(self, board, move):
+        """
+        Advance the cursor after a move has been pushed onto the board.
+
+        Args:
+            board: The chess.Board after the move
+            move: The chess.Move that was just played
+        """
+        node = self.node.children.get(move.uci()) if self.node is not None else None
+
+        # Left the trie: look for a transposition into a known position
+        if node is None and board.ply() <= self.table.max_plies:
+            node = self.table.by_position.get(chess.polyglot.zobrist_hash(board))
+
+        self.node = node
+
+        # Keep the deepest named opening reached so far
+        if node is not None and node.eco is not None:
+            self.eco = node.eco
+            self.name = node.name
+
+    def get_opening(self):
+        """
+        Get the current opening.
+
+        Returns:
+            dict or None: {"eco": ..., "name": ...} or None if no opening matched yet
+        """
+        if self.eco is None:
+            return None
+        return {"eco": self.eco, "name": self.name}
+
+
+# Shared table instance, built once per process on first use
+_eco_table = None
+
+
+def get_eco_table():
+    """
+    Get the process-wide ECO table.
+
+    Returns:
+        EcoTable: The shared table loaded from ECO_TABLE_PATH
+    """
+    global _eco_table
+    if _eco_table is None:
+        _eco_table = EcoTable.load(ECO_TABLE_PATH)
+    return _eco_table
@@ -0,0 +1,132 @@
+# server/featured.py
+import bisect
+import chess
+from config import FEATURED_GAMES_COUNT
+
+# Material values used for the balance term of the score
+PIECE_VALUES = {chess.PAWN: 1, chess.KNIGHT: 3, chess.BISHOP: 3, chess.ROOK: 5, chess.QUEEN: 9}
+
+# Remaining time (seconds) below which a side counts as being in time pressure
+TIME_PRESSURE_THRESHOLD = 30.0
+
+
+def material_balance(board):
+    """
+    Get the material balance of a position.
+
+    Args:
+        board: chess.Board
+
+    Returns:
+        int: White's material minus Black's, in pawns
+    """
+    balance = 0
+    for piece_type, value in PIECE_VALUES.items():
+        balance += value * (chess.popcount(board.pieces_mask(piece_type, chess.WHITE)) -
+                            chess.popcount(board.pieces_mask(piece_type, chess.BLACK)))
+    return balance
+
+
+def score_game(session):
+    """
+    Score how interesting a game is to watch.
+
+    Spectators weigh the most; balanced material, time pressure and the game
+    having left the opening add to it.
+
+    Args:
+        session: GameSession to score
+
+    Returns:
+        float: The score (higher is more interesting)
+    """
+    chess_game = session.chess_game
+    board = chess_game.board
+
+    score = 10.0 * session.spectator_count()
+    score += max(0, 5 - abs(material_balance(board)))
+    score += min(board.ply(), 80) / 20
+
+    lowest_time = min(chess_game.time_white, chess_game.time_black)
+    if lowest_time < TIME_PRESSURE_THRESHOLD:
+        score += (TIME_PRESSURE_THRESHOLD - lowest_time) / 3
+    return score
+
+
+class FeaturedGamesIndex:
+    """
+    Ongoing games ordered by score, maintained incrementally.
+
+    Games are rescored only when a scored attribute changes (a move, a
+    spectator joining or leaving), so reading the top K games is O(K) and
+    never scans the active games.
+    """
+
+    def __init__(self):
+        self._scores = {}   # Maps game_id -> current score
+        self._ranking = []  # Sorted list of (-score, game_id)
+
+    def update(self, session):
+        """
+        (Re)score a game.
+
+        Args:
+            session: The GameSession whose scored attributes changed
+        """
+        if session.chess_game.is_game_over():
+            self.discard(session.game_id)
+            return
+
+        score = score_game(session)
+        old_score = self._scores.get(session.game_id)
+        if old_score == score:
+            return
+        if old_score is not None:
+            self._remove_entry(old_score, session.game_id)
+
+        self._scores[session.game_id] = score
+        bisect.insort(self._ranking, (-score, session.game_id))
+
+    def discard(self, game_id):
+        """Remove a game (finished or closed) from the index."""
+        score = self._scores.pop(game_id, None)
+        if score is not None:
+            self._remove_entry(score, game_id)
+
+    def _remove_entry(self, score, game_id):
+        index = bisect.bisect_left(self._ranking, (-score, game_id))
+        if index < len(self._ranking) and self._ranking[index] == (-score, game_id):
+            del self._ranking[index]
+
+    def top(self, count=FEATURED_GAMES_COUNT):
+        """
+        Get the top games.
+
+        Args:
+            count: Number of games
+
+        Returns:
+            list: Game IDs, best first
+        """
+        return [game_id for _, game_id in self._ranking[:count]]
+
+    def score(self, game_id):
+        """Return a game's current score, or None if it isn't indexed."""
+        return self._scores.get(game_id)
+
+
+# Shared index of all ongoing games
+_featured_index = None
+
+
+def get_featured_index():
+    """
+    Get the process-wide featured games index.
+
+    Returns:
+        FeaturedGamesIndex: The shared index
+    """
+    global _featured_index
+    if _featured_index is None:
+        _featured_index = FeaturedGamesIndex()
+    return _featured_index
@@ -1,8 +1,14 @@
 # server/game_manager.py
+import sys
 import json
-import uuid
 import asyncio
 from game_session import GameSession
+from config import DEFAULT_TIME_CONTROL, FEATURED_GAMES_COUNT, DISCONNECT_GRACE_SECONDS
+from featured import get_featured_index
+from thumbnails import get_thumbnail_cache
+from sharding import get_shard_router
+from reaper import get_session_reaper
+from codec import send_message
 
 class GameManager:
     def __init__(self):
@@ -62,13 +68,13 @@ class GameManager:
             print(f"One of the players disconnected before game could start: {str(e)}")
             return None
 
-        # Generate a unique game_id
-        game_id = str(uuid.uuid4())
+        # Generate a unique game_id (owned by this worker's shard when running sharded)
+        game_id = get_shard_router().new_game_id()
         print(f"Generated game ID: {game_id}")
 
         # Create a new game session
         try:
-            game_session = GameSession(game_id, player1_ws, player2_ws)
+            game_session = GameSession(game_id, player1_ws, player2_ws, time_control=DEFAULT_TIME_CONTROL)
             print(f"Created game session object for game {game_id}")
         except Exception as e:
             print(f"Error creating game session: {str(e)}")
@@ -109,6 +115,7 @@ class GameManager:
             # Clean up
             if game_id in self.active_games:
                 del self.active_games[game_id]
+            get_featured_index().discard(game_id)
             if player1_id in self.player_to_game:
                 del self.player_to_game[player1_id]
             if player2_id in self.player_to_game:
@@ -136,6 +143,7 @@ class GameManager:
             print(f"Failed to start game session {game_id}, cleaning up")
             if game_id in self.active_games:
                 del self.active_games[game_id]
+            get_featured_index().discard(game_id)
             if player1_id in self.player_to_game:
                 del self.player_to_game[player1_id]
             if player2_id in self.player_to_game:
@@ -237,7 +245,7 @@ class GameManager:
                         print(f"WARNING: Message game_id {message_game_id} doesn't match player's game {game_id}")
                         print(f"Using player's game ID: {game_id}")
 
-                    await game_session.broadcast_game_state()
+                    game_session.send_game_state(websocket)
                     return True
 
                 # For other non-chat messages, use the standard handler
@@ -298,7 +306,11 @@ class GameManager:
                         print(f"WARNING: Message game_id {message_game_id} doesn't match spectator's game {game_id}")
                         print(f"Using spectator's game ID: {game_id}")
 
-                    await game_session.broadcast_game_state()
+                    game_session.send_game_state(websocket, include_legal_moves=False)
+                    return True
+                elif msg_type == 'probe_tablebase':
+                    # Post-game analysis is open to spectators as well
+                    await game_session.handle_tablebase_probe(websocket)
                     return True
                 else:
                     print(f"Spectator {client_id} sent non-chat message: {msg_type}")
@@ -308,6 +320,117 @@ class GameManager:
         print(f"Message from client {client_id} could not be handled")
         return False
 
+    def restore_game(self, game_id, chess_game, resume_tokens):
+        """
+        Take over a game replicated from a primary that went away.
+
+        The game waits for its players to resume it; once RESUME_GRACE_SECONDS
+        have passed, a side that didn't come back loses (see expire_resume).
+
+        Args:
+            game_id: The game's ID
+            chess_game: The replicated ChessGame, its clock stopped
+            resume_tokens: Resume tokens of the game's players ('white'/'black' -> token)
+
+        Returns:
+            GameSession: The restored session
+        """
+        game_session = GameSession(game_id, None, None, time_control=chess_game.time_control, chess_game=chess_game)
+        # Colors read back from the checkpoint or replication stream are interned like the literal ones
+        game_session.resume_tokens = {sys.intern(color): token for color, token in resume_tokens.items()}
+        game_session.restore()
+        self.active_games[game_id] = game_session
+        get_session_reaper().game_restored(game_session)
+        print(f"Restored game {game_id}, waiting for its players to resume")
+        return game_session
+
+    async def resume_player(self, websocket, game_id, token):
+        """
+        Seat a player back in their game on a new connection.
+
+        Args:
+            websocket: The player's new WebSocket connection
+            game_id: The game to resume
+            token: The player's resume token
+
+        Returns:
+            bool: True if the player was seated, False if the game or token is unknown
+        """
+        game_session = self.active_games.get(game_id)
+        if game_session is None or id(websocket) in self.player_to_game:
+            return False
+
+        # Remember the replaced connection, to drop its mapping once the new one is seated
+        previous = [client for client in game_session.clients if id(client) in self.player_to_game]
+        color = await game_session.resume_player(websocket, token)
+        if color is None:
+            return False
+
+        for client in previous:
+            if client not in game_session.clients:
+                self.player_to_game.pop(id(client), None)
+        self.player_to_game[id(websocket)] = game_id
+        return True
+
+    async def expire_resume(self, game_id):
+        """
+        End a restored game whose players didn't all resume it in time (called by the reaper).
+
+        Args:
+            game_id: The game's ID
+
+        Returns:
+            bool: True if the game was closed, False if its players are all back
+        """
+        game_session = self.active_games.get(game_id)
+        if game_session is None or not game_session.awaiting_resume:
+            return False
+
+        if game_session.clients and not game_session.chess_game.is_game_over():
+            # The side that came back wins, as when an opponent disconnects
+            winner = game_session.player_map[next(iter(game_session.clients))]
+            await game_session.broadcast_game_over({
+                "outcome": "opponent_disconnected",
+                "winner": winner,
+                "disconnected_player": "black" if winner == "white" else "white"
+            })
+        print(f"Players of restored game {game_id} didn't resume it in time, closing it")
+        await self.discard_game(game_id)
+        return True
+
+    async def release_game(self, game_id):
+        """
+        Close a game that continues in another process (checkpointed by a draining server).
+
+        The game ends here without a result; its players and spectators are no
+        longer mapped to it, so their disconnection doesn't decide it.
+
+        Args:
+            game_id: The game's ID
+        """
+        if await self.discard_game(game_id):
+            print(f"Released game {game_id} to the next server process")
+
+    async def discard_game(self, game_id):
+        """
+        Close a game and forget it, along with its players' and spectators' mappings.
+
+        Args:
+            game_id: The game's ID
+
+        Returns:
+            bool: True if the game was found
+        """
+        game_session = self.active_games.pop(game_id, None)
+        if game_session is None:
+            return False
+        for client in game_session.clients:
+            self.player_to_game.pop(id(client), None)
+        for spectator in game_session.spectators:
+            self.spectator_to_game.pop(id(spectator), None)
+        await game_session.close_session()
+        return True
+
     async def add_spectator_to_game(self, game_id, websocket):
         """
         Add a spectator to a game.
@@ -359,8 +482,33 @@ class GameManager:
                     # Remove the player mapping
                     del self.player_to_game[client_id]
 
-                    # Check if the game should be closed
-                    if not game_session.clients or len(game_session.clients) <= 1:
+                    if game_session.awaiting_resume:
+                        # A restored game waiting for its players: the resume deadline decides it
+                        color = game_session.player_map.pop(websocket, None)
+                        if color is not None:
+                            game_session.awaiting_resume.add(color)
+
+                    elif len(game_session.clients) == 1 and DISCONNECT_GRACE_SECONDS > 0 and \
+                            game_id in self.active_games and not game_session.finished and \
+                            not game_session.chess_game.is_game_over():
+                        # Dropped out of a running game: the player may resume it (resume_game)
+                        # until the grace period ends, after which the reaper forfeits them
+                        color = game_session.player_map.pop(websocket, None)
+                        if color is not None:
+                            get_session_reaper().player_disconnected(game_session, color)
+                            print(f"Player {client_id} ({color}) dropped out of game {game_id}, "
+                                  f"waiting {DISCONNECT_GRACE_SECONDS:g}s for them to resume it")
+                            try:
+                                await send_message(next(iter(game_session.clients)), {
+                                    "type": "status",
+                                    "message": f"Your opponent disconnected. They have {DISCONNECT_GRACE_SECONDS:g} "
+                                               f"seconds to reconnect before forfeiting the game."
+                                })
+                            except Exception as e:
+                                print(f"Error notifying remaining player: {str(e)}")
+
+                    # Otherwise check if the game should be closed
+                    elif not game_session.clients or len(game_session.clients) <= 1:
                         print(f"Game {game_id} has {len(game_session.clients)} clients left, checking if it should be closed")
 
                         # IMPORTANT: Always consider the game as running if there's at least one client left
@@ -464,6 +612,31 @@ class GameManager:
             print(f"Error in remove_client: {str(e)}")
             return False
 
+    def get_top_game_ids(self, count):
+        """
+        Get the featured (highest scoring) ongoing games.
+
+        Args:
+            count: Maximum number of games
+
+        Returns:
+            list: Game IDs, best first
+        """
+        return get_featured_index().top(count)
+
+    def get_featured_entries(self, count):
+        """
+        Get the featured games together with their scores (to merge rankings across shards).
+
+        Args:
+            count: Maximum number of games
+
+        Returns:
+            list: (game_id, score) pairs, best first
+        """
+        featured_index = get_featured_index()
+        return [(game_id, featured_index.score(game_id)) for game_id in featured_index.top(count)]
+
     def get_active_games_info(self):
         """
         Get information about all active games.
@@ -482,6 +655,8 @@ class GameManager:
             # Log the player to game mapping
             print(f"Player to game mapping: {self.player_to_game}")
 
+            featured_ids = set(self.get_top_game_ids(FEATURED_GAMES_COUNT))
+
             for game_id, game_session in self.active_games.items():
                 try:
                     # Get player IDs or names
@@ -495,6 +670,8 @@ class GameManager:
                     for spectator_id, game in self.spectator_to_game.items():
                         if game == game_id:
                             num_spectators += 1
+                    # Plus those watching through relays in other processes
+                    num_spectators += sum(game_session.relay_counts.values())
 
                     # Create game info dictionary
                     game_info = {
@@ -504,9 +681,12 @@ class GameManager:
                         "num_spectators": num_spectators,
                         "status": "Ongoing" if not game_session.chess_game.is_game_over() else "Completed",
                         "fen": game_session.chess_game.get_board_fen(),
+                        "thumbnail": get_thumbnail_cache().get_ref(game_session.chess_game.get_board_fen()),
                         "turn": game_session.chess_game.get_turn_color_string(),
                         "time_white": game_session.chess_game.time_white,
-                        "time_black": game_session.chess_game.time_black
+                        "time_black": game_session.chess_game.time_black,
+                        "opening": game_session.chess_game.get_opening(),
+                        "featured": game_id in featured_ids
                     }
 
                     games_info.append(game_info)
@@ -2,11 +2,45 @@
 import json
 import asyncio
 import time
+import hmac
+import secrets
 import chess
+from collections import deque
 from chess_game import ChessGame
+from tablebase import get_tablebase, result_from_probe
+from latency import get_one_way_latency, LATENCY_TRACKERS
+from chat_expiry import get_chat_expiry, CHAT_RESPONSE_TIMEOUT
+from chat_history import ChatHistory
+from spectator_delay import DelayedSpectatorStream, get_delayed_broadcaster
+from tv import get_tv_channel
+from featured import get_featured_index
+from bus import get_message_bus
+from replication import get_replication_publisher
+from reaper import get_session_reaper
+from codec import send_message, encode_json, Frame
+from config import SEND_LEGAL_MOVE_HINTS, CHAT_HISTORY_SIZE, CHAT_BACKFILL_SIZE, \
+    SPECTATOR_DELAY_SECONDS, SPECTATOR_DELAY_PLIES
+
+# Maximum number of premoves a player can queue
+PREMOVE_QUEUE_LIMIT = 3
+
+# Shared empty set standing in for sets most sessions never fill (replaced when first needed)
+_EMPTY = frozenset()
 
 class GameSession:
-    def __init__(self, game_id, player1_ws, player2_ws, time_control_seconds=300):
+    # Thousands of sessions are held at once: no per-instance __dict__
+    __slots__ = (
+        "game_id", "chess_game", "clients", "spectators", "player_map", "_timer_task",
+        "chat_history", "player_last_message_time", "pending_responses", "pending_message_sender",
+        "adjudication_votes", "adjudication_ply", "_legal_moves_sent_ply", "premoves",
+        "_state_snapshot", "_state_snapshot_version", "_state_requests", "_state_reply_task",
+        "resume_tokens", "awaiting_resume", "disconnected_at", "finished", "closed",
+        "relay_counts", "spectator_stream"
+    )
+
+    def __init__(self, game_id, player1_ws, player2_ws, time_control_seconds=300, time_control=None,
+                 spectator_delay_seconds=SPECTATOR_DELAY_SECONDS, spectator_delay_plies=SPECTATOR_DELAY_PLIES,
+                 chess_game=None):
         """
         Initialize a new game session with two players.
 
@@ -15,79 +49,148 @@ class GameSession:
             player1_ws: WebSocket connection for player 1 (white)
             player2_ws: WebSocket connection for player 2 (black)
             time_control_seconds: Time control in seconds (default: 300 seconds = 5 minutes)
+            time_control: Optional time control specification (e.g. "180+2"), overrides time_control_seconds
+            spectator_delay_seconds: Delay spectators' view of the game by this many seconds (0 for live)
+            spectator_delay_plies: Delay spectators' view of the game by this many plies (0 for live)
+            chess_game: Existing game to continue (a failed-over replica), instead of a new one
         """
         self.game_id = game_id
-        self.chess_game = ChessGame(time_control_seconds=time_control_seconds)
+        if chess_game is None:
+            chess_game = ChessGame(time_control_seconds=time_control_seconds, time_control=time_control)
+        self.chess_game = chess_game
         self.clients = set()  # To store player WebSockets
-        self.spectators = set()  # To store spectator WebSockets
+        self.spectators = _EMPTY  # To store spectator WebSockets (a set once the first one joins)
         self.player_map = {}  # Maps WebSocket object -> 'white'/'black' string
         self._timer_task = None
-        self.game_started = False  # Flag to track if the game has properly started
 
         # Chat message tracking for 1-minute timer logic
-        self.chat_messages = {}  # Maps message_id -> message data
+        self.chat_history = ChatHistory(CHAT_HISTORY_SIZE)  # Most recent messages, by integer message_id
         self.player_last_message_time = {}  # Maps player_id -> timestamp of last message
-        self.pending_responses = {}  # Maps sender_id -> list of message_ids awaiting response
-        self.chat_timer_task = None  # Task for checking message timeouts
+        self.pending_responses = {}  # Maps sender_id -> deque of (message_id, timestamp) awaiting response, oldest first
+        self.pending_message_sender = {}  # Maps pending message_id -> sender_id
+
+        # Tablebase adjudication: colors that agreed to adjudicate the position at adjudication_ply
+        self.adjudication_votes = _EMPTY
+        self.adjudication_ply = None
+
+        # Ply for which the side to move last received its legal move map
+        self._legal_moves_sent_ply = None
+
+        # Premoves queued by each player while waiting for the opponent (color -> list of UCI moves)
+        self.premoves = {}
+
+        # Cached position snapshot for game_update messages, keyed by the game's version
+        self._state_snapshot = None
+        self._state_snapshot_version = None
+
+        # State requests waiting for the next shared reply (websocket -> include legal moves)
+        self._state_requests = {}
+        self._state_reply_task = None
 
         # Assign players to colors
         self._assign_players(player1_ws, player2_ws)
 
+        # Secret per color letting a player take their seat back on a new connection (after a failover)
+        self.resume_tokens = {'white': secrets.token_urlsafe(16), 'black': secrets.token_urlsafe(16)}
+        self.awaiting_resume = _EMPTY  # Colors of a restored game whose players haven't reconnected yet
+        self.disconnected_at = {}  # Maps color -> loop time the player dropped out of the running game
+
+        # Set once the result is out; the reaper drops the session after its post-game time
+        self.finished = False
+
+        self.closed = False  # Set by close_session()
+
+        # Spectators held by relays in other processes (relay ID -> count)
+        self.relay_counts = {}
+
+        # Delayed spectator stream (None when spectators watch live)
+        self.spectator_stream = None
+        if spectator_delay_seconds > 0 or spectator_delay_plies > 0:
+            self.spectator_stream = DelayedSpectatorStream(self, spectator_delay_seconds, spectator_delay_plies)
+            # Until the first frame is released, spectators see the starting position
+            self.spectator_stream.released_state = self._build_game_state()
+            self.spectator_stream.released_json = encode_json(self.spectator_stream.released_state)
+
+    @property
+    def spectator_topic(self):
+        """Message bus topic carrying the frames sent to spectators."""
+        return f"spectators/{self.game_id}"
+
+    @property
+    def relay_topic(self):
+        """Message bus topic carrying the events of relays in other processes."""
+        return f"relay/{self.game_id}"
+
+    @property
+    def spectator_chat_topic(self):
+        """Message bus topic carrying the room chat out to the relays."""
+        return f"spectator_chat/{self.game_id}"
+
     def _assign_players(self, player1_ws, player2_ws):
         """
         Assign player1_ws to white and player2_ws to black.
         Populate self.clients and self.player_map.
+        Restored sessions start without players (both are None).
         """
         # Assign player1 to white
-        player1_id = id(player1_ws)
-        white_color = self.chess_game.assign_player(player1_id, 'white')
-        if white_color is not None:
-            self.clients.add(player1_ws)
-            self.player_map[player1_ws] = 'white'
+        if player1_ws is not None:
+            player1_id = id(player1_ws)
+            white_color = self.chess_game.assign_player(player1_id, 'white')
+            if white_color is not None:
+                self.clients.add(player1_ws)
+                self.player_map[player1_ws] = 'white'
 
         # Assign player2 to black
-        player2_id = id(player2_ws)
-        black_color = self.chess_game.assign_player(player2_id, 'black')
-        if black_color is not None:
-            self.clients.add(player2_ws)
-            self.player_map[player2_ws] = 'black'
+        if player2_ws is not None:
+            player2_id = id(player2_ws)
+            black_color = self.chess_game.assign_player(player2_id, 'black')
+            if black_color is not None:
+                self.clients.add(player2_ws)
+                self.player_map[player2_ws] = 'black'
 
     async def start_session_logic(self, player1_ws, player2_ws):
         """
         Start the game session logic.
         Initialize the timer and start the timer loop.
         """
-        # Set the initial timestamp and record the start time
-        current_time = asyncio.get_event_loop().time()
-        self.chess_game.last_move_timestamp = current_time
-        self.start_time = current_time  # Track when the game session started
+        # Start white's clock
+        self.chess_game.start_clock()
+
+        # Stream the game to the standby (no-op unless this process is a replication primary)
+        get_replication_publisher().game_started(self)
+
+        # List the game in the featured games index
+        get_featured_index().update(self)
+
+        # Spectator frames go through the message bus; every process holding spectators fans them out
+        get_message_bus().subscribe(self.spectator_topic, self._fan_out_to_spectators)
+        get_message_bus().subscribe(self.relay_topic, self._on_relay_event)
 
         # Start the timer loop
         self._timer_task = asyncio.create_task(self._timer_loop())
 
-        # Start the chat timer loop for message timeout checking
-        self.chat_timer_task = asyncio.create_task(self._chat_timer_loop())
-        print(f"Chat timer loop started for game {self.game_id}")
+        # Abort the game if a side doesn't make its first move
+        get_session_reaper().game_started(self)
 
-        # Mark the game as started after a short delay to ensure both clients are ready
-        await asyncio.sleep(0.5)  # Short delay to ensure initialization is complete
-        self.game_started = True
+        # Short delay to ensure both clients are ready
+        await asyncio.sleep(0.5)
         print(f"Game {self.game_id} is now marked as started")
 
     async def _timer_loop(self):
         """
         Timer loop that checks for timeouts and updates game state.
         Runs until the game is over.
+
+        Remaining times are computed from the clock on demand, so this loop only
+        detects flag falls and paces the broadcasts.
         """
         last_broadcast_time = 0
         last_detailed_log_time = 0
         last_critical_time_check = 0
         broadcast_frequency = 0.1  # 100ms for normal updates
+        synced_broadcast_frequency = 0.5  # Clients with a latency estimate interpolate between updates
         critical_time_threshold = 10  # seconds
 
-        # Flag to track if we're in critical time mode (less than 10 seconds)
-        in_critical_time = False
-
         while not self.chess_game.is_game_over():
             # Sleep for a very short time to avoid consuming too much CPU
             # But update frequently enough for smooth time flow
@@ -96,33 +199,18 @@ class GameSession:
             # Get current time
             current_time = asyncio.get_event_loop().time()
 
-            # Update the time for the current player in real-time
-            # This ensures time flows naturally at a real-time rate
-            if self.chess_game.last_move_timestamp is not None:
-                # Only update the time for the current player
-                if self.chess_game.board.turn == chess.WHITE:
-                    # Update white's time in real-time
-                    time_elapsed = current_time - self.chess_game.last_move_timestamp
-                    self.chess_game.time_white = max(0, self.chess_game.time_at_last_move_white - time_elapsed)
-
-                    # Check if we're in critical time (less than 10 seconds)
-                    if self.chess_game.time_white <= critical_time_threshold:
-                        in_critical_time = True
-                    else:
-                        in_critical_time = False
-                else:
-                    # Update black's time in real-time
-                    time_elapsed = current_time - self.chess_game.last_move_timestamp
-                    self.chess_game.time_black = max(0, self.chess_game.time_at_last_move_black - time_elapsed)
-
-                    # Check if we're in critical time (less than 10 seconds)
-                    if self.chess_game.time_black <= critical_time_threshold:
-                        in_critical_time = True
-                    else:
-                        in_critical_time = False
-
-            # Check for timeout
-            timed_out_player = self.chess_game.check_timeout()
+            # Check if the side to move is in critical time (less than 10 seconds)
+            clock = self.chess_game.clock
+            in_critical_time = clock.running is not None and \
+                clock.remaining_time(clock.running) <= critical_time_threshold
+
+            # Check for timeout, allowing for the mover's move still being in flight
+            grace_time = 0.1
+            if clock.running is not None:
+                latency = self._player_latency('white' if clock.running == chess.WHITE else 'black')
+                if latency is not None:
+                    grace_time = max(grace_time, latency)
+            timed_out_player = self.chess_game.check_timeout(grace_time)
             if timed_out_player is not None:
                 print(f"TIMEOUT DETECTED in timer loop!")
                 result = self.chess_game.get_game_result()
@@ -134,11 +222,12 @@ class GameSession:
 
             # Determine broadcast frequency based on time remaining
             # More frequent updates when time is critical
+            synced = self._players_synced()
             if in_critical_time:
                 # Use a more frequent broadcast interval for critical time
-                broadcast_interval = 0.05  # 50ms for critical time
+                broadcast_interval = 0.1 if synced else 0.05  # 50ms for critical time
             else:
-                broadcast_interval = broadcast_frequency  # 100ms for normal time
+                broadcast_interval = synced_broadcast_frequency if synced else broadcast_frequency
 
             # Broadcast game state based on the determined frequency
             if current_time - last_broadcast_time >= broadcast_interval:
@@ -153,13 +242,7 @@ class GameSession:
                 # Log the current times every 5 seconds during normal play
                 elif not in_critical_time and current_time - last_detailed_log_time >= 5.0:
                     print(f"Current times - White: {self.chess_game.time_white:.1f}s, Black: {self.chess_game.time_black:.1f}s")
-                    print(f"Time at last move - White: {self.chess_game.time_at_last_move_white:.1f}s, Black: {self.chess_game.time_at_last_move_black:.1f}s")
-
-                    if self.chess_game.last_move_timestamp is not None:
-                        time_elapsed = current_time - self.chess_game.last_move_timestamp
-                        print(f"Time elapsed since last move: {time_elapsed:.2f}s")
-                        print(f"Current turn: {self.chess_game.get_turn_color_string()}")
-
+                    print(f"Time elapsed since last move: {clock.elapsed():.2f}s")
                     last_detailed_log_time = current_time
 
     async def handle_message(self, websocket, message_str):
@@ -192,48 +275,77 @@ class GameSession:
                 # Check if player is in the game
                 if player_color_chess_module is None:
                     print(f"Player {player_id} is not in this game")
-                    await websocket.send(json.dumps({
+                    await send_message(websocket, {
                         "type": "error",
                         "message": "You are not a player in this game"
-                    }))
+                    })
+                    return
+
+                # A failed-over game stays paused until both players are back
+                if self.awaiting_resume:
+                    await send_message(websocket, {
+                        "type": "error",
+                        "message": "Waiting for your opponent to reconnect"
+                    })
+                    return
+
+                # Queue premoves made while waiting for the opponent
+                if self.chess_game.board.turn != player_color_chess_module and message.get('premove'):
+                    await self.queue_premove(websocket, player_color_str, uci_move)
                     return
 
                 # Check if it's the player's turn
                 if self.chess_game.board.turn != player_color_chess_module:
                     print(f"Not player's turn. Current turn: {self.chess_game.board.turn}, Player color: {player_color_chess_module}")
-                    await websocket.send(json.dumps({
+                    await send_message(websocket, {
                         "type": "error",
                         "message": "Not your turn"
-                    }))
+                    })
 
                     # Send a game state update to ensure client has correct state
-                    await self.broadcast_game_state()
+                    self.send_game_state(websocket)
                     return
 
-                # Try to make the move
-                if self.chess_game.make_move(uci_move, player_id):
+                # Try to make the move, not charging the mover for the move's transit time
+                lag_compensation = self._player_latency(player_color_str) or 0.0
+                if self.chess_game.make_move(uci_move, player_id, lag_compensation=lag_compensation):
                     print(f"Move successful: {uci_move} by {player_color_str}")
+                    get_featured_index().update(self)
+                    get_replication_publisher().move_made(self, uci_move)
                     print(f"New game state - FEN: {self.chess_game.get_board_fen()}")
                     print(f"New turn: {self.chess_game.get_turn_color_string()}")
 
+                    move_confirmation = self._build_move_confirmation(uci_move)
+
+                    # A move made on the player's own turn supersedes the premoves they had queued
+                    # (planned for a position that didn't arise; they would otherwise be played later)
+                    superseded_premoves = self.premoves.pop(player_color_str, None)
+
+                    # Apply the opponent's premove in the same event-loop step, before any await
+                    premove_applied, premoves_cancelled = self._apply_premove()
+
                     # Send immediate confirmation to the player who made the move
-                    await websocket.send(json.dumps({
-                        "type": "move_confirmed",
-                        "move": uci_move,
-                        "fen": self.chess_game.get_board_fen(),
-                        "turn": self.chess_game.get_turn_color_string(),
-                        "time_white": self.chess_game.time_white,
-                        "time_black": self.chess_game.time_black,
-                        "is_capture": self.chess_game.last_move_was_capture,
-                        "captured_piece": self.chess_game.captured_piece
-                    }))
+                    await send_message(websocket, move_confirmation)
+                    if superseded_premoves:
+                        await send_message(websocket, {
+                            "type": "premoves_cancelled",
+                            "game_id": self.game_id,
+                            "moves": superseded_premoves,
+                            "reason": "superseded"
+                        })
+
+                    # Notify the opponent about their premove queue
+                    if premove_applied or premoves_cancelled:
+                        await self._send_premove_result(premove_applied, premoves_cancelled)
+
+                    last_move = premove_applied or uci_move
 
                     # Broadcast updated game state to all clients
-                    await self.broadcast_game_state(last_move=uci_move)
+                    await self.broadcast_game_state(last_move=last_move)
 
                     # Broadcast again after a short delay to ensure all clients get the update
                     await asyncio.sleep(0.1)
-                    await self.broadcast_game_state(last_move=uci_move)
+                    await self.broadcast_game_state(last_move=last_move)
 
                     # Check if game is over
                     if self.chess_game.is_game_over():
@@ -244,20 +356,40 @@ class GameSession:
                             self._timer_task.cancel()
                 else:
                     print(f"Illegal move: {uci_move}")
-                    # Send error message for illegal move
-                    await websocket.send(json.dumps({
+                    # Send error message for illegal move, with the legal moves so the
+                    # client can resync without a full broadcast to every participant
+                    error_message = {
                         "type": "error",
                         "message": "Illegal move",
-                        "details": "The move you attempted is not valid"
-                    }))
-
-                    # Send a game state update to ensure client has correct state
-                    await self.broadcast_game_state()
+                        "details": "The move you attempted is not valid",
+                        "fen": self.chess_game.get_board_fen(),
+                        "turn": self.chess_game.get_turn_color_string()
+                    }
+                    if SEND_LEGAL_MOVE_HINTS:
+                        error_message["legal_moves"] = self.chess_game.get_legal_move_map()
+                    await send_message(websocket, error_message)
 
             elif action_type == "request_game_state":
-                # Handle request for game state update
+                # Handle request for game state update (answered to the requester only)
                 print(f"Received request_game_state from player {player_id}")
-                await self.broadcast_game_state()
+                self.send_game_state(websocket)
+
+            elif action_type == "cancel_premoves":
+                player_color = self.player_map.get(websocket)
+                if player_color:
+                    self.premoves.pop(player_color, None)
+                    await send_message(websocket, {
+                        "type": "premoves_cancelled",
+                        "game_id": self.game_id,
+                        "moves": [],
+                        "reason": "cancelled"
+                    })
+
+            elif action_type == "request_adjudication":
+                await self.handle_adjudication_request(websocket)
+
+            elif action_type == "probe_tablebase":
+                await self.handle_tablebase_probe(websocket)
 
             elif action_type == "chat_message":
                 text = message.get('text')
@@ -285,191 +417,415 @@ class GameSession:
 
             else:
                 print(f"Unknown action type: {action_type}")
-                await websocket.send(json.dumps({
+                await send_message(websocket, {
                     "type": "error",
                     "message": f"Unknown action type: {action_type}"
-                }))
+                })
 
         except json.JSONDecodeError as e:
             print(f"JSON decode error: {str(e)}")
             try:
-                await websocket.send(json.dumps({
+                await send_message(websocket, {
                     "type": "error",
                     "message": "Invalid JSON message"
-                }))
+                })
             except Exception:
                 pass
         except Exception as e:
             print(f"Error processing message: {str(e)}")
             try:
-                await websocket.send(json.dumps({
+                await send_message(websocket, {
                     "type": "error",
                     "message": f"Error processing message: {str(e)}"
-                }))
+                })
             except Exception:
                 pass
 
-    async def broadcast_game_state(self, last_move=None):
+    def _build_move_confirmation(self, uci_move):
         """
-        Broadcast the current game state to all clients and spectators.
+        Build the move_confirmed message for the move just made.
 
         Args:
-            last_move: The last move made (UCI string)
+            uci_move: The move that was made (UCI string)
+
+        Returns:
+            dict: The confirmation message
         """
-        try:
-            # Get current time
-            current_time = asyncio.get_event_loop().time()
+        return {
+            "type": "move_confirmed",
+            "move": uci_move,
+            "fen": self.chess_game.get_board_fen(),
+            "turn": self.chess_game.get_turn_color_string(),
+            "time_white": self.chess_game.time_white,
+            "time_black": self.chess_game.time_black,
+            "is_capture": self.chess_game.last_move_was_capture,
+            "captured_piece": self.chess_game.captured_piece
+        }
 
-            # CRITICAL FIX: Log the current board state and turn
-            print(f"BROADCASTING GAME STATE:")
-            print(f"  Current FEN: {self.chess_game.get_board_fen()}")
-            print(f"  Raw board.turn value: {self.chess_game.board.turn}")
-            print(f"  Turn string: {self.chess_game.get_turn_color_string()}")
-            if last_move:
-                print(f"  Last move: {last_move}")
+    async def queue_premove(self, websocket, player_color, uci_move):
+        """
+        Queue a move made before the player's turn.
 
-            # Calculate time elapsed since last move
-            time_elapsed_current_turn = 0
-            if self.chess_game.last_move_timestamp is not None:
-                time_elapsed_current_turn = current_time - self.chess_game.last_move_timestamp
-
-            # IMPORTANT FIX: Use the exact time values stored when the move was made
-            # These are the most accurate values for time calculation
-
-            # CRITICAL FIX: Use the stored time values if available
-            has_stored_values = hasattr(self.chess_game, 'stored_white_time') and \
-                               hasattr(self.chess_game, 'stored_black_time')
-
-            if has_stored_values:
-                # Use the stored time values for calculation
-                time_white_at_last_move = self.chess_game.stored_white_time
-                time_black_at_last_move = self.chess_game.stored_black_time
-
-                # Calculate time elapsed since the last move for the current player
-                if self.chess_game.board.turn == chess.WHITE and self.chess_game.last_white_move_time is not None:
-                    # It's white's turn, so calculate time elapsed since the last black move
-                    time_elapsed_current_turn = current_time - self.chess_game.last_white_move_time
-                    print(f"White's turn, time elapsed: {time_elapsed_current_turn:.2f}s")
-                elif self.chess_game.board.turn == chess.BLACK and self.chess_game.last_black_move_time is not None:
-                    # It's black's turn, so calculate time elapsed since the last white move
-                    time_elapsed_current_turn = current_time - self.chess_game.last_black_move_time
-                    print(f"Black's turn, time elapsed: {time_elapsed_current_turn:.2f}s")
+        Args:
+            websocket: The WebSocket connection of the player
+            player_color: The player's color ('white' or 'black')
+            uci_move: The premove (UCI string)
+        """
+        queue = self.premoves.setdefault(player_color, [])
+        if self.chess_game.is_game_over() or len(queue) >= PREMOVE_QUEUE_LIMIT:
+            await send_message(websocket, {
+                "type": "error",
+                "message": "Premove rejected",
+                "details": "The game is over or the premove queue is full"
+            })
+            return
+
+        queue.append(uci_move)
+        print(f"Premove queued for {player_color} in game {self.game_id}: {uci_move}")
+        await send_message(websocket, {
+            "type": "premove_queued",
+            "game_id": self.game_id,
+            "move": uci_move,
+            "premoves": list(queue)
+        })
+
+    def _apply_premove(self):
+        """
+        Apply the first queued premove of the side to move, without charging clock time.
+
+        If the premove is illegal in the actual position, the whole queue is dropped:
+        the remaining premoves were planned for a line that didn't happen.
+
+        Returns:
+            tuple: (applied UCI move or None, list of cancelled UCI moves)
+        """
+        if self.chess_game.is_game_over():
+            return None, []
+
+        color = "white" if self.chess_game.board.turn == chess.WHITE else "black"
+        queue = self.premoves.get(color)
+        if not queue:
+            return None, []
+
+        uci_move = queue.pop(0)
+        player_id = self.chess_game.players[color]
+        if self.chess_game.is_legal_uci(uci_move) and \
+                self.chess_game.make_move(uci_move, player_id, charge_time=False):
+            print(f"Premove applied for {color} in game {self.game_id}: {uci_move}")
+            get_featured_index().update(self)
+            get_replication_publisher().move_made(self, uci_move)
+            return uci_move, []
+
+        cancelled = [uci_move] + queue
+        queue.clear()
+        print(f"Premoves cancelled for {color} in game {self.game_id}: {cancelled}")
+        return None, cancelled
+
+    async def _send_premove_result(self, premove_applied, premoves_cancelled):
+        """
+        Tell the premoving player what happened to their queue.
+
+        Args:
+            premove_applied: The premove that was played (UCI string), or None
+            premoves_cancelled: List of premoves dropped because they became illegal
+        """
+        # A played premove belongs to the side that just moved, a cancelled one to the side to move
+        if premove_applied:
+            color = "black" if self.chess_game.board.turn == chess.WHITE else "white"
+        else:
+            color = "white" if self.chess_game.board.turn == chess.WHITE else "black"
+
+        for client, client_color in self.player_map.items():
+            if client_color != color or client not in self.clients:
+                continue
+            try:
+                if premove_applied:
+                    confirmation = self._build_move_confirmation(premove_applied)
+                    confirmation["premove"] = True
+                    confirmation["premoves"] = list(self.premoves.get(color, ()))
+                    await send_message(client, confirmation)
                 else:
-                    # Fall back to the exact move timestamp if available
-                    if self.chess_game.exact_move_timestamp is not None:
-                        time_elapsed_current_turn = current_time - self.chess_game.exact_move_timestamp
-                        print(f"Using exact move timestamp for time elapsed: {time_elapsed_current_turn:.2f}s")
-
-                print(f"Using STORED time values for calculation:")
-                print(f"  stored_white_time: {time_white_at_last_move:.2f}s")
-                print(f"  stored_black_time: {time_black_at_last_move:.2f}s")
-                print(f"  time_elapsed_current_turn: {time_elapsed_current_turn:.2f}s")
-            elif hasattr(self.chess_game, 'exact_time_white_at_move') and \
-                 hasattr(self.chess_game, 'exact_time_black_at_move') and \
-                 hasattr(self.chess_game, 'exact_move_timestamp') and \
-                 self.chess_game.exact_move_timestamp is not None:
-                # Fall back to the exact time values if stored values aren't available
-                time_white_at_last_move = self.chess_game.exact_time_white_at_move
-                time_black_at_last_move = self.chess_game.exact_time_black_at_move
-
-                # Calculate time elapsed since the exact move timestamp
-                if self.chess_game.exact_move_timestamp is not None:
-                    time_elapsed_current_turn = current_time - self.chess_game.exact_move_timestamp
-
-                print(f"Using EXACT time values for calculation:")
-                print(f"  exact_time_white_at_move: {time_white_at_last_move:.2f}s")
-                print(f"  exact_time_black_at_move: {time_black_at_last_move:.2f}s")
-                print(f"  exact_move_timestamp: {self.chess_game.exact_move_timestamp}")
-                print(f"  current_time: {current_time}")
-                print(f"  time_elapsed_current_turn: {time_elapsed_current_turn:.2f}s")
-            else:
-                # Fall back to the time_at_last_move values if exact values aren't available
-                time_white_at_last_move = getattr(self.chess_game, 'time_at_last_move_white', self.chess_game.time_white)
-                time_black_at_last_move = getattr(self.chess_game, 'time_at_last_move_black', self.chess_game.time_black)
+                    await send_message(client, {
+                        "type": "premoves_cancelled",
+                        "game_id": self.game_id,
+                        "moves": premoves_cancelled,
+                        "reason": "illegal"
+                    })
+            except Exception as e:
+                print(f"Error sending premove result: {str(e)}")
 
-                print(f"Using FALLBACK time values for calculation:")
-                print(f"  time_white_at_last_move: {time_white_at_last_move:.2f}s")
-                print(f"  time_black_at_last_move: {time_black_at_last_move:.2f}s")
-                print(f"  time_elapsed_current_turn: {time_elapsed_current_turn:.2f}s")
+    async def handle_adjudication_request(self, websocket):
+        """
+        Record a player's agreement to end the game by tablebase adjudication.
+        The game ends once both players have agreed on the same position.
 
-            # Log the time elapsed for debugging
-            print(f"Time elapsed since last move: {time_elapsed_current_turn:.2f}s")
+        Args:
+            websocket: The WebSocket connection of the requesting player
+        """
+        player_color = self.player_map.get(websocket)
+        if player_color is None or self.chess_game.is_game_over():
+            await send_message(websocket, {
+                "type": "error",
+                "message": "Adjudication is only available to players of an ongoing game"
+            })
+            return
 
-            # We no longer limit the time elapsed to allow for accurate time tracking
-            # This ensures the timer counts down correctly regardless of how much time passes
+        board = self.chess_game.board
+        ply = board.ply()
+        probe = await get_tablebase().probe(board)
 
-            # Get the current turn
-            current_turn = self.chess_game.board.turn
+        # The position may have changed while the probe was running
+        if board.ply() != ply or self.chess_game.is_game_over():
+            return
 
-            # Log the current turn for debugging
-            print(f"Current turn for time calculation: {'WHITE' if current_turn else 'BLACK'}")
+        if probe is None:
+            await send_message(websocket, {
+                "type": "error",
+                "message": "This position can't be adjudicated by the tablebase"
+            })
+            return
 
-            # Simply use the current time values from the chess game
-            # These are already updated in real-time by the timer loop
-            time_white = self.chess_game.time_white
-            time_black = self.chess_game.time_black
+        # Agreements only count for the position they were made in
+        if self.adjudication_ply != ply:
+            self.adjudication_votes = set()
+            self.adjudication_ply = ply
+        self.adjudication_votes.add(player_color)
+
+        result = result_from_probe(board, probe)
+        print(f"Adjudication requested by {player_color} in game {self.game_id}: {result}")
+
+        if len(self.adjudication_votes) < 2:
+            # Ask the opponent to agree
+            for client, color in self.player_map.items():
+                if color != player_color and client in self.clients:
+                    try:
+                        await send_message(client, {
+                            "type": "adjudication_requested",
+                            "game_id": self.game_id,
+                            "requested_by": player_color,
+                            "expected_result": result
+                        })
+                    except Exception as e:
+                        print(f"Error sending adjudication request: {str(e)}")
+            return
 
-            print(f"Broadcasting current times - White: {time_white:.2f}s, Black: {time_black:.2f}s")
+        self.chess_game.adjudicate(result)
+        await self.broadcast_game_state()
+        await self.broadcast_game_over(result)
 
-            # Log detailed time calculations
-            print(f"TIME CALCULATION:")
-            print(f"  Current time: {current_time:.3f}")
-            print(f"  Last move timestamp: {self.chess_game.last_move_timestamp:.3f}")
-            print(f"  Time elapsed: {time_elapsed_current_turn:.3f}s")
-            print(f"  White time at last move: {time_white_at_last_move:.2f}s")
-            print(f"  Black time at last move: {time_black_at_last_move:.2f}s")
-            print(f"  White time now: {time_white:.2f}s")
-            print(f"  Black time now: {time_black:.2f}s")
-            print(f"  Current turn: {self.chess_game.get_turn_color_string()}")
+    async def handle_tablebase_probe(self, websocket):
+        """
+        Send the exact tablebase evaluation of the current position to the requester.
+        Only available once the game is over, for post-game analysis.
 
-            # Log the calculated times
-            print(f"Broadcasting times - White: {time_white:.1f}s, Black: {time_black:.1f}s, Turn: {self.chess_game.get_turn_color_string()}")
+        Args:
+            websocket: The WebSocket connection of the requester
+        """
+        if not self.chess_game.is_game_over():
+            await send_message(websocket, {
+                "type": "error",
+                "message": "Tablebase evaluation is only available after the game"
+            })
+            return
 
-            # CRITICAL FIX: Get the current turn as a string for the client
-            # Make sure we're using the most up-to-date turn information
-            current_turn_string = self.chess_game.get_turn_color_string()
+        probe = await get_tablebase().probe(self.chess_game.board)
+        await send_message(websocket, {
+            "type": "tablebase_result",
+            "game_id": self.game_id,
+            "fen": self.chess_game.get_board_fen(),
+            "wdl": probe["wdl"] if probe else None,
+            "dtz": probe["dtz"] if probe else None
+        })
 
-            # Log detailed turn information
-            print(f"TURN INFORMATION FOR BROADCAST:")
-            print(f"  Raw board.turn value: {self.chess_game.board.turn}")
-            print(f"  Turn string for client: {current_turn_string}")
-            print(f"  FEN: {self.chess_game.get_board_fen()}")
+    def _player_latency(self, color):
+        """
+        Get the capped one-way latency estimate of the player with the given color.
+
+        Args:
+            color: 'white' or 'black'
+
+        Returns:
+            float or None: Seconds, or None if the player hasn't been measured
+        """
+        for client, client_color in self.player_map.items():
+            if client_color == color:
+                return get_one_way_latency(id(client))
+        return None
+
+    def _players_synced(self):
+        """Return True if every connected player has a latency estimate."""
+        return all(get_one_way_latency(id(client)) is not None for client in self.clients)
+
+    def get_latency_info(self):
+        """
+        Get the per-player latency metric.
 
-            # CRITICAL FIX: Prepare state dictionary with more detailed information
-            state = {
+        Returns:
+            dict: Maps 'white'/'black' -> smoothed round-trip time in ms (None if unknown)
+        """
+        latency_info = {'white': None, 'black': None}
+        for client, color in self.player_map.items():
+            tracker = LATENCY_TRACKERS.get(id(client))
+            if tracker is not None:
+                latency_info[color] = tracker.to_metric()["rtt_ms"]
+        return latency_info
+
+    def _get_state_snapshot(self):
+        """
+        Get the parts of the game state that only change when the position or result changes.
+
+        The snapshot is cached and rebuilt only when the game's version changes.
+
+        Returns:
+            dict: The cached snapshot (don't modify it)
+        """
+        version = self.chess_game.version
+        if self._state_snapshot is None or self._state_snapshot_version != version:
+            snapshot = {
                 "type": "game_update",
                 "game_id": self.game_id,
                 "fen": self.chess_game.get_board_fen(),
-                "turn": current_turn_string,
+                "turn": self.chess_game.get_turn_color_string(),
                 "is_game_over": self.chess_game.is_game_over(),
-                "time_white": time_white,
-                "time_black": time_black,
-                "timestamp": int(time.time() * 1000),  # Add timestamp for synchronization
-                "time_elapsed": time_elapsed_current_turn,  # Add time elapsed for debugging
                 "board_turn_raw": self.chess_game.board.turn,  # Add raw turn value for debugging
                 "is_capture": self.chess_game.last_move_was_capture,  # Add capture information
-                "captured_piece": self.chess_game.captured_piece  # Add captured piece information
+                "captured_piece": self.chess_game.captured_piece,  # Add captured piece information
+                "in_book": self.chess_game.in_book,  # Whether the position is still in the opening book
+                "opening": self.chess_game.get_opening()  # Current ECO code and opening name
             }
+            if snapshot["is_game_over"]:
+                result = self.chess_game.get_game_result()
+                if result:
+                    snapshot["result"] = result
+
+            self._state_snapshot = snapshot
+            self._state_snapshot_version = version
+        return self._state_snapshot
+
+    def _build_game_state(self, last_move=None):
+        """
+        Build a game_update message: the cached snapshot plus the current clock values.
 
-            # Add last move if provided
+        Args:
+            last_move: The last move made (UCI string)
+
+        Returns:
+            dict: The game_update message
+        """
+        # Compute both clocks from the same instant
+        clock = self.chess_game.clock
+        now = clock.now_fn()
+
+        state = dict(self._get_state_snapshot())
+        state["time_white"] = clock.display_time(chess.WHITE, now)
+        state["time_black"] = clock.display_time(chess.BLACK, now)
+        state["timestamp"] = int(time.time() * 1000)  # Add timestamp for synchronization
+        state["time_elapsed"] = clock.elapsed(now)  # Time used so far in the current turn
+        state["latency"] = self.get_latency_info()  # Per-player round-trip time in ms
+
+        # Add last move if provided
+        if last_move:
+            state["last_move"] = last_move
+        return state
+
+    def send_game_state(self, websocket, include_legal_moves=True):
+        """
+        Answer a request_game_state from a single client.
+
+        Requests arriving in the same event-loop tick are merged: the state is
+        built and encoded once and sent to each requester only (not broadcast).
+
+        Args:
+            websocket: The WebSocket connection of the requester
+            include_legal_moves: Include the legal move map if the requester is the side to move
+        """
+        self._state_requests[websocket] = self._state_requests.get(websocket, False) or include_legal_moves
+        if self._state_reply_task is None:
+            self._state_reply_task = asyncio.create_task(self._reply_state_requests())
+
+    async def _reply_state_requests(self):
+        """Send one shared snapshot to every client that requested the state in this tick."""
+        # Let the other requests of this loop tick join
+        await asyncio.sleep(0)
+        requests, self._state_requests = self._state_requests, {}
+        self._state_reply_task = None
+
+        try:
+            state = self._build_game_state()
+            state_frame = Frame(state)
+            mover_frame = None
+            released_frame = None
+
+            for websocket, include_legal_moves in requests.items():
+                frame = state_frame
+                if self.spectator_stream is not None and websocket in self.spectators:
+                    # Delayed spectators get the latest released frame, not the live state
+                    if released_frame is None:
+                        released_frame = Frame(text=self.spectator_stream.released_json)
+                    frame = released_frame
+                elif include_legal_moves and SEND_LEGAL_MOVE_HINTS and not state["is_game_over"] and \
+                        self.player_map.get(websocket) == state["turn"]:
+                    if mover_frame is None:
+                        mover_frame = Frame({**state, "legal_moves": self.chess_game.get_legal_move_map()})
+                        self._legal_moves_sent_ply = self.chess_game.board.ply()
+                    frame = mover_frame
+
+                try:
+                    await websocket.send(frame.for_connection(websocket))
+                except Exception as e:
+                    print(f"Error sending game state to client {id(websocket)}: {str(e)}")
+
+            print(f"Sent game state snapshot to {len(requests)} requester(s) in game {self.game_id}")
+        except Exception as e:
+            print(f"Error replying to game state requests: {str(e)}")
+
+    async def broadcast_game_state(self, last_move=None, include_legal_moves=False):
+        """
+        Broadcast the current game state to all clients and spectators.
+
+        The side to move also receives the legal move map of the position, once per ply.
+
+        Args:
+            last_move: The last move made (UCI string)
+            include_legal_moves: Send the legal move map again even if it was already sent for this ply
+        """
+        try:
+            # CRITICAL FIX: Log the current board state and turn
+            print(f"BROADCASTING GAME STATE:")
+            print(f"  Current FEN: {self.chess_game.get_board_fen()}")
+            print(f"  Raw board.turn value: {self.chess_game.board.turn}")
             if last_move:
-                state["last_move"] = last_move
-                print(f"Including last move in broadcast: {last_move}")
+                print(f"  Last move: {last_move}")
 
-            # Add result if game is over
-            if self.chess_game.is_game_over():
-                result = self.chess_game.get_game_result()
-                if result:
-                    state["result"] = result
-                    print(f"Game is over, including result: {result}")
+            state = self._build_game_state(last_move)
+            current_turn_string = state["turn"]
+            time_white = state["time_white"]
+            time_black = state["time_black"]
 
-            # Convert to JSON
-            state_json = json.dumps(state)
+            print(f"Broadcasting times - White: {time_white:.1f}s, Black: {time_black:.1f}s, Elapsed: {state['time_elapsed']:.2f}s")
+            print(f"  Turn string for client: {current_turn_string}")
+            if "result" in state:
+                print(f"Game is over, including result: {state['result']}")
+
+            # Encoded once per wire format in use
+            state_frame = Frame(state)
+
+            # The side to move gets the legal move map once per ply (or on request)
+            mover_websocket = None
+            mover_frame = state_frame
+            ply = self.chess_game.board.ply()
+            if SEND_LEGAL_MOVE_HINTS and not self.chess_game.is_game_over() and \
+                    (include_legal_moves or self._legal_moves_sent_ply != ply):
+                for client, color in self.player_map.items():
+                    if color == current_turn_string and client in self.clients:
+                        mover_websocket = client
+                        mover_frame = Frame({**state, "legal_moves": self.chess_game.get_legal_move_map()})
+                        self._legal_moves_sent_ply = ply
+                        break
 
             print(f"Broadcasting game state: {state}")
             print(f"CRITICAL - Turn being sent to clients: {current_turn_string}")
             print(f"CRITICAL - Times being sent to clients - White: {time_white:.2f}s, Black: {time_black:.2f}s")
-            print(f"CRITICAL - Time elapsed since last move: {time_elapsed_current_turn:.2f}s")
 
             # CRITICAL FIX: Count clients before sending
             print(f"Number of clients to broadcast to: {len(self.clients)}")
@@ -479,7 +835,8 @@ class GameSession:
             clients_to_remove = []
             for client in self.clients:
                 try:
-                    await client.send(state_json)
+                    frame = mover_frame if client is mover_websocket else state_frame
+                    await client.send(frame.for_connection(client))
                     print(f"Sent game state to client {id(client)}")
                 except Exception as e:
                     print(f"Error sending game state to client: {str(e)}")
@@ -491,23 +848,15 @@ class GameSession:
                     self.clients.remove(client)
                     print(f"Removed client {id(client)} due to send failure")
 
-            spectators_to_remove = []
-            for spectator in self.spectators:
-                try:
-                    await spectator.send(state_json)
-                    print(f"Sent game state to spectator {id(spectator)}")
-                except Exception as e:
-                    print(f"Error sending game state to spectator: {str(e)}")
-                    spectators_to_remove.append(spectator)
-
-            # Remove spectators that couldn't receive the message
-            for spectator in spectators_to_remove:
-                if spectator in self.spectators:
-                    self.spectators.remove(spectator)
-                    print(f"Removed spectator {id(spectator)} due to send failure")
+            if self.spectator_stream is not None:
+                # Spectators get the same frame later, from the delayed stream
+                get_delayed_broadcaster().push(self.spectator_stream, self.chess_game.board.ply(), state_frame.text, state)
+            else:
+                get_tv_channel().publish(self.game_id, state)
+                await self.send_to_spectators([state_frame.text])
 
             # CRITICAL FIX: Log successful broadcast
-            print(f"Successfully broadcast game state to {len(self.clients) - len(clients_to_remove)} clients and {len(self.spectators) - len(spectators_to_remove)} spectators")
+            print(f"Successfully broadcast game state to {len(self.clients) - len(clients_to_remove)} clients and {len(self.spectators)} spectators")
 
         except Exception as e:
             print(f"Error broadcasting game state: {str(e)}")
@@ -522,11 +871,19 @@ class GameSession:
             result: Game result dictionary from chess_game.get_game_result()
         """
         try:
+            # Finished games are no longer featured, nor replicated, and are dropped after their post-game time
+            get_featured_index().discard(self.game_id)
+            get_replication_publisher().game_ended(self)
+            get_session_reaper().game_over(self)
+
             # Cancel the timer task if it's still running
             if self._timer_task and not self._timer_task.done():
                 print(f"Cancelling timer task for game {self.game_id}")
                 self._timer_task.cancel()
 
+            # Freeze both clocks at their final values
+            self.chess_game.stop_clock()
+
             # Create the game over message
             game_over_message = {
                 "type": "game_over",
@@ -534,7 +891,8 @@ class GameSession:
                 "result": result["outcome"],
                 "winner": result.get("winner"),
                 "final_time_white": self.chess_game.time_white,
-                "final_time_black": self.chess_game.time_black
+                "final_time_black": self.chess_game.time_black,
+                "opening": self.chess_game.get_opening()
             }
 
             # Add detailed information based on the outcome
@@ -549,6 +907,14 @@ class GameSession:
                 game_over_message["details"] = "Draw by 75-move rule. 75 moves have been made without a pawn move or capture."
             elif result["outcome"] == "draw_fivefold_repetition":
                 game_over_message["details"] = "Draw by fivefold repetition. The same position has occurred five times."
+            elif result["outcome"] == "tablebase_win":
+                winner_color = result.get("winner", "unknown")
+                game_over_message["details"] = f"{winner_color.capitalize()} wins by tablebase adjudication."
+            elif result["outcome"] == "tablebase_draw":
+                game_over_message["details"] = "Draw by tablebase adjudication. Neither side can force a win."
+            elif result["outcome"] == "aborted":
+                game_over_message["aborted_by"] = result["aborted_by"]
+                game_over_message["details"] = f"Game aborted: {result['aborted_by'].capitalize()} didn't make a first move in time."
 
             # Add additional information for timeout
             if result["outcome"] == "timeout":
@@ -556,13 +922,8 @@ class GameSession:
                 game_over_message["timed_out_player"] = timed_out_color
                 print(f"Game over due to timeout of {timed_out_color} player")
 
-                # Set the timed out player's time to exactly 0 for display purposes
-                if timed_out_color == "white":
-                    self.chess_game.time_white = 0
-                    game_over_message["final_time_white"] = 0
-                else:
-                    self.chess_game.time_black = 0
-                    game_over_message["final_time_black"] = 0
+                # The timed out player's time is exactly 0 for display purposes
+                game_over_message[f"final_time_{timed_out_color}"] = 0
 
                 # Add detailed information about the timeout
                 game_over_message["details"] = f"{timed_out_color.capitalize()} player ran out of time. {result['winner'].capitalize()} wins by timeout."
@@ -585,7 +946,7 @@ class GameSession:
                 # CRITICAL FIX: Log the complete game_over_message
                 print(f"CRITICAL: Complete game_over_message: {game_over_message}")
 
-            game_over_json = json.dumps(game_over_message)
+            game_over_frame = Frame(game_over_message)
 
             print(f"Broadcasting game over: {game_over_message}")
 
@@ -593,7 +954,7 @@ class GameSession:
             clients_to_remove = []
             for client in self.clients:
                 try:
-                    await client.send(game_over_json)
+                    await client.send(game_over_frame.for_connection(client))
                     print(f"Sent game over to client {id(client)}")
                 except Exception as e:
                     print(f"Error sending game over to client: {str(e)}")
@@ -605,20 +966,13 @@ class GameSession:
                     self.clients.remove(client)
                     print(f"Removed client {id(client)} due to send failure")
 
-            spectators_to_remove = []
-            for spectator in self.spectators:
-                try:
-                    await spectator.send(game_over_json)
-                    print(f"Sent game over to spectator {id(spectator)}")
-                except Exception as e:
-                    print(f"Error sending game over to spectator: {str(e)}")
-                    spectators_to_remove.append(spectator)
-
-            # Remove spectators that couldn't receive the message
-            for spectator in spectators_to_remove:
-                if spectator in self.spectators:
-                    self.spectators.remove(spectator)
-                    print(f"Removed spectator {id(spectator)} due to send failure")
+            if self.spectator_stream is not None:
+                # The result reaches delayed spectators after the final moves
+                self.spectator_stream.finish()
+                get_delayed_broadcaster().push(self.spectator_stream, self.chess_game.board.ply(), game_over_frame.text,
+                                               result=result)
+            else:
+                await self.send_to_spectators([game_over_frame.text])
 
             print(f"Game over broadcast complete for game {self.game_id}")
 
@@ -627,7 +981,8 @@ class GameSession:
             import traceback
             traceback.print_exc()
 
-    async def broadcast_chat_message(self, sender, text, sender_websocket=None, username=None, sender_client_id=None):
+    async def broadcast_chat_message(self, sender, text, sender_websocket=None, username=None, sender_client_id=None,
+                                     relay_sender=None):
         """
         Broadcast chat message to all clients and spectators.
 
@@ -637,6 +992,7 @@ class GameSession:
             sender_websocket: The WebSocket connection of the sender (can be None to send to all)
             username: The username of the sender (if provided)
             sender_client_id: The client ID of the sender (if different from sender_websocket)
+            relay_sender: Relay token of the sender, if it is a spectator held by a relay
         """
         # Import CLIENT_USERNAMES from server.py
         from server import CLIENT_USERNAMES
@@ -687,80 +1043,38 @@ class GameSession:
             # For debugging
             print(f"Chat message from {sender} (display as {display_sender})")
 
-            # Create a unique message ID
-            message_id = f"{int(time.time() * 1000)}-{id(self)}-{client_id or 0}"
+            # Store the message in the room's history, which assigns its message ID
+            record = self.chat_history.append(int(time.time() * 1000), display_sender, original_sender, client_id, text)
+            message_id = record.message_id
 
             # Create the chat message
-            chat_message = {
-                "type": "chat_update",  # IMPORTANT: Must be 'chat_update' to match working implementation
-                "sender": display_sender,
-                "text": text,
-                "game_id": self.game_id,
-                "timestamp": int(time.time() * 1000),  # Add timestamp for message ordering
-                "original_sender": display_sender,  # Use display_sender (username) for client-side identification
-                "sender_role": original_sender,  # Include the sender's role (white, black, or spectator)
-                "sender_id": client_id,  # Include the client ID for filtering on the client side
-                "message_id": message_id,  # Add a unique message ID
-                "username": display_sender  # Include the username explicitly
-            }
+            chat_message = record.to_message(self.game_id)
 
             # Log the chat message for debugging
             print(f"Formatted chat message: {chat_message}")
 
-            # Store the message in our tracking dictionary
+            # Track messages awaiting a response
             if client_id is not None:
-                # Store the message
-                self.chat_messages[message_id] = chat_message
-
-                # Check if this is a new message or a response to previous messages
-                is_response = False
-
-                # Check if there are any pending messages from other players
-                for other_id, pending_msgs in self.pending_responses.items():
-                    if other_id != client_id and pending_msgs:
-                        # This is a response to another player's message
-                        is_response = True
-                        print(f"Message from {client_id} is a response to pending messages from {other_id}")
-                        # We don't remove the pending messages here because multiple players might need to respond
-                        break
+                # The message is a response if any other player has messages awaiting one
+                is_response = len(self.pending_responses) > (1 if client_id in self.pending_responses else 0)
 
                 # Update the last message time for this player
                 self.player_last_message_time[client_id] = chat_message["timestamp"]
 
-                # If this is a new message (not a response), add it to pending responses
                 if not is_response:
-                    # Initialize the pending responses list for this sender if it doesn't exist
-                    if client_id not in self.pending_responses:
-                        self.pending_responses[client_id] = []
-
-                    # Add this message to the pending responses list
-                    self.pending_responses[client_id].append(message_id)
+                    # New message: wait for a response, deleting it if none comes in time
+                    self.pending_responses.setdefault(client_id, deque()).append((message_id, record.timestamp))
+                    self.pending_message_sender[message_id] = client_id
+                    get_chat_expiry().schedule(self, client_id, message_id)
                     print(f"Added message {message_id} to pending responses for sender {client_id}")
                 else:
-                    # This is a response, so we can clear pending messages from other players
-                    # that are older than this response
-                    for other_id in list(self.pending_responses.keys()):
-                        if other_id != client_id:
-                            # Get the pending messages for this other player
-                            pending_msgs = self.pending_responses[other_id]
-
-                            # Remove messages that have been responded to
-                            # (i.e., messages that are older than this response)
-                            msgs_to_remove = []
-                            for pending_msg_id in pending_msgs[:]:
-                                if pending_msg_id in self.chat_messages:
-                                    pending_msg = self.chat_messages[pending_msg_id]
-                                    if pending_msg["timestamp"] < chat_message["timestamp"]:
-                                        # This pending message has been responded to
-                                        msgs_to_remove.append(pending_msg_id)
-                                        pending_msgs.remove(pending_msg_id)
-
-                            # If we removed all pending messages for this player, remove the player from pending_responses
-                            if not pending_msgs:
-                                del self.pending_responses[other_id]
-                                print(f"Removed all pending messages for sender {other_id}")
-
-            chat_json = json.dumps(chat_message)
+                    # Response: every other player's pending messages have been answered
+                    for other_id in [other_id for other_id in self.pending_responses if other_id != client_id]:
+                        for pending_msg_id, _ in self.pending_responses.pop(other_id):
+                            self.pending_message_sender.pop(pending_msg_id, None)
+                        print(f"Removed all pending messages for sender {other_id}")
+
+            chat_frame = Frame(chat_message)
 
             print(f"Broadcasting chat message: {chat_message}")
             print(f"Number of clients: {len(self.clients)}, Number of spectators: {len(self.spectators)}")
@@ -785,7 +1099,7 @@ class GameSession:
 
                     client_id = id(client)
                     print(f"Sending chat message to client {client_id}")
-                    await client.send(chat_json)
+                    await client.send(chat_frame.for_connection(client))
                     print(f"Successfully sent chat message to client {client_id}")
                 except Exception as e:
                     print(f"Error sending chat message to client: {str(e)}")
@@ -817,7 +1131,7 @@ class GameSession:
 
                     spectator_id = id(spectator)
                     print(f"Sending chat message to spectator {spectator_id}")
-                    await spectator.send(chat_json)
+                    await spectator.send(chat_frame.for_connection(spectator))
                     print(f"Successfully sent chat message to spectator {spectator_id}")
                 except Exception as e:
                     print(f"Error sending chat message to spectator: {str(e)}")
@@ -829,6 +1143,9 @@ class GameSession:
                     self.spectators.remove(spectator)
                     print(f"Removed spectator {id(spectator)} due to send failure")
 
+            # Spectators held by relays, ALWAYS excluding the sender
+            await self._publish_to_relays(chat_frame.text, relay_sender)
+
         except Exception as e:
             print(f"Error broadcasting chat message: {str(e)}")
             import traceback
@@ -850,29 +1167,9 @@ class GameSession:
             if player_color is not None:
                 player_color_str = "white" if player_color == True else "black"
 
-            # IMPORTANT FIX: Use the exact time values if available
-            # These are the most accurate values for time calculation
-            if hasattr(self.chess_game, 'exact_time_white_at_move') and hasattr(self.chess_game, 'exact_time_black_at_move'):
-                time_white = self.chess_game.exact_time_white_at_move
-                time_black = self.chess_game.exact_time_black_at_move
-                print(f"INITIAL STATE: Using exact time values")
-            else:
-                # Fall back to the time_at_last_move values if exact values aren't available
-                time_white = getattr(self.chess_game, 'time_at_last_move_white', self.chess_game.time_white)
-                time_black = getattr(self.chess_game, 'time_at_last_move_black', self.chess_game.time_black)
-                print(f"INITIAL STATE: Using fallback time values")
-
-            # Calculate current time values based on elapsed time since last move
-            current_time = asyncio.get_event_loop().time()
-            if hasattr(self.chess_game, 'exact_move_timestamp') and self.chess_game.exact_move_timestamp is not None:
-                time_elapsed = current_time - self.chess_game.exact_move_timestamp
-                print(f"INITIAL STATE: Time elapsed since last move: {time_elapsed:.2f}s")
-
-                # Update the time for the current player
-                if self.chess_game.board.turn == True:  # White's turn
-                    time_white = max(0, time_white - time_elapsed)
-                else:  # Black's turn
-                    time_black = max(0, time_black - time_elapsed)
+            # Current remaining times from the clock
+            time_white = self.chess_game.time_white
+            time_black = self.chess_game.time_black
 
             # Log the time values for debugging
             print(f"INITIAL STATE TIME VALUES:")
@@ -887,20 +1184,91 @@ class GameSession:
                 "fen": self.chess_game.get_board_fen(),
                 "turn": self.chess_game.get_turn_color_string(),
                 "time_white": time_white,
-                "time_black": time_black
+                "time_black": time_black,
+                "time_control": self.chess_game.time_control.to_spec()
             }
 
             # Add player color if this is a player
             if player_color_str:
                 initial_state["color"] = player_color_str
+                # Lets the player take their seat back on a new connection
+                initial_state["resume_token"] = self.resume_tokens[player_color_str]
+                if self.awaiting_resume:
+                    initial_state["waiting_for"] = sorted(self.awaiting_resume)
+
+                # The side to move also gets the legal moves of the starting position
+                if SEND_LEGAL_MOVE_HINTS and player_color == self.chess_game.board.turn:
+                    initial_state["legal_moves"] = self.chess_game.get_legal_move_map()
 
             print(f"Sending initial state to player {player_id}: {initial_state}")
 
-            await websocket.send(json.dumps(initial_state))
+            await send_message(websocket, initial_state)
 
         except Exception as e:
             print(f"Error sending initial state: {str(e)}")
 
+    def restore(self):
+        """
+        Bring up a session restored from a replica after a failover.
+
+        The game can be watched right away, but its clock stays stopped until
+        both players have resumed it (see resume_player).
+        """
+        self.awaiting_resume = {'white', 'black'}
+        get_featured_index().update(self)
+        get_message_bus().subscribe(self.spectator_topic, self._fan_out_to_spectators)
+        get_message_bus().subscribe(self.relay_topic, self._on_relay_event)
+
+    async def resume_player(self, websocket, token):
+        """
+        Seat a player who presents their resume token on a new connection.
+
+        Args:
+            websocket: The player's new WebSocket connection
+            token: The resume token the player received in game_start
+
+        Returns:
+            str or None: The player's color, or None if the token doesn't match
+        """
+        if not isinstance(token, str) or self.chess_game.is_game_over():
+            return None
+        color = None
+        for candidate, resume_token in self.resume_tokens.items():
+            if hmac.compare_digest(resume_token, token):
+                color = candidate
+        if color is None:
+            return None
+
+        # Replace the player's previous connection, if any
+        for client, client_color in list(self.player_map.items()):
+            if client_color == color:
+                del self.player_map[client]
+                self.clients.discard(client)
+        chess_color = chess.WHITE if color == 'white' else chess.BLACK
+        for player_id, player_color in list(self.chess_game.player_colors.items()):
+            if player_color == chess_color:
+                del self.chess_game.player_colors[player_id]
+        self.chess_game.players[color] = None
+        self.chess_game.assign_player(id(websocket), color)
+        self.clients.add(websocket)
+        self.player_map[websocket] = color
+        if color in self.awaiting_resume:
+            self.awaiting_resume.discard(color)
+        self.disconnected_at.pop(color, None)
+        print(f"Player {id(websocket)} resumed {color} in game {self.game_id}")
+
+        await self.send_initial_state(websocket)
+        await self.send_chat_history(websocket)
+
+        if not self.awaiting_resume and self._timer_task is None:
+            # Both players are back: the clock runs again from where it stopped
+            self.chess_game.start_clock()
+            get_replication_publisher().game_started(self)
+            self._timer_task = asyncio.create_task(self._timer_loop())
+            get_session_reaper().game_started(self)
+            await self.broadcast_game_state(include_legal_moves=True)
+        return color
+
     async def add_spectator(self, websocket):
         """
         Add a spectator to the game.
@@ -909,56 +1277,141 @@ class GameSession:
             websocket: The WebSocket connection for the spectator
         """
         try:
+            if not self.spectators:
+                self.spectators = set()
             self.spectators.add(websocket)
+            get_featured_index().update(self)
 
-            # IMPORTANT FIX: Use the exact time values if available
-            # These are the most accurate values for time calculation
-            if hasattr(self.chess_game, 'exact_time_white_at_move') and hasattr(self.chess_game, 'exact_time_black_at_move'):
-                time_white = self.chess_game.exact_time_white_at_move
-                time_black = self.chess_game.exact_time_black_at_move
-                print(f"SPECTATOR INFO: Using exact time values")
-            else:
-                # Fall back to the time_at_last_move values if exact values aren't available
-                time_white = getattr(self.chess_game, 'time_at_last_move_white', self.chess_game.time_white)
-                time_black = getattr(self.chess_game, 'time_at_last_move_black', self.chess_game.time_black)
-                print(f"SPECTATOR INFO: Using fallback time values")
+            print(f"Adding spectator {id(websocket)}")
+            for frame in self.build_spectator_intro():
+                await websocket.send(frame.for_connection(websocket))
 
-            # Calculate current time values based on elapsed time since last move
-            current_time = asyncio.get_event_loop().time()
-            if hasattr(self.chess_game, 'exact_move_timestamp') and self.chess_game.exact_move_timestamp is not None:
-                time_elapsed = current_time - self.chess_game.exact_move_timestamp
-                print(f"SPECTATOR INFO: Time elapsed since last move: {time_elapsed:.2f}s")
-
-                # Update the time for the current player
-                if self.chess_game.board.turn == True:  # White's turn
-                    time_white = max(0, time_white - time_elapsed)
-                else:  # Black's turn
-                    time_black = max(0, time_black - time_elapsed)
+        except Exception as e:
+            print(f"Error adding spectator: {str(e)}")
+            if websocket in self.spectators:
+                self.spectators.remove(websocket)
 
-            # Log the time values for debugging
-            print(f"SPECTATOR INFO TIME VALUES:")
-            print(f"  time_white: {time_white:.2f}s")
-            print(f"  time_black: {time_black:.2f}s")
-            print(f"  current turn: {self.chess_game.get_turn_color_string()}")
+    def build_spectator_intro(self):
+        """
+        Build the frames a new spectator receives: spectate_info and the recent chat.
 
-            # Send spectate info
-            spectate_info = {
-                "type": "spectate_info",
-                "game_id": self.game_id,
-                "fen": self.chess_game.get_board_fen(),
-                "turn": self.chess_game.get_turn_color_string(),
-                "time_white": time_white,
-                "time_black": time_black
+        Returns:
+            list: Frames, in order
+        """
+        # Current remaining times from the clock
+        time_white = self.chess_game.time_white
+        time_black = self.chess_game.time_black
+        fen = self.chess_game.get_board_fen()
+        turn = self.chess_game.get_turn_color_string()
+
+        # Delayed spectators start from the latest released position
+        if self.spectator_stream is not None:
+            released_state = self.spectator_stream.released_state
+            time_white = released_state["time_white"]
+            time_black = released_state["time_black"]
+            fen = released_state["fen"]
+            turn = released_state["turn"]
+
+        # Log the time values for debugging
+        print(f"SPECTATOR INFO TIME VALUES:")
+        print(f"  time_white: {time_white:.2f}s")
+        print(f"  time_black: {time_black:.2f}s")
+        print(f"  current turn: {turn}")
+
+        spectate_info = {
+            "type": "spectate_info",
+            "game_id": self.game_id,
+            "fen": fen,
+            "turn": turn,
+            "time_white": time_white,
+            "time_black": time_black,
+            "time_control": self.chess_game.time_control.to_spec()
+        }
+        if self.spectator_stream is not None:
+            spectate_info["spectator_delay"] = {
+                "seconds": self.spectator_stream.delay_seconds,
+                "plies": self.spectator_stream.delay_plies
             }
+        frames = [Frame(spectate_info)]
 
-            print(f"Adding spectator {id(websocket)}, sending: {spectate_info}")
+        # Backfill the recent chat in one frame
+        history = self._build_chat_history()
+        if history is not None:
+            frames.append(Frame(history))
+        return frames
 
-            await websocket.send(json.dumps(spectate_info))
+    async def send_chat_history(self, websocket, limit=CHAT_BACKFILL_SIZE):
+        """
+        Send the room's most recent chat messages to a client that just joined.
 
-        except Exception as e:
-            print(f"Error adding spectator: {str(e)}")
-            if websocket in self.spectators:
-                self.spectators.remove(websocket)
+        Args:
+            websocket: The WebSocket connection to send to
+            limit: Maximum number of messages to send
+        """
+        history = self._build_chat_history(limit)
+        if history is not None:
+            await send_message(websocket, history)
+
+    def _build_chat_history(self, limit=CHAT_BACKFILL_SIZE):
+        """Build the chat_history message of the most recent messages (None if there are none)."""
+        records = self.chat_history.recent(limit)
+        if not records:
+            return None
+        return {
+            "type": "chat_history",
+            "game_id": self.game_id,
+            "messages": [record.to_message(self.game_id) for record in records]
+        }
+
+    async def send_to_spectators(self, frames):
+        """
+        Publish already encoded frames to the game's spectators.
+
+        The frames go out on the game's spectator topic of the message bus; the
+        subscribed processes (this one included) send them to their spectators.
+
+        Args:
+            frames: List of encoded frames, oldest first
+        """
+        await get_message_bus().publish(self.spectator_topic, frames)
+
+        if self.spectator_stream is not None:
+            # TV viewers follow the delayed stream as well
+            get_tv_channel().publish(self.game_id, self.spectator_stream.released_state)
+            if self.closed and self.spectator_stream.next_due() is None:
+                get_message_bus().unsubscribe(self.spectator_topic, self._fan_out_to_spectators)
+
+    async def _fan_out_to_spectators(self, topic, frames):
+        """
+        Bus callback: send frames published on the spectator topic to this process's spectators.
+
+        Args:
+            topic: The spectator topic
+            frames: List of encoded frames, oldest first
+        """
+        frames = [Frame(text=frame) for frame in frames]
+        spectators_to_remove = []
+        for spectator in list(self.spectators):
+            try:
+                for frame in frames:
+                    await spectator.send(frame.for_connection(spectator))
+            except Exception as e:
+                print(f"Error sending frames to spectator: {str(e)}")
+                spectators_to_remove.append(spectator)
+
+        for spectator in spectators_to_remove:
+            self.spectators.discard(spectator)
+
+    def get_spectator_state(self):
+        """
+        Get the game state as spectators currently see it.
+
+        Returns:
+            dict: The latest released game_update in delay mode, else the live one
+        """
+        if self.spectator_stream is not None:
+            return self.spectator_stream.released_state
+        return self._build_game_state()
 
     def remove_spectator(self, websocket):
         """
@@ -969,67 +1422,42 @@ class GameSession:
         """
         if websocket in self.spectators:
             self.spectators.remove(websocket)
+            get_featured_index().update(self)
 
-    async def _chat_timer_loop(self):
+    def expire_chat_message(self, sender_id, message_id):
         """
-        Timer loop that checks for chat message timeouts.
-        Deletes messages that don't receive a response within 1 minute.
-        """
-        try:
-            while not self.chess_game.is_game_over():
-                # Sleep for a short time to avoid consuming too much CPU
-                await asyncio.sleep(1.0)  # Check every second
+        Called by the chat expiry scheduler when a message's response deadline has passed.
 
-                # Get current time
-                current_time = time.time()
+        If the message is still pending, it is deleted together with the sender's other
+        pending messages sent within the timeout window after it.
 
-                # Check for message timeouts
-                for sender_id, message_ids in list(self.pending_responses.items()):
-                    # Skip if no pending messages
-                    if not message_ids:
-                        continue
-
-                    # Get the timestamp of the first message in the list
-                    first_message_id = message_ids[0]
-                    if first_message_id not in self.chat_messages:
-                        # Message was already deleted, remove from pending list
-                        message_ids.pop(0)
-                        continue
+        Args:
+            sender_id: Client ID of the sender
+            message_id: ID of the expired message
 
-                    first_message = self.chat_messages[first_message_id]
-                    message_time = first_message.get('timestamp', 0) / 1000  # Convert from milliseconds
+        Returns:
+            coroutine or None: The deletion notification to run, or None if nothing expired
+        """
+        # Answered or already deleted messages are no longer indexed
+        if self.pending_message_sender.get(message_id) != sender_id or self.chess_game.is_game_over():
+            return None
 
-                    # Check if message is older than 1 minute
-                    if current_time - message_time > 60:  # 60 seconds = 1 minute
-                        print(f"Message timeout detected for sender {sender_id}, message ID {first_message_id}")
+        print(f"Message timeout detected for sender {sender_id}, message ID {message_id}")
 
-                        # Get all messages within the 1-minute window from this sender
-                        messages_to_delete = []
-                        for msg_id in message_ids[:]:
-                            if msg_id in self.chat_messages:
-                                msg = self.chat_messages[msg_id]
-                                msg_time = msg.get('timestamp', 0) / 1000
+        pending_msgs = self.pending_responses[sender_id]
+        window_end = pending_msgs[0][1] + CHAT_RESPONSE_TIMEOUT * 1000
 
-                                # If message is within the 1-minute window of the first message
-                                if message_time <= msg_time <= message_time + 60:
-                                    messages_to_delete.append(msg_id)
-                                    message_ids.remove(msg_id)
+        # Pending messages are in send order, so the window is a prefix of the deque
+        messages_to_delete = []
+        while pending_msgs and pending_msgs[0][1] <= window_end:
+            msg_id, _ = pending_msgs.popleft()
+            self.pending_message_sender.pop(msg_id, None)
+            messages_to_delete.append(msg_id)
 
-                        # Delete the messages
-                        if messages_to_delete:
-                            await self._delete_chat_messages(messages_to_delete, sender_id)
+        if not pending_msgs:
+            del self.pending_responses[sender_id]
 
-                # Clean up empty pending response lists
-                for sender_id in list(self.pending_responses.keys()):
-                    if not self.pending_responses[sender_id]:
-                        del self.pending_responses[sender_id]
-
-        except asyncio.CancelledError:
-            print(f"Chat timer loop cancelled for game {self.game_id}")
-        except Exception as e:
-            print(f"Error in chat timer loop: {str(e)}")
-            import traceback
-            traceback.print_exc()
+        return self._delete_chat_messages(messages_to_delete, sender_id)
 
     async def _delete_chat_messages(self, message_ids, sender_id):
         """
@@ -1045,11 +1473,11 @@ class GameSession:
         # Create a list of deleted messages for logging
         deleted_messages = []
 
-        # Remove messages from the chat_messages dictionary
+        # Remove messages from the chat history
         for msg_id in message_ids:
-            if msg_id in self.chat_messages:
-                deleted_messages.append(self.chat_messages[msg_id])
-                del self.chat_messages[msg_id]
+            record = self.chat_history.remove(msg_id)
+            if record is not None:
+                deleted_messages.append(record)
 
         print(f"Deleted {len(deleted_messages)} messages from sender {sender_id} due to timeout")
 
@@ -1064,13 +1492,13 @@ class GameSession:
         }
 
         # Send the deletion notification to all clients
-        deletion_json = json.dumps(deletion_message)
+        deletion_frame = Frame(deletion_message)
 
         # Send to all clients
         clients_to_remove = []
         for client in self.clients:
             try:
-                await client.send(deletion_json)
+                await client.send(deletion_frame.for_connection(client))
                 print(f"Sent deletion notification to client {id(client)}")
             except Exception as e:
                 print(f"Error sending deletion notification to client: {str(e)}")
@@ -1086,7 +1514,7 @@ class GameSession:
         spectators_to_remove = []
         for spectator in self.spectators:
             try:
-                await spectator.send(deletion_json)
+                await spectator.send(deletion_frame.for_connection(spectator))
                 print(f"Sent deletion notification to spectator {id(spectator)}")
             except Exception as e:
                 print(f"Error sending deletion notification to spectator: {str(e)}")
@@ -1098,6 +1526,43 @@ class GameSession:
                 self.spectators.remove(spectator)
                 print(f"Removed spectator {id(spectator)} due to send failure")
 
+        await self._publish_to_relays(deletion_frame.text)
+
+    def spectator_count(self):
+        """Return the number of spectators, including those held by relays."""
+        return len(self.spectators) + sum(self.relay_counts.values())
+
+    async def _publish_to_relays(self, frame, exclude=None):
+        """
+        Send a chat frame to the spectators held by relays.
+
+        Args:
+            frame: The encoded frame
+            exclude: Relay token of a spectator that must not receive it (the sender)
+        """
+        if self.relay_counts:
+            await get_message_bus().publish(self.spectator_chat_topic, {"frame": frame, "exclude": exclude})
+
+    async def _on_relay_event(self, topic, data):
+        """
+        Bus callback for events published by the relays holding spectators of this game.
+
+        Args:
+            topic: The game's relay topic
+            data: {"relay", "count"} when a relay's audience changed, or
+                {"relay", "chat": {"sender", "username", "text"}} for a relayed spectator's chat
+        """
+        if "count" in data:
+            if data["count"] > 0:
+                self.relay_counts[data["relay"]] = data["count"]
+            else:
+                self.relay_counts.pop(data["relay"], None)
+            get_featured_index().update(self)
+        elif "chat" in data:
+            chat = data["chat"]
+            await self.broadcast_chat_message("Spectator", chat.get("text", ""), None, chat.get("username"),
+                                              relay_sender=chat.get("sender"))
+
     async def close_session(self):
         """
         Close the game session and clean up resources.
@@ -1110,10 +1575,90 @@ class GameSession:
             except asyncio.CancelledError:
                 pass  # Task was cancelled, which is expected
 
-        # Cancel the chat timer task
-        if self.chat_timer_task and not self.chat_timer_task.done():
-            self.chat_timer_task.cancel()
-            try:
-                await self.chat_timer_task
-            except asyncio.CancelledError:
-                pass  # Task was cancelled, which is expected
\ No newline at end of file
+        get_featured_index().discard(self.game_id)
+        get_replication_publisher().game_ended(self)
+
+        get_message_bus().unsubscribe(self.relay_topic, self._on_relay_event)
+
+        # Delayed spectators still get the buffered frames; the topic is dropped once they are out
+        self.closed = True
+        if self.spectator_stream is None or self.spectator_stream.next_due() is None:
+            get_message_bus().unsubscribe(self.spectator_topic, self._fan_out_to_spectators)
+
+        # Drop pending chat messages; their scheduled expiries are skipped when they fire
+        self.pending_responses.clear()
+        self.pending_message_sender.clear()
+
+        # The session's slot is free for a new game
+        get_session_reaper().session_closed(self)
+
+
+def run_memory_benchmark(session_count, plies):
+    """
+    Measure the memory held per game session.
+
+    Creates session_count idle sessions (no players seated, clock stopped),
+    then as many active ones (clock running, plies random moves played, a few
+    chat messages, a cached state snapshot), and prints the traced bytes per
+    session of each kind.
+
+    Args:
+        session_count: Number of concurrent sessions of each kind
+        plies: Moves played in each active game
+    """
+    import gc
+    import os
+    import random
+    import tracemalloc
+    import contextlib
+
+    line_count = 100
+    random.seed(0)
+    report = {"sessions": session_count, "plies": plies}
+    with contextlib.redirect_stdout(open(os.devnull, "w")):
+        # Load the shared tables (opening book, ECO classification) before measuring
+        GameSession("warmup", None, None).chess_game.get_opening()
+        tracemalloc.start()
+
+        gc.collect()
+        baseline = tracemalloc.get_traced_memory()[0]
+        idle = [GameSession(f"idle-{index}", None, None, time_control="300+2") for index in range(session_count)]
+        gc.collect()
+        report["bytes_per_idle_game"] = round((tracemalloc.get_traced_memory()[0] - baseline) / session_count)
+        del idle
+
+        # Random lines, generated up front and replayed as a replica does (move generation is slow)
+        lines = []
+        for _ in range(line_count):
+            board = chess.Board()
+            while board.ply() < plies and not board.is_game_over():
+                board.push(random.choice(list(board.legal_moves)))
+            lines.append([move.uci() for move in board.move_stack])
+
+        gc.collect()
+        baseline = tracemalloc.get_traced_memory()[0]
+        active = []
+        for index in range(session_count):
+            session = GameSession(f"active-{index}", None, None, time_control="300+2")
+            chess_game = session.chess_game
+            chess_game.assign_player(2 * index, "white")
+            chess_game.assign_player(2 * index + 1, "black")
+            chess_game.start_clock()
+            for uci_move in lines[index % line_count]:
+                chess_game.replay_move(uci_move)
+            for color in ("white", "black"):
+                session.chat_history.append(time.time(), color, color, index, "good luck")
+            session._get_state_snapshot()
+            active.append(session)
+        gc.collect()
+        report["bytes_per_active_game"] = round((tracemalloc.get_traced_memory()[0] - baseline) / session_count)
+        tracemalloc.stop()
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    # python game_session.py bench [sessions] [plies]: memory held per idle and per active game
+    import sys
+    arguments = sys.argv[2:] if len(sys.argv) > 1 and sys.argv[1] == "bench" else []
+    run_memory_benchmark(int(arguments[0]) if len(arguments) > 0 else 10000,
+                         int(arguments[1]) if len(arguments) > 1 else 40)
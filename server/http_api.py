@@ -0,0 +1,205 @@
+# server/http_api.py
+import hashlib
+from http import HTTPStatus
+import chess
+from websockets.datastructures import Headers
+from websockets.http11 import Response
+from ratelimit import get_throttle_stats, get_oversize_stats
+from tv import get_tv_channel
+from thumbnails import get_thumbnail_cache
+from featured import get_featured_index
+from sharding import get_shard_router
+from bus import get_message_bus
+from relay import get_spectator_relay
+from replication import get_replication_publisher, get_standby_replica
+from drain import get_drain_controller
+from reaper import get_session_reaper
+from codec import encode_json, get_stats as get_codec_stats
+from compression import get_connection_profiles
+from config import FEATURED_GAMES_COUNT, REPLICATION_ROLE
+
+
+class HttpApi:
+    """
+    Read-only JSON API served on the WebSocket port through `process_request`.
+
+    Routes: /games, /games/{id} and /stats. Every other path continues with the
+    WebSocket handshake. Serialized bodies are cached per path together with a
+    cheap signature of the data they were built from, so a repeated poll only
+    recomputes the signature; clients sending a matching If-None-Match get a
+    bodiless 304.
+    """
+
+    def __init__(self, game_manager, connected_clients):
+        """
+        Initialize the API.
+
+        Args:
+            game_manager: The GameManager to read games from
+            connected_clients: Set of open WebSocket connections (for /stats)
+        """
+        self.game_manager = game_manager
+        self.connected_clients = connected_clients
+        self._cache = {}  # Maps path -> (signature, body bytes, etag)
+
+    def process_request(self, connection, request):
+        """
+        `process_request` hook for websockets.serve().
+
+        Args:
+            connection: The ServerConnection
+            request: The HTTP request
+
+        Returns:
+            Response or None: The API response, or None to continue with the WebSocket handshake
+        """
+        path = request.path.split("?", 1)[0].rstrip("/")
+
+        if path == "/games":
+            route = (self._games_signature, self._games_body)
+        elif path.startswith("/games/"):
+            session = self.game_manager.active_games.get(path[len("/games/"):])
+            if session is None:
+                return self._json_response(HTTPStatus.NOT_FOUND, {"error": "Game not found"})
+            route = (lambda: self._game_signature(session), lambda: self._game_body(session))
+        elif path == "/stats":
+            # The stats are cheap to gather and are their own signature
+            route = (self._stats_body, None)
+        else:
+            return None
+
+        signature_fn, body_fn = route
+        signature = signature_fn()
+        cached = self._cache.get(path)
+        if cached is None or cached[0] != signature:
+            body = encode_json(body_fn() if body_fn is not None else signature).encode()
+            cached = (signature, body, f'"{hashlib.sha1(body).hexdigest()[:16]}"')
+            self._cache[path] = cached
+            # Forget entries of games that are gone
+            if len(self._cache) > 2 * len(self.game_manager.active_games) + 8:
+                self._prune_cache()
+
+        _, body, etag = cached
+        if etag in request.headers.get("If-None-Match", ""):
+            return self._response(HTTPStatus.NOT_MODIFIED, b"", etag)
+        return self._response(HTTPStatus.OK, body, etag)
+
+    def _prune_cache(self):
+        for path in list(self._cache):
+            if path.startswith("/games/") and path[len("/games/"):] not in self.game_manager.active_games:
+                del self._cache[path]
+
+    def _response(self, status, body, etag=None):
+        headers = Headers()
+        headers["Content-Type"] = "application/json"
+        headers["Content-Length"] = str(len(body))
+        headers["Cache-Control"] = "no-cache"
+        headers["Access-Control-Allow-Origin"] = "*"
+        headers["Connection"] = "close"
+        if etag:
+            headers["ETag"] = etag
+        return Response(status.value, status.phrase, headers, body)
+
+    def _json_response(self, status, data):
+        return self._response(status, encode_json(data).encode())
+
+    def _game_summary(self, game_id, session):
+        """
+        Describe a game as spectators see it.
+
+        Clocks are reported as of the last move (remaining time per side and
+        which side is running), so the description only changes when a move
+        is made and can be cached.
+        """
+        chess_game = session.chess_game
+        summary = {
+            "id": game_id,
+            "status": "Ongoing",
+            "num_spectators": session.spectator_count(),
+            "opening": chess_game.get_opening(),
+            "time_control": chess_game.time_control.to_spec()
+        }
+
+        if session.spectator_stream is not None:
+            # Delayed games only expose what spectators have been shown, result included
+            stream = session.spectator_stream
+            state = stream.released_state
+            summary.update(fen=state["fen"], turn=state["turn"], opening=state.get("opening"), delayed=True)
+            summary["clock"] = {"white": state["time_white"], "black": state["time_black"]}
+            result = stream.released_result or state.get("result")
+            game_over = state["is_game_over"] or result is not None
+        else:
+            game_over = chess_game.is_game_over()
+            result = chess_game.get_game_result() if game_over else None
+            clock = chess_game.clock
+            summary.update(fen=chess_game.get_board_fen(), turn=chess_game.get_turn_color_string(),
+                           ply=chess_game.board.ply())
+            summary["clock"] = {
+                "white": clock.remaining[chess.WHITE],
+                "black": clock.remaining[chess.BLACK],
+                "running": None if clock.running is None else ("white" if clock.running == chess.WHITE else "black")
+            }
+
+        summary["thumbnail"] = get_thumbnail_cache().get_ref(summary["fen"])
+        if game_over:
+            summary["status"] = "Completed"
+            summary["result"] = result
+        return summary
+
+    def _game_signature(self, session):
+        stream = session.spectator_stream
+        return (session.chess_game.version, session.spectator_count(),
+                (id(stream.released_state), stream.released_result is not None) if stream is not None else None)
+
+    def _games_signature(self):
+        return (tuple((game_id, self._game_signature(session))
+                      for game_id, session in self.game_manager.active_games.items()),
+                tuple(get_featured_index().top(FEATURED_GAMES_COUNT)))
+
+    def _games_body(self):
+        return {
+            "games": [self._game_summary(game_id, session)
+                      for game_id, session in self.game_manager.active_games.items()],
+            "featured": get_featured_index().top(FEATURED_GAMES_COUNT)
+        }
+
+    def _game_body(self, session):
+        body = self._game_summary(session.game_id, session)
+        if session.spectator_stream is None:
+            body["moves"] = [move.uci() for move in session.chess_game.board.move_stack]
+        return body
+
+    def _stats_body(self):
+        active_games = self.game_manager.active_games
+        tv_channel = get_tv_channel()
+        stats = {
+            "connections": len(self.connected_clients),
+            "active_games": len(active_games),
+            "ongoing_games": sum(1 for session in active_games.values() if not session.chess_game.is_game_over()),
+            "players": len(self.game_manager.player_to_game),
+            "spectators": len(self.game_manager.spectator_to_game),
+            "tv_viewers": len(tv_channel.subscriptions),
+            "thumbnail_renders": get_thumbnail_cache().renders,
+            "throttled": get_throttle_stats(),
+            "oversized": get_oversize_stats()
+        }
+        stats["bus"] = get_message_bus().get_stats()
+        stats["relay"] = get_spectator_relay().get_stats()
+        stats["drain"] = get_drain_controller().get_stats()
+        # Live, zombie (finished or unattended) and reaped sessions
+        stats["sessions"] = get_session_reaper().get_stats()
+        # JSON encoder in use and frames encoded per wire format
+        stats["codec"] = get_codec_stats()
+        # Compression profiles in use, memory estimate against the budget, bandwidth saved and CPU spent
+        stats["compression"] = get_connection_profiles().get_stats()
+        if REPLICATION_ROLE:
+            stats["replication"] = get_replication_publisher().get_stats()
+            if REPLICATION_ROLE == "standby":
+                # Lag observed before the promotion and how long the takeover took
+                stats["replication"]["standby"] = get_standby_replica().get_stats()
+        shard_router = get_shard_router()
+        if shard_router.enabled:
+            # Only this worker's games and connections are counted
+            stats.update(shard=shard_router.shard_index, workers=shard_router.worker_count,
+                         forwarded_out=shard_router.forwards, forwarded_in=len(shard_router.forwarded))
+        return stats
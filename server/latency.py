@@ -0,0 +1,149 @@
+# server/latency.py
+import time
+from config import CLOCK_SYNC_INTERVAL, MAX_LAG_COMPENSATION
+
+
+class LatencyTracker:
+    """
+    NTP-style round-trip and clock offset estimate for one connection.
+
+    The server sends {"type": "ping", "sync_id", "server_time"} and the client
+    echoes them back in its pong together with its own clock ("client_time").
+    RTT is smoothed like TCP's SRTT/RTTVAR; the clock offset is an exponential
+    moving average of (client clock - server clock at the midpoint of the exchange).
+    """
+
+    ALPHA = 0.125  # Gain for the smoothed RTT and offset
+    BETA = 0.25    # Gain for the RTT variance
+    MAX_PENDING = 4  # Unanswered pings kept around
+
+    def __init__(self):
+        self.srtt = None     # Smoothed round-trip time (seconds)
+        self.rttvar = None   # Round-trip time variance (seconds)
+        self.offset = None   # Client clock minus server clock (seconds)
+        self.samples = 0
+        self.last_sync = None
+        self._next_sync_id = 0
+        self._pending = {}   # Maps sync_id -> (monotonic send time, wall send time)
+
+    def needs_sync(self, now=None):
+        """Return True if it's time to send another sync ping."""
+        now = time.monotonic() if now is None else now
+        return self.last_sync is None or now - self.last_sync >= CLOCK_SYNC_INTERVAL
+
+    def build_ping(self):
+        """
+        Create a sync ping and remember when it was sent.
+
+        Returns:
+            dict: The ping message to send to the client
+        """
+        now = time.monotonic()
+        wall_now = time.time()
+        self._next_sync_id += 1
+        sync_id = self._next_sync_id
+
+        self._pending[sync_id] = (now, wall_now)
+        if len(self._pending) > self.MAX_PENDING:
+            # Forget the oldest unanswered ping
+            del self._pending[min(self._pending)]
+
+        self.last_sync = now
+        return {"type": "ping", "sync_id": sync_id, "server_time": int(wall_now * 1000)}
+
+    def record_pong(self, message_data):
+        """
+        Update the estimates from a pong message.
+
+        Args:
+            message_data: The parsed pong message
+
+        Returns:
+            float or None: The measured RTT in seconds, or None if the pong doesn't match a ping
+        """
+        sent = self._pending.pop(message_data.get("sync_id"), None)
+        if sent is None:
+            return None
+
+        sent_monotonic, sent_wall = sent
+        rtt = max(0.0, time.monotonic() - sent_monotonic)
+
+        if self.srtt is None:
+            self.srtt = rtt
+            self.rttvar = rtt / 2
+        else:
+            self.rttvar = (1 - self.BETA) * self.rttvar + self.BETA * abs(self.srtt - rtt)
+            self.srtt = (1 - self.ALPHA) * self.srtt + self.ALPHA * rtt
+
+        client_time = message_data.get("client_time")
+        if isinstance(client_time, (int, float)):
+            offset = client_time / 1000 - (sent_wall + rtt / 2)
+            self.offset = offset if self.offset is None else (1 - self.ALPHA) * self.offset + self.ALPHA * offset
+
+        self.samples += 1
+        return rtt
+
+    def one_way_latency(self):
+        """
+        Estimated one-way (client -> server) latency, capped for lag compensation.
+
+        Returns:
+            float or None: Seconds, or None if no sample has been taken yet
+        """
+        if self.srtt is None:
+            return None
+        return min(self.srtt / 2, MAX_LAG_COMPENSATION)
+
+    def to_metric(self):
+        """
+        Get the latency metric for this connection.
+
+        Returns:
+            dict: rtt_ms, jitter_ms, offset_ms (None until measured) and the number of samples
+        """
+        return {
+            "rtt_ms": round(self.srtt * 1000) if self.srtt is not None else None,
+            "jitter_ms": round(self.rttvar * 1000) if self.rttvar is not None else None,
+            "offset_ms": round(self.offset * 1000) if self.offset is not None else None,
+            "samples": self.samples
+        }
+
+
+# Maps client_id (id(websocket)) -> LatencyTracker
+LATENCY_TRACKERS = {}
+
+
+def get_latency_tracker(client_id):
+    """
+    Get (or create) the tracker for a connection.
+
+    Args:
+        client_id: The client ID (id of the WebSocket)
+
+    Returns:
+        LatencyTracker: The connection's tracker
+    """
+    tracker = LATENCY_TRACKERS.get(client_id)
+    if tracker is None:
+        tracker = LatencyTracker()
+        LATENCY_TRACKERS[client_id] = tracker
+    return tracker
+
+
+def remove_latency_tracker(client_id):
+    """Forget a connection's tracker when it disconnects."""
+    LATENCY_TRACKERS.pop(client_id, None)
+
+
+def get_one_way_latency(client_id):
+    """
+    Get the capped one-way latency estimate of a connection.
+
+    Args:
+        client_id: The client ID (id of the WebSocket)
+
+    Returns:
+        float or None: Seconds, or None if the connection hasn't been measured
+    """
+    tracker = LATENCY_TRACKERS.get(client_id)
+    return tracker.one_way_latency() if tracker is not None else None
@@ -2,7 +2,15 @@
 import json
 import asyncio
 import time
+import uuid
 from game_session import GameSession
+from sharding import get_shard_router
+from reaper import get_session_reaper
+from codec import send_message
+from config import FEATURED_GAMES_COUNT
+
+# Seconds a player handed off to another shard waits there for the opponent
+MATCH_HANDOFF_TIMEOUT = 10.0
 
 class Lobby:
     def __init__(self, game_manager_ref):
@@ -14,6 +22,9 @@ class Lobby:
         """
         self.game_manager = game_manager_ref
         self.waiting_players = []  # List of WebSockets for players waiting for a match
+        self.shard_router = get_shard_router()
+        self.pending_matches = {}  # Maps match token -> (WebSocket, color) of the first player to arrive
+        self.draining = False  # Set while the server drains (see drain.py): no new matches are made
 
     async def add_player(self, websocket):
         """
@@ -25,6 +36,15 @@ class Lobby:
         # Get the player ID for logging
         player_id = id(websocket)
 
+        # A draining server makes no new matches: the player queues up on its successor
+        if self.draining:
+            print(f"Not queueing player {player_id}, the server is draining")
+            await send_message(websocket, {
+                "type": "error",
+                "message": "The server is restarting. Please join the queue again in a moment."
+            })
+            return
+
         # Check if the player is already in the waiting list
         if websocket in self.waiting_players:
             print(f"Player {player_id} is already in the waiting list")
@@ -89,6 +109,9 @@ class Lobby:
         """
         Try to match waiting players and start a game session.
         """
+        if self.draining:
+            return
+
         # First, clean up any disconnected players from the waiting list
         self.waiting_players = [ws for ws in self.waiting_players if self._is_connected(ws)]
         print(f"Cleaned up waiting list, now have {len(self.waiting_players)} players")
@@ -96,6 +119,13 @@ class Lobby:
         if len(self.waiting_players) >= 2:
             print(f"Found {len(self.waiting_players)} players in queue, attempting to match first two")
 
+            # At the session cap, the players stay queued until a session closes
+            # (a sharded worker checks once the game is placed, as it may go to another worker)
+            if not self.shard_router.enabled and not await get_session_reaper().admit():
+                print(f"No free game session, {len(self.waiting_players)} players stay queued")
+                await self._notify_full(self.waiting_players[:2])
+                return
+
             # Get the first two players but don't remove them yet
             player1_ws = self.waiting_players[0]
             player2_ws = self.waiting_players[1]
@@ -172,14 +202,14 @@ class Lobby:
 
             # Notify both players that a match is being created
             try:
-                await player1_ws.send(json.dumps({
+                await send_message(player1_ws, {
                     "type": "status",
                     "message": "Match found! Creating game..."
-                }))
-                await player2_ws.send(json.dumps({
+                })
+                await send_message(player2_ws, {
                     "type": "status",
                     "message": "Match found! Creating game..."
-                }))
+                })
             except Exception as e:
                 print(f"Error notifying players about match: {str(e)}")
                 # If we can't send messages, players might be disconnected
@@ -190,6 +220,19 @@ class Lobby:
                     self.waiting_players.append(player2_ws)
                 return
 
+            # When running sharded, the game may be created on another worker
+            if self.shard_router.enabled:
+                target_shard = self.shard_router.place_game()
+                if target_shard != self.shard_router.shard_index:
+                    await self.hand_off_match(player1_ws, player2_ws, target_shard)
+                    return
+                # Placed here: the players go back to the head of the queue if this worker is at its cap
+                if not await get_session_reaper().admit():
+                    print("No free game session, returning players to the queue")
+                    self.waiting_players[:0] = [ws for ws in (player1_ws, player2_ws) if self._is_connected(ws)]
+                    await self._notify_full((player1_ws, player2_ws))
+                    return
+
             # Start a new game session with a timeout
             try:
                 # IMPORTANT: Double-check that both players are still connected
@@ -218,19 +261,19 @@ class Lobby:
                 # Notify players about the failure
                 try:
                     if self._is_connected(player1_ws):
-                        await player1_ws.send(json.dumps({
+                        await send_message(player1_ws, {
                             "type": "error",
                             "message": "Failed to create game. Please try again."
-                        }))
+                        })
                 except Exception:
                     pass
 
                 try:
                     if self._is_connected(player2_ws):
-                        await player2_ws.send(json.dumps({
+                        await send_message(player2_ws, {
                             "type": "error",
                             "message": "Failed to create game. Please try again."
-                        }))
+                        })
                 except Exception:
                     pass
 
@@ -249,6 +292,108 @@ class Lobby:
             else:
                 print(f"Game session {game_session.game_id} created successfully")
 
+    async def hand_off_match(self, player1_ws, player2_ws, shard):
+        """
+        Send a matched pair to the shard the game is placed on.
+
+        Both players are proxied connections; their edges reconnect them to the
+        target shard, where join_match() pairs them up again by token.
+
+        Args:
+            player1_ws: WebSocket connection of the white player
+            player2_ws: WebSocket connection of the black player
+            shard: The target shard
+        """
+        token = str(uuid.uuid4())
+        print(f"Handing off match {token} of players {id(player1_ws)} and {id(player2_ws)} to shard {shard}")
+        for websocket, color in ((player1_ws, "white"), (player2_ws, "black")):
+            try:
+                await websocket.send(json.dumps(self.shard_router.build_redirect(
+                    shard, {"type": "join_match", "token": token, "color": color})))
+            except Exception as e:
+                print(f"Error handing off player {id(websocket)}: {str(e)}")
+
+    async def join_match(self, websocket, token, color):
+        """
+        Pair up a player handed off by the matchmaking shard.
+
+        The first player of a match waits (up to MATCH_HANDOFF_TIMEOUT) for the
+        second; the game session is created when both have arrived.
+
+        Args:
+            websocket: The player's (proxied) WebSocket connection
+            token: Match token from the hand-off
+            color: 'white' or 'black'
+
+        Returns:
+            GameSession or None: The game session once both players are here
+        """
+        pending = self.pending_matches.pop(token, None)
+        if self.draining:
+            if pending is not None:
+                await self._fail_match(pending[0])
+            await self._fail_match(websocket)
+            return None
+        if pending is None:
+            self.pending_matches[token] = (websocket, color)
+            asyncio.get_running_loop().call_later(MATCH_HANDOFF_TIMEOUT, self._expire_match, token)
+            return None
+
+        opponent_ws, opponent_color = pending
+        if color == opponent_color or not self._is_connected(opponent_ws):
+            print(f"Match {token} cannot be completed")
+            await self._fail_match(websocket)
+            return None
+
+        white_ws, black_ws = (websocket, opponent_ws) if color == "white" else (opponent_ws, websocket)
+        if not await get_session_reaper().admit():
+            print(f"No free game session for match {token}")
+            await self._fail_match(white_ws)
+            await self._fail_match(black_ws)
+            return None
+        game_session = await self.game_manager.start_new_game_session(white_ws, black_ws)
+        if game_session is None:
+            await self._fail_match(white_ws)
+            await self._fail_match(black_ws)
+        return game_session
+
+    def start_draining(self):
+        """
+        Stop making matches.
+
+        Returns:
+            list: WebSockets of the players that were waiting for a match
+        """
+        self.draining = True
+        waiting_players, self.waiting_players = self.waiting_players, []
+        return waiting_players
+
+    def _expire_match(self, token):
+        pending = self.pending_matches.pop(token, None)
+        if pending is not None:
+            print(f"Match {token} expired waiting for the opponent")
+            asyncio.create_task(self._fail_match(pending[0]))
+
+    async def _fail_match(self, websocket):
+        try:
+            if self._is_connected(websocket):
+                await send_message(websocket, {
+                    "type": "error",
+                    "message": "Failed to create game. Please try again."
+                })
+        except Exception:
+            pass
+
+    async def _notify_full(self, websockets):
+        for websocket in websockets:
+            try:
+                await send_message(websocket, {
+                    "type": "status",
+                    "message": "All game slots are in use. You will be matched as soon as a game ends."
+                })
+            except Exception:
+                pass
+
     def _is_connected(self, websocket):
         """
         Check if a websocket is still connected.
@@ -279,12 +424,18 @@ class Lobby:
 
             # Get the list of active games
             active_games = self.game_manager.get_active_games_info()
+            featured = self.game_manager.get_top_game_ids(FEATURED_GAMES_COUNT)
+            if self.shard_router.enabled:
+                # Include the games of the other workers
+                active_games, featured = await self.shard_router.gather_games(
+                    active_games, self.game_manager.get_featured_entries(FEATURED_GAMES_COUNT))
             print(f"Found {len(active_games)} active games")
 
             # Create the message
             games_list_message = {
                 "type": "games_list",
                 "games": active_games,
+                "featured": featured,  # Best first
                 "timestamp": int(time.time() * 1000)  # Add timestamp for ordering
             }
 
@@ -292,15 +443,15 @@ class Lobby:
             print(f"Sending games list message: {games_list_message}")
 
             # Send the message
-            await websocket.send(json.dumps(games_list_message))
+            await send_message(websocket, games_list_message)
             print(f"Successfully sent active games list to client {client_id}")
 
             # Also send a status message to confirm
-            await websocket.send(json.dumps({
+            await send_message(websocket, {
                 "type": "status",
                 "message": f"Found {len(active_games)} active games",
                 "timestamp": int(time.time() * 1000)
-            }))
+            })
             print(f"Sent status message to client {client_id}")
 
             return True
@@ -311,11 +462,11 @@ class Lobby:
 
             # Try to send an error message
             try:
-                await websocket.send(json.dumps({
+                await send_message(websocket, {
                     "type": "error",
                     "message": f"Error listing games: {str(e)}",
                     "timestamp": int(time.time() * 1000)
-                }))
+                })
             except Exception as e2:
                 print(f"Error sending error message: {str(e2)}")
 
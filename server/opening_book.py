@@ -0,0 +1,192 @@
+# server/opening_book.py
+import os
+import chess
+import chess.pgn
+import chess.polyglot
+from config import OPENING_BOOK_PATH
+
+
+class OpeningBook:
+    """
+    Read-only access to a Polyglot opening book.
+
+    Polyglot books are flat arrays of 16-byte entries sorted by the Zobrist hash
+    of the position, so the file itself is the index: it is memory-mapped and
+    binary searched, nothing is parsed or loaded at startup.
+    """
+
+    def __init__(self, path):
+        """
+        Initialize the opening book. The file is not opened until the first lookup.
+
+        Args:
+            path: Path to a Polyglot (.bin) book file
+        """
+        self.path = path
+        self._reader = None
+        self._unavailable = False
+
+    def _get_reader(self):
+        """
+        Memory-map the book on first use.
+
+        Returns:
+            MemoryMappedReader or None: The reader, or None if the book can't be opened
+        """
+        if self._reader is None and not self._unavailable:
+            try:
+                self._reader = chess.polyglot.open_reader(self.path)
+                print(f"Opening book mapped: {self.path} ({len(self._reader)} entries)")
+            except (OSError, ValueError) as e:
+                # Missing or corrupt book: disable lookups instead of failing games
+                print(f"Opening book unavailable ({self.path}): {str(e)}")
+                self._unavailable = True
+        return self._reader
+
+    def is_available(self):
+        """Return True if the book file exists and could be mapped."""
+        return self._get_reader() is not None
+
+    def lookup(self, board):
+        """
+        Get the book moves for a position.
+
+        Args:
+            board: chess.Board to look up
+
+        Returns:
+            list: (uci_move, weight) tuples, highest weight first (empty if out of book)
+        """
+        reader = self._get_reader()
+        if reader is None:
+            return []
+
+        entries = [(entry.move.uci(), entry.weight) for entry in reader.find_all(board)]
+        entries.sort(key=lambda item: item[1], reverse=True)
+        return entries
+
+    def contains(self, board):
+        """
+        Check whether a position is in the book.
+
+        Args:
+            board: chess.Board to look up
+
+        Returns:
+            bool: True if the book has at least one move for this position
+        """
+        reader = self._get_reader()
+        if reader is None:
+            return False
+        return reader.get(board) is not None
+
+    def pick_move(self, board):
+        """
+        Pick a book move for the side to move, weighted by the book weights.
+
+        Args:
+            board: chess.Board to pick a move for
+
+        Returns:
+            str or None: The UCI move, or None if the position is out of book
+        """
+        reader = self._get_reader()
+        if reader is None:
+            return None
+
+        try:
+            return reader.weighted_choice(board).move.uci()
+        except IndexError:
+            return None
+
+    def close(self):
+        """Unmap the book file."""
+        if self._reader is not None:
+            self._reader.close()
+            self._reader = None
+
+
+def build_book_from_pgn(pgn_paths, output_path, max_plies=20, min_games=1):
+    """
+    Build a Polyglot book from archived games in PGN format.
+
+    Every (position, move) pair seen in the first max_plies plies is counted,
+    the counts become the entry weights and the entries are written sorted by
+    key so the result can be binary searched by OpeningBook.
+
+    Args:
+        pgn_paths: List of PGN file paths
+        output_path: Path of the .bin file to write
+        max_plies: Number of plies of each game to include
+        min_games: Minimum number of games a move must appear in to be kept
+
+    Returns:
+        int: Number of entries written
+    """
+    counts = {}  # Maps (zobrist_key, raw_move) -> number of games
+
+    for pgn_path in pgn_paths:
+        with open(pgn_path, encoding="utf-8", errors="replace") as pgn_file:
+            while True:
+                game = chess.pgn.read_game(pgn_file)
+                if game is None:
+                    break
+
+                board = game.board()
+                for ply, move in enumerate(game.mainline_moves()):
+                    if ply >= max_plies:
+                        break
+                    key = (chess.polyglot.zobrist_hash(board), _encode_move(board, move))
+                    counts[key] = counts.get(key, 0) + 1
+                    board.push(move)
+
+    kept = sorted((key, raw_move, count) for (key, raw_move), count in counts.items() if count >= min_games)
+
+    # Polyglot weights are 16-bit; scale the counts down if necessary
+    max_count = max((count for _, _, count in kept), default=1)
+    scale = min(1.0, 0xFFFF / max_count)
+
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    with open(output_path, "wb") as book_file:
+        for key, raw_move, count in kept:
+            weight = max(1, int(count * scale))
+            book_file.write(chess.polyglot.ENTRY_STRUCT.pack(key, raw_move, weight, 0))
+
+    print(f"Wrote {len(kept)} book entries to {output_path}")
+    return len(kept)
+
+
+def _encode_move(board, move):
+    """
+    Encode a move in the Polyglot 16-bit format.
+
+    Args:
+        board: The position the move is played from
+        move: chess.Move to encode
+
+    Returns:
+        int: The raw Polyglot move
+    """
+    # Polyglot encodes castling as "king takes rook" (e1h1 instead of e1g1)
+    move = board._to_chess960(move)
+    raw_move = move.to_square | (move.from_square << 6)
+    if move.promotion:
+        raw_move |= (move.promotion - 1) << 12
+    return raw_move
+
+
+# Shared book instance, mapped lazily on the first lookup
+_opening_book = None
+
+
+def get_opening_book():
+    """
+    Get the process-wide opening book.
+
+    Returns:
+        OpeningBook: The shared book for OPENING_BOOK_PATH
+    """
+    global _opening_book
+    if _opening_book is None:
+        _opening_book = OpeningBook(OPENING_BOOK_PATH)
+    return _opening_book
@@ -1,5 +1,5 @@
 # server/player.py
-import json
+from codec import get_codec
 
 class Player:
     """
@@ -7,6 +7,8 @@ class Player:
     Encapsulates the WebSocket connection and player identity.
     """
 
+    __slots__ = ("websocket", "player_id", "name", "preferences")
+
     def __init__(self, websocket, player_id=None):
         """
         Initialize a new player.
@@ -49,11 +51,11 @@ class Player:
             bool: True if the message was sent successfully, False otherwise
         """
         try:
-            # Convert the message to a JSON string
-            message_str = json.dumps(message_dict)
+            # Encode the message in the connection's wire format
+            frame = get_codec(self.websocket).encode(message_dict)
 
             # Send the message
-            await self.websocket.send(message_str)
+            await self.websocket.send(frame)
             return True
         except Exception as e:
             print(f"Error sending message to player {self.player_id}: {str(e)}")
@@ -0,0 +1,162 @@
+# server/ratelimit.py
+import time
+from collections import Counter
+from config import RATE_LIMITS, MESSAGE_SIZE_LIMITS
+
+# Message types limited by the bucket of their own; all other types share "default"
+DEFAULT_BUCKET = "default"
+
+# Throttled message counts by type, across all connections
+THROTTLE_STATS = Counter()
+
+# Messages rejected for their size, by type, across all connections
+OVERSIZE_STATS = Counter()
+
+
+class TokenBucket:
+    """Token bucket refilled continuously at `rate` tokens per second, holding at most `burst`."""
+
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate, burst, now):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = now
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self, now):
+        """Take a token if one is available. Returns True on success."""
+        self._refill(now)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    def wait_time(self, now):
+        """Seconds until the next token is available."""
+        self._refill(now)
+        return max(0.0, (1 - self.tokens) / self.rate)
+
+
+class ConnectionRateLimiter:
+    """
+    Per-connection message rate limiter.
+
+    State is one token bucket per limited message type (a fixed set, see
+    RATE_LIMITS) plus a few counters, so it is constant-size per connection.
+    """
+
+    def __init__(self, now_fn=time.monotonic):
+        self.now_fn = now_fn
+        self._buckets = {}        # Maps bucket name -> TokenBucket, created on first use
+        self.deferred = {}        # Maps coalesced message type -> latest throttled message string
+        self.throttled = 0        # Messages throttled on this connection
+        self._last_notice = None  # When the client was last told it is being throttled
+
+    def _bucket(self, msg_type, now):
+        name = msg_type if msg_type in RATE_LIMITS else DEFAULT_BUCKET
+        bucket = self._buckets.get(name)
+        if bucket is None:
+            rate, burst = RATE_LIMITS[name]
+            bucket = TokenBucket(rate, burst, now)
+            self._buckets[name] = bucket
+        return bucket
+
+    def allow(self, msg_type):
+        """
+        Check a message against its bucket, recording it if it is throttled.
+
+        Args:
+            msg_type: The message type
+
+        Returns:
+            bool: True if the message may be processed
+        """
+        now = self.now_fn()
+        if self._bucket(msg_type, now).take(now):
+            return True
+        self.throttled += 1
+        THROTTLE_STATS[msg_type if msg_type in RATE_LIMITS else DEFAULT_BUCKET] += 1
+        return False
+
+    def defer(self, msg_type, message_str):
+        """
+        Remember a throttled request so it can be answered once when a token is available.
+        Duplicates of an already deferred request replace it instead of queueing.
+
+        Args:
+            msg_type: The message type
+            message_str: The raw message
+
+        Returns:
+            float or None: Seconds to wait before replaying, or None if a replay is already scheduled
+        """
+        already_deferred = msg_type in self.deferred
+        self.deferred[msg_type] = message_str
+        if already_deferred:
+            return None
+        now = self.now_fn()
+        return self._bucket(msg_type, now).wait_time(now)
+
+    def take_deferred(self, msg_type):
+        """
+        Consume a token for a deferred request and return its latest message.
+
+        Returns:
+            str or None: The message to replay, or None if nothing is deferred
+        """
+        message_str = self.deferred.pop(msg_type, None)
+        if message_str is not None:
+            now = self.now_fn()
+            self._bucket(msg_type, now).take(now)
+        return message_str
+
+    def should_notify(self, interval=1.0):
+        """Return True (at most once per interval) if the client should be told it is throttled."""
+        now = self.now_fn()
+        if self._last_notice is None or now - self._last_notice >= interval:
+            self._last_notice = now
+            return True
+        return False
+
+
+def get_throttle_stats():
+    """
+    Get the throttled message counts.
+
+    Returns:
+        dict: Maps message type (or "default") -> number of throttled messages
+    """
+    return dict(THROTTLE_STATS)
+
+
+def message_size_allowed(msg_type, size):
+    """
+    Check a message against the size limit of its type, recording it if it is too large.
+
+    Args:
+        msg_type: The message type
+        size: Size of the raw message
+
+    Returns:
+        bool: True if the message may be processed
+    """
+    name = msg_type if msg_type in MESSAGE_SIZE_LIMITS else DEFAULT_BUCKET
+    if size <= MESSAGE_SIZE_LIMITS[name]:
+        return True
+    OVERSIZE_STATS[name] += 1
+    return False
+
+
+def get_oversize_stats():
+    """
+    Get the counts of messages rejected for their size.
+
+    Returns:
+        dict: Maps message type (or "default") -> number of rejected messages
+    """
+    return dict(OVERSIZE_STATS)
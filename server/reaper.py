@@ -0,0 +1,280 @@
+# server/reaper.py
+import heapq
+import asyncio
+import itertools
+import chess
+from config import FIRST_MOVE_TIMEOUT, DISCONNECT_GRACE_SECONDS, FINISHED_GAME_TTL, RESUME_GRACE_SECONDS, \
+    MAX_SESSIONS
+
+# Deadline kinds
+FIRST_MOVE = "first_move"    # A side hasn't made its first move yet
+DISCONNECTED = "disconnected"  # A player dropped out of a running game
+RESUME = "resume"            # A game restored after a failover or restart waits for its players
+FINISHED = "finished"        # A finished game lingers for its post-game screen
+
+
+class SessionReaper:
+    """
+    Process-wide lifecycle scheduler for game sessions.
+
+    Every session deadline (first move, disconnect grace period, resume grace
+    period of a restored game, end of a finished game's post-game time) goes
+    into a single min-heap, and one event-loop timer is armed for the earliest
+    one, as for chat expiry. Deadlines are checked against the session's state
+    when they fire, so nothing has to be unscheduled: a player who resumes or a
+    game that ends in between simply makes the entry a no-op.
+
+    It also caps the number of sessions the process holds (MAX_SESSIONS): at
+    the cap, matchmaking first drops the oldest finished game, and otherwise
+    leaves the players queued until a session closes.
+    """
+
+    def __init__(self, max_sessions=MAX_SESSIONS):
+        """
+        Initialize the reaper.
+
+        Args:
+            max_sessions: Most sessions held at once (0 for no limit)
+        """
+        self.max_sessions = max_sessions
+        self.game_manager = None
+        self.lobby = None
+        self._heap = []  # (deadline, seq, kind, session, color)
+        self._counter = itertools.count()  # Tie-breaker so sessions are never compared
+        self._timer = None
+        self._timer_deadline = None
+        self._tasks = set()  # Running reaps
+        self._finished = {}  # Maps finished session -> loop time it finished, oldest first
+        self._waiting_for_slot = False  # Matchmaking was refused for lack of a free session
+        self.reaped = {"aborted": 0, "abandoned": 0, "finished": 0, "evicted": 0}
+        self.refused = 0
+
+    def bind(self, game_manager, lobby):
+        """
+        Attach the reaper to the server's state.
+
+        Args:
+            game_manager: The GameManager
+            lobby: The Lobby
+        """
+        self.game_manager = game_manager
+        self.lobby = lobby
+
+    def _schedule(self, kind, session, delay, color=None):
+        """Add a deadline. Must be called from the event loop."""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + delay
+        heapq.heappush(self._heap, (deadline, next(self._counter), kind, session, color))
+        if self._timer is None or deadline < self._timer_deadline:
+            self._arm(loop)
+
+    def _arm(self, loop):
+        """(Re)arm the timer for the earliest deadline, if any."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._heap:
+            self._timer_deadline = self._heap[0][0]
+            self._timer = loop.call_at(self._timer_deadline, self._fire)
+
+    def _fire(self):
+        """Handle every deadline that has passed."""
+        self._timer = None
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+
+        while self._heap and self._heap[0][0] <= now:
+            _, _, kind, session, color = heapq.heappop(self._heap)
+            if self.game_manager is None or self.game_manager.active_games.get(session.game_id) is not session:
+                continue  # Closed in the meantime
+            try:
+                if kind == FIRST_MOVE:
+                    self._check_first_move(session, now)
+                elif kind == DISCONNECTED:
+                    self._check_disconnected(session, color, now)
+                elif kind == RESUME:
+                    self._start(self._expire_resume(session))
+                elif kind == FINISHED:
+                    self._start(self._drop(session, "finished"))
+            except Exception as e:
+                print(f"Error checking {kind} deadline of game {session.game_id}: {str(e)}")
+
+        self._arm(loop)
+
+    def _start(self, coroutine):
+        task = asyncio.get_running_loop().create_task(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def game_started(self, session):
+        """
+        Start the first-move deadline of a game whose clock just started.
+
+        Args:
+            session: The GameSession
+        """
+        if FIRST_MOVE_TIMEOUT > 0 and session.chess_game.board.ply() < 2:
+            self._schedule(FIRST_MOVE, session, FIRST_MOVE_TIMEOUT)
+
+    def _check_first_move(self, session, now):
+        """Abort the game if the side to move still hasn't made its first move, else check again later."""
+        chess_game = session.chess_game
+        if session.finished or chess_game.board.ply() >= 2 or chess_game.clock.running is None:
+            return
+        # Each side gets FIRST_MOVE_TIMEOUT from the start of its own first turn
+        left = FIRST_MOVE_TIMEOUT - chess_game.clock.elapsed(now)
+        if left > 0:
+            self._schedule(FIRST_MOVE, session, left)
+            return
+        color = "white" if chess_game.board.turn == chess.WHITE else "black"
+        print(f"{color.capitalize()} didn't make a first move in game {session.game_id} in time, aborting it")
+        self._start(self._end_game(session, {"outcome": "aborted", "aborted_by": color}, "aborted"))
+
+    def player_disconnected(self, session, color):
+        """
+        Start the grace period of a player who dropped out of a running game.
+
+        The player forfeits unless they resume the game before it ends.
+
+        Args:
+            session: The GameSession
+            color: The player's color
+        """
+        session.disconnected_at[color] = asyncio.get_running_loop().time()
+        self._schedule(DISCONNECTED, session, DISCONNECT_GRACE_SECONDS, color)
+
+    def _check_disconnected(self, session, color, now):
+        """Forfeit a player still away once their (latest) grace period is over."""
+        since = session.disconnected_at.get(color)
+        if session.finished or since is None or since + DISCONNECT_GRACE_SECONDS > now:
+            return  # Resumed, game over, or disconnected again later (a later entry decides)
+        winner = "black" if color == "white" else "white"
+        print(f"{color.capitalize()} didn't come back to game {session.game_id} in time, {winner} wins")
+        self._start(self._end_game(session, {
+            "outcome": "opponent_disconnected",
+            "winner": winner,
+            "disconnected_player": color
+        }, "abandoned"))
+
+    def game_restored(self, session):
+        """
+        Start the resume grace period of a game restored after a failover or restart.
+
+        Args:
+            session: The restored GameSession
+        """
+        self._schedule(RESUME, session, RESUME_GRACE_SECONDS)
+
+    async def _expire_resume(self, session):
+        if await self.game_manager.expire_resume(session.game_id):
+            self.reaped["abandoned"] += 1
+
+    def game_over(self, session):
+        """
+        Start the post-game time of a game that just finished.
+
+        Args:
+            session: The GameSession
+        """
+        if session.finished:
+            return
+        session.finished = True
+        self._finished[session] = asyncio.get_running_loop().time()
+        self._schedule(FINISHED, session, FINISHED_GAME_TTL)
+
+    def session_closed(self, session):
+        """
+        Note that a session was closed, freeing its slot.
+
+        Args:
+            session: The closed GameSession
+        """
+        self._finished.pop(session, None)
+        if self._waiting_for_slot and self.lobby is not None and len(self.lobby.waiting_players) >= 2:
+            # Players were left queued at the cap: match them now
+            self._waiting_for_slot = False
+            self._start(self.lobby.try_match_players())
+
+    async def _end_game(self, session, result, reason):
+        """Decide a game the players left undecided; the finished game is dropped later as usual."""
+        if session.finished:
+            return
+        session.chess_game.adjudicate(result)
+        await session.broadcast_game_over(result)
+        self.reaped[reason] += 1
+
+    async def _drop(self, session, reason):
+        """Remove a session from the game manager, unmapping its players and spectators."""
+        if self.game_manager.active_games.get(session.game_id) is not session:
+            return False
+        await self.game_manager.discard_game(session.game_id)
+        self.reaped[reason] += 1
+        print(f"Dropped {reason} game {session.game_id}")
+        return True
+
+    async def admit(self):
+        """
+        Check whether a new session can be created.
+
+        At the cap, the oldest finished game is dropped to make room; if there
+        is none, the new game is refused and matchmaking resumes once a session
+        closes.
+
+        Returns:
+            bool: True if the session can be created
+        """
+        if self.max_sessions <= 0 or len(self.game_manager.active_games) < self.max_sessions:
+            return True
+        for session in list(self._finished):
+            if await self._drop(session, "evicted"):
+                return True
+            self._finished.pop(session, None)
+        self.refused += 1
+        self._waiting_for_slot = True
+        return False
+
+    def get_stats(self):
+        """
+        Return session counts for the stats endpoint.
+
+        Live sessions are running games with a player connected; zombies are
+        sessions still held without being played (finished, or with nobody
+        connected), which the reaper eventually drops.
+        """
+        live = zombie = restoring = 0
+        for session in self.game_manager.active_games.values():
+            if session.finished:
+                zombie += 1
+            elif session.clients:
+                live += 1
+            elif session.awaiting_resume:
+                restoring += 1
+            else:
+                zombie += 1
+        return {
+            "sessions": len(self.game_manager.active_games),
+            "max_sessions": self.max_sessions,
+            "live": live,
+            "zombie": zombie,
+            "restoring": restoring,
+            "reaped": dict(self.reaped),
+            "refused": self.refused,
+            "pending_deadlines": len(self._heap)
+        }
+
+
+# Shared reaper instance for all game sessions
+_session_reaper = None
+
+
+def get_session_reaper():
+    """
+    Get the process-wide session reaper.
+
+    Returns:
+        SessionReaper: The shared reaper
+    """
+    global _session_reaper
+    if _session_reaper is None:
+        _session_reaper = SessionReaper()
+    return _session_reaper
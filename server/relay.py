@@ -0,0 +1,207 @@
+# server/relay.py
+import os
+import asyncio
+from bus import get_message_bus, AT_LEAST_ONCE
+from sharding import get_shard_router
+from codec import Frame, GAME_UPDATE_PREFIX
+
+
+class SpectatorRelay:
+    """
+    Holds spectators of games owned by other worker processes.
+
+    The owner encodes each spectator frame once and publishes it on the game's
+    spectator topic; the relay of every process with an audience for the game
+    subscribes to it and fans the frames out to its own connections. The owner
+    only learns the audience size (for the lobby and the featured ranking) and
+    receives the relayed spectators' chat through the game's relay topic, so its
+    loop - and the players' clocks - do not depend on how many people watch.
+    """
+
+    def __init__(self):
+        self.relay_id = str(os.getpid())
+        self.games = {}             # Maps game_id -> set of spectator websockets
+        self.spectator_games = {}   # Maps websocket -> game_id
+        self.latest_frames = {}     # Maps game_id -> last game_update frame relayed
+        self.frames_relayed = 0     # Frames received from owners (for metrics)
+        self.frames_sent = 0        # Frames sent to spectators (for metrics)
+        self._tasks = set()
+
+    def is_watching(self, websocket):
+        """Return True if the connection spectates a game through this relay."""
+        return websocket in self.spectator_games
+
+    def sender_token(self, websocket):
+        """Identify a relayed spectator across processes (to exclude it from its own chat)."""
+        return f"{self.relay_id}:{id(websocket)}"
+
+    async def add_spectator(self, websocket, game_id):
+        """
+        Start relaying a remote game to a spectator.
+
+        Args:
+            websocket: The spectator's WebSocket connection
+            game_id: The game to watch
+
+        Returns:
+            bool: True if the spectator was added, False if the game doesn't exist
+        """
+        self.remove_spectator(websocket)
+
+        bus = get_message_bus()
+        new_game = game_id not in self.games
+        if new_game:
+            # Subscribe before asking for the intro, so no frame falls in between
+            self.games[game_id] = set()
+            bus.subscribe(f"spectators/{game_id}", self._on_frames)
+            bus.subscribe(f"spectator_chat/{game_id}", self._on_chat)
+
+        router = get_shard_router()
+        try:
+            intro = await router.request(router.owner(game_id), {"type": "relay_intro", "game_id": game_id}, "relay_intro")
+        except Exception as e:
+            print(f"Error fetching spectator intro of game {game_id}: {str(e)}")
+            intro = None
+
+        if intro is None or intro.get("frames") is None:
+            if not self.games[game_id]:
+                self._drop_game(game_id)
+            return False
+
+        for frame in intro["frames"]:
+            await websocket.send(Frame(text=frame).for_connection(websocket))
+        self.games[game_id].add(websocket)
+        self.spectator_games[websocket] = game_id
+        await self._publish_count(game_id)
+        print(f"Relaying game {game_id} to spectator {id(websocket)} ({len(self.games[game_id])} here)")
+        return True
+
+    def remove_spectator(self, websocket):
+        """
+        Stop relaying to a spectator (on leave or disconnect).
+
+        Args:
+            websocket: The spectator's WebSocket connection
+
+        Returns:
+            bool: True if the connection was a relayed spectator
+        """
+        game_id = self.spectator_games.pop(websocket, None)
+        if game_id is None:
+            return False
+
+        spectators = self.games.get(game_id)
+        if spectators is not None:
+            spectators.discard(websocket)
+            if not spectators:
+                self._drop_game(game_id)
+        task = asyncio.create_task(self._publish_count(game_id))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return True
+
+    def _drop_game(self, game_id):
+        bus = get_message_bus()
+        bus.unsubscribe(f"spectators/{game_id}", self._on_frames)
+        bus.unsubscribe(f"spectator_chat/{game_id}", self._on_chat)
+        self.games.pop(game_id, None)
+        self.latest_frames.pop(game_id, None)
+
+    async def _publish_count(self, game_id):
+        """Tell the owner how many spectators watch the game through this relay."""
+        await get_message_bus().publish(f"relay/{game_id}", {
+            "relay": self.relay_id,
+            "count": len(self.games.get(game_id, ()))
+        }, AT_LEAST_ONCE)
+
+    async def send_chat(self, websocket, text, username=None):
+        """
+        Send a relayed spectator's chat message to the game's owner.
+
+        Args:
+            websocket: The spectator's WebSocket connection
+            text: Message text
+            username: The spectator's display name
+        """
+        game_id = self.spectator_games.get(websocket)
+        if game_id is None:
+            return
+        await get_message_bus().publish(f"relay/{game_id}", {
+            "relay": self.relay_id,
+            "chat": {"sender": self.sender_token(websocket), "username": username, "text": text}
+        }, AT_LEAST_ONCE)
+
+    async def send_latest_state(self, websocket):
+        """
+        Answer a relayed spectator's request_game_state with the last relayed update.
+
+        Args:
+            websocket: The spectator's WebSocket connection
+
+        Returns:
+            bool: True if there was an update to send
+        """
+        frame = self.latest_frames.get(self.spectator_games.get(websocket))
+        if frame is None:
+            return False
+        await websocket.send(Frame(text=frame).for_connection(websocket))
+        return True
+
+    async def _on_frames(self, topic, frames):
+        """Bus callback: fan the owner's spectator frames out to this relay's spectators."""
+        game_id = topic[len("spectators/"):]
+        self.frames_relayed += len(frames)
+        for frame in reversed(frames):
+            if frame.startswith(GAME_UPDATE_PREFIX):
+                self.latest_frames[game_id] = frame
+                break
+        await self._send(game_id, frames)
+
+    async def _on_chat(self, topic, data):
+        """Bus callback: deliver a chat frame of the room, skipping the spectator who wrote it."""
+        game_id = topic[len("spectator_chat/"):]
+        exclude = data.get("exclude")
+        await self._send(game_id, [data["frame"]],
+                         lambda websocket: exclude is not None and self.sender_token(websocket) == exclude)
+
+    async def _send(self, game_id, frames, skip=None):
+        frames = [Frame(text=frame) for frame in frames]
+        failed = []
+        for websocket in list(self.games.get(game_id, ())):
+            if skip is not None and skip(websocket):
+                continue
+            try:
+                for frame in frames:
+                    await websocket.send(frame.for_connection(websocket))
+                self.frames_sent += len(frames)
+            except Exception as e:
+                print(f"Error relaying frames to spectator {id(websocket)}: {str(e)}")
+                failed.append(websocket)
+        for websocket in failed:
+            self.remove_spectator(websocket)
+
+    def get_stats(self):
+        """Return counters for the stats endpoint."""
+        return {
+            "games": len(self.games),
+            "spectators": len(self.spectator_games),
+            "frames_relayed": self.frames_relayed,
+            "frames_sent": self.frames_sent
+        }
+
+
+# Spectator relay of this process
+_spectator_relay = None
+
+
+def get_spectator_relay():
+    """
+    Get the process-wide spectator relay.
+
+    Returns:
+        SpectatorRelay: The shared relay
+    """
+    global _spectator_relay
+    if _spectator_relay is None:
+        _spectator_relay = SpectatorRelay()
+    return _spectator_relay
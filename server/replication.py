@@ -0,0 +1,428 @@
+# server/replication.py
+import os
+import sys
+import json
+import time
+import asyncio
+from collections import deque
+from chess_game import ChessGame
+from sharding import get_shard_router
+from config import REPLICATION_ROLE, REPLICATION_SOCKET_PATH, REPLICATION_HEARTBEAT
+
+# Seconds between attempts to reach the primary
+RECONNECT_DELAY = 0.5
+
+# Replication lag samples kept for the percentiles in get_stats()
+LAG_SAMPLES = 10000
+
+
+def shard_replication_path(path):
+    """
+    Get the replication socket of this worker.
+
+    Game IDs hash to the same shard on the primary and the standby, so when
+    running sharded, each shard streams its games on its own socket and the
+    standby's worker of the same shard follows it.
+
+    Args:
+        path: The configured replication socket path
+
+    Returns:
+        str: The path, suffixed with the shard index when sharded
+    """
+    shard_router = get_shard_router()
+    if shard_router.enabled:
+        return f"{path}.{shard_router.shard_index}"
+    return path
+
+
+def describe_game(session):
+    """
+    Describe a session for a standby that doesn't know it yet.
+
+    Args:
+        session: The GameSession
+
+    Returns:
+        dict: Game ID, time control, moves played, clock anchor and resume tokens
+    """
+    chess_game = session.chess_game
+    return {
+        "id": session.game_id,
+        "time_control": chess_game.time_control.to_spec(),
+        "moves": [move.uci() for move in chess_game.board.move_stack],
+        "clock": chess_game.clock.to_anchor(),
+        "tokens": session.resume_tokens
+    }
+
+
+def replay_game(game):
+    """
+    Rebuild a game from its describe_game() description.
+
+    Args:
+        game: The description
+
+    Returns:
+        ChessGame: The game, with the moves played and the clock as described
+    """
+    chess_game = ChessGame(time_control=game["time_control"])
+    for uci_move in game["moves"]:
+        chess_game.replay_move(uci_move)
+    chess_game.clock.restore_anchor(game["clock"])
+    return chess_game
+
+
+class ReplicationPublisher:
+    """
+    Primary side of hot failover: streams session events to standbys.
+
+    Frames are newline-delimited JSON on a Unix socket. A standby that connects
+    gets a snapshot of the ongoing games first, then one event per game start,
+    move (with the clock anchor after it) and game end. Every frame carries the
+    primary's send time, so standbys can measure their replication lag; heartbeats
+    keep the measurement going while no game changes. Events are written from the
+    synchronous points where the game changes, so they are in game order.
+    """
+
+    def __init__(self, path=REPLICATION_SOCKET_PATH, enabled=REPLICATION_ROLE == "primary"):
+        """
+        Initialize the publisher.
+
+        Args:
+            path: Path of the Unix socket standbys connect to (per shard, see shard_replication_path())
+            enabled: Whether events are streamed (see start())
+        """
+        self.path = shard_replication_path(path)
+        self.enabled = enabled
+        self.game_manager = None
+        self.standbys = set()   # Writers of the connected standbys
+        self.live_games = set()  # IDs of the games standbys hold a replica of
+        self.events = 0         # Events streamed (for metrics)
+        self._server = None
+        self._heartbeat_task = None
+
+    async def start(self, game_manager):
+        """
+        Start accepting standbys.
+
+        Args:
+            game_manager: The GameManager whose games are replicated
+        """
+        self.enabled = True
+        self.game_manager = game_manager
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self._server = await asyncio.start_unix_server(self._handle_standby, self.path)
+        self._heartbeat_task = asyncio.create_task(self._heartbeat_loop())
+        print(f"Replicating games to standbys on {self.path}")
+
+    async def close(self):
+        """Stop streaming and disconnect the standbys."""
+        if self._heartbeat_task is not None:
+            self._heartbeat_task.cancel()
+            self._heartbeat_task = None
+        if self._server is not None:
+            self._server.close()
+            self._server = None
+        for writer in list(self.standbys):
+            writer.close()
+        self.standbys.clear()
+
+    async def _handle_standby(self, reader, writer):
+        # Snapshot and registration happen in the same step, so no event falls in between
+        games = [describe_game(session) for session in self.game_manager.active_games.values()
+                 if not session.chess_game.is_game_over() and not session.awaiting_resume]
+        self.live_games.update(game["id"] for game in games)
+        writer.write(self._encode({"op": "snapshot", "games": games}))
+        self.standbys.add(writer)
+        print(f"Standby connected, sent a snapshot of {len(games)} games")
+        try:
+            # Standbys only listen: reading returns once they go away
+            await reader.read()
+        except OSError:
+            pass
+        finally:
+            self.standbys.discard(writer)
+            writer.close()
+            print("Standby disconnected")
+
+    def _encode(self, frame):
+        frame["t"] = time.time()
+        return json.dumps(frame).encode() + b"\n"
+
+    def _send(self, frame):
+        if not self.standbys:
+            return
+        encoded = self._encode(frame)
+        for writer in self.standbys:
+            writer.write(encoded)
+        self.events += 1
+
+    async def _heartbeat_loop(self):
+        while True:
+            await asyncio.sleep(REPLICATION_HEARTBEAT)
+            self._send({"op": "heartbeat"})
+
+    def game_started(self, session):
+        """Stream a game that started (or resumed after a failover)."""
+        if self.enabled:
+            self.live_games.add(session.game_id)
+            self._send({"op": "start", "game": describe_game(session)})
+
+    def move_made(self, session, uci_move):
+        """Stream a move, with the clock state it left behind."""
+        if self.enabled and session.game_id in self.live_games:
+            self._send({"op": "move", "id": session.game_id, "uci": uci_move,
+                        "clock": session.chess_game.clock.to_anchor()})
+
+    def game_ended(self, session):
+        """Stream the end of a game (finished or closed): standbys drop their replica."""
+        if self.enabled and session.game_id in self.live_games:
+            self.live_games.discard(session.game_id)
+            self._send({"op": "end", "id": session.game_id})
+
+    def get_stats(self):
+        """Return counters for the stats endpoint."""
+        return {"standbys": len(self.standbys), "games": len(self.live_games), "events": self.events}
+
+
+class StandbyReplica:
+    """
+    Standby side of hot failover: keeps warm ChessGame replicas of the primary's games.
+
+    follow() applies the primary's events until the stream ends - the primary
+    exited or crashed - and promote() then hands the replicas to this process's
+    GameManager, their clocks stopped at the moment the primary was lost. The
+    players' clients reconnect and resume their games with the tokens they got
+    in game_start; the clocks run again once both players are back.
+    """
+
+    def __init__(self, path=REPLICATION_SOCKET_PATH):
+        """
+        Initialize the replica.
+
+        Args:
+            path: Path of the primary's replication socket (per shard, see shard_replication_path())
+        """
+        self.path = shard_replication_path(path)
+        self.games = {}          # Maps game_id -> replicated ChessGame
+        self.resume_tokens = {}  # Maps game_id -> resume tokens of the game's players
+        self.events = 0          # Frames applied (for metrics)
+        self.lags = deque(maxlen=LAG_SAMPLES)  # Seconds between the primary sending and us applying a frame
+        self.lost_at = None      # Monotonic time the primary was lost
+        self.promotion_time = None  # Seconds from losing the primary to serving its games
+
+    async def follow(self):
+        """Apply the primary's events until the primary goes away (waiting for it to come up first)."""
+        while True:
+            try:
+                reader, writer = await asyncio.open_unix_connection(self.path, limit=2 ** 24)
+                break
+            except OSError as e:
+                print(f"Waiting for the primary at {self.path}: {str(e)}")
+                await asyncio.sleep(RECONNECT_DELAY)
+
+        print(f"Following the primary at {self.path}")
+        try:
+            async for line in reader:
+                self.apply(json.loads(line))
+        except (OSError, ValueError) as e:
+            # A crash can cut the last frame short
+            print(f"Replication stream ended: {str(e)}")
+        finally:
+            writer.close()
+        self.lost_at = time.monotonic()
+        print(f"Primary gone, taking over {len(self.games)} games")
+
+    def apply(self, frame):
+        """
+        Apply one frame of the replication stream.
+
+        Args:
+            frame: The decoded frame
+        """
+        self.events += 1
+        self.lags.append(max(0.0, time.time() - frame["t"]))
+        op = frame["op"]
+        if op == "move":
+            chess_game = self.games.get(frame["id"])
+            if chess_game is not None:
+                chess_game.replay_move(frame["uci"], frame["clock"])
+        elif op == "start":
+            self._add_game(frame["game"])
+        elif op == "end":
+            self.games.pop(frame["id"], None)
+            self.resume_tokens.pop(frame["id"], None)
+        elif op == "snapshot":
+            self.games.clear()
+            self.resume_tokens.clear()
+            for game in frame["games"]:
+                self._add_game(game)
+
+    def _add_game(self, game):
+        self.games[game["id"]] = replay_game(game)
+        self.resume_tokens[game["id"]] = game["tokens"]
+
+    def promote(self, game_manager):
+        """
+        Hand the replicated games to this process's GameManager.
+
+        Args:
+            game_manager: The GameManager taking over the games
+
+        Returns:
+            int: Number of games restored
+        """
+        for game_id, chess_game in self.games.items():
+            # The side to move is charged up to the moment the primary was lost, not for the outage
+            chess_game.clock.stop(self.lost_at)
+            game_manager.restore_game(game_id, chess_game, self.resume_tokens[game_id])
+        return len(self.games)
+
+    def mark_serving(self):
+        """Record that the promoted process accepts connections again."""
+        self.promotion_time = time.monotonic() - self.lost_at
+        print(f"Standby promoted in {self.promotion_time * 1000:.1f} ms ({len(self.games)} games restored)")
+
+    def get_stats(self):
+        """Return counters for the stats endpoint (lag percentiles in milliseconds)."""
+        lags = sorted(self.lags)
+        stats = {"games": len(self.games), "events": self.events}
+        if lags:
+            stats["lag_ms"] = {
+                "mean": round(sum(lags) / len(lags) * 1000, 3),
+                "p50": round(lags[len(lags) // 2] * 1000, 3),
+                "p99": round(lags[min(len(lags) - 1, int(len(lags) * 0.99))] * 1000, 3),
+                "max": round(lags[-1] * 1000, 3)
+            }
+        if self.promotion_time is not None:
+            stats["promotion_ms"] = round(self.promotion_time * 1000, 1)
+        return stats
+
+
+# Replication publisher and standby replica of this process
+_replication_publisher = None
+_standby_replica = None
+
+
+def get_replication_publisher():
+    """
+    Get the process-wide replication publisher (streaming only when it is enabled).
+
+    Returns:
+        ReplicationPublisher: The shared publisher
+    """
+    global _replication_publisher
+    if _replication_publisher is None:
+        _replication_publisher = ReplicationPublisher()
+    return _replication_publisher
+
+
+def get_standby_replica():
+    """
+    Get the process-wide standby replica.
+
+    Returns:
+        StandbyReplica: The shared replica
+    """
+    global _standby_replica
+    if _standby_replica is None:
+        _standby_replica = StandbyReplica()
+    return _standby_replica
+
+
+async def run_benchmark(game_count, plies, interval):
+    """
+    Measure replication lag and promotion time.
+
+    This process plays random moves in game_count games as the primary while a
+    standby process follows; the primary then stops abruptly and the standby
+    reports its lag, how long it took to restore the games and listen again,
+    and whether the restored positions match.
+
+    Args:
+        game_count: Number of concurrent games
+        plies: Moves played per game
+        interval: Seconds between rounds of one move per game
+    """
+    import random
+    import hashlib
+    import contextlib
+    from types import SimpleNamespace
+    from game_session import GameSession
+
+    path = f"{REPLICATION_SOCKET_PATH}.bench"
+    sessions = {}
+    publisher = ReplicationPublisher(path)
+    await publisher.start(SimpleNamespace(active_games=sessions))
+    standby = await asyncio.create_subprocess_exec(sys.executable, os.path.abspath(__file__), "bench-standby", path,
+                                                   stdout=asyncio.subprocess.PIPE)
+    while not publisher.standbys:
+        await asyncio.sleep(0.05)
+
+    with contextlib.redirect_stdout(open(os.devnull, "w")):
+        for index in range(game_count):
+            session = GameSession(f"bench-{index}", None, None, time_control="300+2")
+            session.chess_game.assign_player(2 * index, "white")
+            session.chess_game.assign_player(2 * index + 1, "black")
+            session.chess_game.start_clock()
+            sessions[session.game_id] = session
+            publisher.game_started(session)
+
+        started = time.monotonic()
+        for _ in range(plies):
+            for session in sessions.values():
+                chess_game = session.chess_game
+                if chess_game.is_game_over():
+                    continue
+                uci_move = random.choice(list(chess_game.board.legal_moves)).uci()
+                chess_game.make_move(uci_move, chess_game.players[chess_game.get_turn_color_string()])
+                publisher.move_made(session, uci_move)
+                if chess_game.is_game_over():
+                    publisher.game_ended(session)
+            await asyncio.sleep(interval)
+        elapsed = time.monotonic() - started
+
+    expected = hashlib.sha1("".join(sorted(f"{game_id} {session.chess_game.get_board_fen()}\n"
+                                           for game_id, session in sessions.items()
+                                           if not session.chess_game.is_game_over())).encode()).hexdigest()
+    await publisher.close()  # The standby sees the primary go away
+    output, _ = await standby.communicate()
+    report = json.loads(output.decode().strip().splitlines()[-1])
+    report["consistent"] = report.pop("digest") == expected
+    report["events_per_second"] = round(publisher.events / elapsed)
+    print(json.dumps(report, indent=2))
+
+
+async def run_benchmark_standby(path):
+    """Standby half of run_benchmark(): follow, promote, listen, and print a JSON report."""
+    import hashlib
+    import contextlib
+    import websockets
+    from game_manager import GameManager
+
+    replica = StandbyReplica(path)
+    with contextlib.redirect_stdout(open(os.devnull, "w")):
+        await replica.follow()
+        game_manager = GameManager()
+        replica.promote(game_manager)
+        server = await websockets.serve(lambda websocket: websocket.close(), "127.0.0.1", 0)
+        replica.mark_serving()
+        server.close()
+    stats = replica.get_stats()
+    stats["digest"] = hashlib.sha1("".join(sorted(f"{game_id} {session.chess_game.get_board_fen()}\n"
+                                                  for game_id, session in game_manager.active_games.items())
+                                          ).encode()).hexdigest()
+    print(json.dumps(stats))
+
+
+if __name__ == "__main__":
+    # python replication.py bench [games] [plies] [interval]: benchmark replication lag and promotion time
+    if len(sys.argv) > 2 and sys.argv[1] == "bench-standby":
+        asyncio.run(run_benchmark_standby(sys.argv[2]))
+    else:
+        arguments = sys.argv[2:] if len(sys.argv) > 1 and sys.argv[1] == "bench" else []
+        asyncio.run(run_benchmark(int(arguments[0]) if len(arguments) > 0 else 1000,
+                                  int(arguments[1]) if len(arguments) > 1 else 40,
+                                  float(arguments[2]) if len(arguments) > 2 else 0.01))
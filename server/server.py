@@ -6,8 +6,26 @@ import logging
 import sys
 import os
 import time
+import hmac
+import signal
+import subprocess
 from game_manager import GameManager
 from lobby import Lobby
+from latency import get_latency_tracker, remove_latency_tracker
+from ratelimit import ConnectionRateLimiter, message_size_allowed
+from tv import get_tv_channel
+from thumbnails import get_thumbnail_cache
+from http_api import HttpApi
+from bus import get_message_bus, BusBroker, AT_LEAST_ONCE
+from relay import get_spectator_relay
+from sharding import get_shard_router, shard_socket_path, SHARD_INTERNAL_TYPES
+from replication import get_replication_publisher, get_standby_replica
+from drain import get_drain_controller, open_listening_socket
+from reaper import get_session_reaper
+from codec import send_message, Frame, select_subprotocol
+from compression import get_connection_profiles
+from config import RATE_LIMIT_ENABLED, WORKER_COUNT, SHARD_INDEX, FEATURED_GAMES_COUNT, BUS_BACKEND, \
+    RELAY_WORKER_COUNT, REPLICATION_ROLE, ADMIN_TOKEN, MAX_MESSAGE_SIZE, MAX_QUEUE
 
 # Set up logging
 logging.basicConfig(
@@ -19,12 +37,135 @@ logger = logging.getLogger(__name__)
 # Initialize game manager and lobby
 game_manager = GameManager()
 lobby = Lobby(game_manager)
+tv_channel = get_tv_channel()
+tv_channel.bind(game_manager)
+shard_router = get_shard_router()
+message_bus = get_message_bus()
+spectator_relay = get_spectator_relay()
+standby_replica = get_standby_replica()
+drain_controller = get_drain_controller()
+session_reaper = get_session_reaper()
+connection_profiles = get_connection_profiles()
+
+# Message bus topic carrying lobby chat to every server process
+LOBBY_CHAT_TOPIC = "lobby/chat"
 
 # Set to keep track of all connected clients
 ALL_CONNECTED_CLIENTS = set()
 # Dictionary to map client IDs to usernames - simple key-value store
 CLIENT_USERNAMES = {}
 
+# Read-only HTTP API (/games, /games/{id}, /stats) served on the WebSocket port
+http_api = HttpApi(game_manager, ALL_CONNECTED_CLIENTS)
+
+
+def process_request(connection, request):
+    """
+    `process_request` hook: answer HTTP API requests, and choose the compression
+    profile of WebSocket connections before their handshake.
+
+    Args:
+        connection: The ServerConnection
+        request: The HTTP request
+
+    Returns:
+        Response or None: The API response, or None to continue with the WebSocket handshake
+    """
+    response = http_api.process_request(connection, request)
+    if response is None:
+        connection_profiles.assign(connection)
+    return response
+
+
+# Graceful drain and restart (signals and the admin_drain command)
+drain_controller.bind(game_manager, lobby, ALL_CONNECTED_CLIENTS)
+
+# Session lifecycle deadlines (first move, disconnect grace, finished games) and the session cap
+session_reaper.bind(game_manager, lobby)
+
+# Throttled requests of these types are answered once when the limit allows,
+# instead of being dropped; further duplicates in the meantime are merged into it
+COALESCED_MESSAGE_TYPES = {"request_game_state"}
+DEFERRED_REQUEST_TASKS = set()
+
+# Maximum number of thumbnails returned by one get_thumbnails request
+MAX_THUMBNAILS_PER_REQUEST = 32
+
+async def replay_deferred_request(websocket, rate_limiter, msg_type, delay):
+    """
+    Process a throttled (coalesced) request once its rate limit allows it.
+
+    Args:
+        websocket: The WebSocket connection that sent the request
+        rate_limiter: The connection's ConnectionRateLimiter
+        msg_type: The deferred message type
+        delay: Seconds to wait for a token
+    """
+    await asyncio.sleep(delay)
+    message_str = rate_limiter.take_deferred(msg_type)
+    if message_str is None:
+        return
+
+    client_id = id(websocket)
+    try:
+        if client_id in game_manager.player_to_game or client_id in game_manager.spectator_to_game:
+            await game_manager.handle_client_message(websocket, message_str)
+        else:
+            logger.info(f"Dropping deferred {msg_type} from client {client_id}: not in a game anymore")
+    except Exception as e:
+        logger.error(f"Error processing deferred {msg_type}: {str(e)}")
+
+async def deliver_lobby_chat(topic, data):
+    """
+    Message bus callback: send a lobby chat message to this process's clients.
+
+    Args:
+        topic: LOBBY_CHAT_TOPIC
+        data: Dict with the chat message, the sender's client ID and process, and
+            whether only clients outside of games receive it
+    """
+    chat_frame = Frame(data["message"])
+    sender_id = data["sender_id"] if data["origin"] == os.getpid() else None
+    for client in list(ALL_CONNECTED_CLIENTS):
+        current_client_id = id(client)
+        # Skip the sender, and clients proxied to another worker (that worker delivers to them)
+        if current_client_id == sender_id or client in shard_router.relaying:
+            continue
+        if data.get("lobby_only") and (current_client_id in game_manager.player_to_game or
+                                       current_client_id in game_manager.spectator_to_game):
+            continue
+        try:
+            await client.send(chat_frame.for_connection(client))
+            logger.info(f"Sent lobby chat message to client {current_client_id}")
+        except Exception as e:
+            logger.error(f"Error sending lobby chat message: {str(e)}")
+
+async def handle_shard_message(websocket, msg_type, message_data):
+    """
+    Handle a message another worker sends over a proxied connection.
+
+    Args:
+        websocket: The proxied WebSocket connection
+        msg_type: 'join_match' or 'shard_list_games'
+        message_data: The parsed message
+    """
+    if msg_type == "join_match":
+        # A player matched on the matchmaking shard, handed off to create the game here
+        await lobby.join_match(websocket, message_data.get("token"), message_data.get("color"))
+    elif msg_type == "relay_intro":
+        # Another worker's relay starts holding spectators of one of our games
+        session = game_manager.active_games.get(message_data.get("game_id"))
+        await send_message(websocket, {
+            "type": "relay_intro",
+            "frames": [frame.text for frame in session.build_spectator_intro()] if session is not None else None
+        })
+    elif msg_type == "shard_list_games":
+        await send_message(websocket, {
+            "type": "shard_games",
+            "games": game_manager.get_active_games_info(),
+            "featured": game_manager.get_featured_entries(FEATURED_GAMES_COUNT)
+        })
+
 async def handler(websocket):
     """
     Handle WebSocket connections and messages.
@@ -42,18 +183,29 @@ async def handler(websocket):
 
         # Add the client to the set of connected clients
         ALL_CONNECTED_CLIENTS.add(websocket)
-        print(f"New client connected: {client_id} from {remote}")
+        profile = connection_profiles.connected(websocket)
+        print(f"New client connected: {client_id} from {remote} (compression: {profile})")
 
         # Send initial status message
         try:
-            await websocket.send(json.dumps({
+            await send_message(websocket, {
                 "type": "status",
                 "message": "Connected. Choose action."
-            }))
+            })
         except Exception as e:
             logger.error(f"Error sending initial status: {str(e)}")
             return
 
+        # Per-connection, per-message-type rate limits
+        rate_limiter = ConnectionRateLimiter()
+
+        # Start the clock-sync handshake so lag compensation has an estimate early
+        latency_tracker = get_latency_tracker(client_id)
+        try:
+            await send_message(websocket, latency_tracker.build_ping())
+        except Exception as e:
+            logger.error(f"Error sending clock-sync ping: {str(e)}")
+
         # Process incoming messages
         async for message_str in websocket:
             try:
@@ -61,6 +213,33 @@ async def handler(websocket):
                 message_data = json.loads(message_str)
                 msg_type = message_data.get('type')
 
+                # Reject messages over the size limit of their type
+                if not message_size_allowed(msg_type, len(message_str)):
+                    logger.warning(f"Rejected oversized {msg_type} message ({len(message_str)} bytes) from client {client_id}")
+                    await send_message(websocket, {
+                        "type": "error",
+                        "message": "Message too large.",
+                        "too_large": msg_type
+                    })
+                    continue
+
+                # Enforce the rate limits first (pongs answer our own pings and are never limited)
+                if RATE_LIMIT_ENABLED and msg_type != "pong" and not rate_limiter.allow(msg_type):
+                    if msg_type in COALESCED_MESSAGE_TYPES:
+                        delay = rate_limiter.defer(msg_type, message_str)
+                        if delay is not None:
+                            task = asyncio.create_task(replay_deferred_request(websocket, rate_limiter, msg_type, delay))
+                            DEFERRED_REQUEST_TASKS.add(task)
+                            task.add_done_callback(DEFERRED_REQUEST_TASKS.discard)
+                    elif rate_limiter.should_notify():
+                        logger.warning(f"Rate limiting client {client_id} ({msg_type}, {rate_limiter.throttled} throttled so far)")
+                        await send_message(websocket, {
+                            "type": "error",
+                            "message": "You are sending messages too fast. Please slow down.",
+                            "rate_limited": msg_type
+                        })
+                    continue
+
                 # Check if the client is in a game or spectating
                 logger.info(f"Checking if client {client_id} is in a game or spectating")
                 logger.info(f"Message type: {msg_type}")
@@ -94,13 +273,110 @@ async def handler(websocket):
                             message_data["game_id"] = client_game_id
                             message_str = json.dumps(message_data)
 
+                # Resync periodically, piggybacked on client traffic
+                if latency_tracker.needs_sync():
+                    try:
+                        await send_message(websocket, latency_tracker.build_ping())
+                    except Exception as e:
+                        logger.error(f"Error sending clock-sync ping: {str(e)}")
+
                 # Handle ping/pong messages to keep the connection alive
                 if msg_type == "ping":
-                    # Respond with a pong message
-                    await websocket.send(json.dumps({"type": "pong"}))
+                    # Respond with a pong message, echoing the client's timestamp
+                    # so it can measure the round trip and its offset too
+                    await send_message(websocket, {
+                        "type": "pong",
+                        "t0": message_data.get("t0"),
+                        "server_time": int(time.time() * 1000)
+                    })
                     continue
                 elif msg_type == "pong":
-                    # Just acknowledge the pong
+                    # Answer to a clock-sync ping: update the RTT/offset estimate
+                    latency_tracker.record_pong(message_data)
+                    continue
+
+                # Operator command: drain this server (and restart it on the same socket)
+                if msg_type == "admin_drain":
+                    token = message_data.get("token")
+                    if ADMIN_TOKEN and isinstance(token, str) and hmac.compare_digest(token, ADMIN_TOKEN):
+                        logger.warning(f"Drain requested by client {client_id}")
+                        drain_controller.request(restart=bool(message_data.get("restart")))
+                        await send_message(websocket, {"type": "status", "message": "Draining."})
+                    else:
+                        await send_message(websocket, {"type": "error", "message": "Not authorized."})
+                    continue
+
+                # Game affinity: traffic for a game owned by another worker is handled by that worker
+                if shard_router.enabled:
+                    if msg_type in SHARD_INTERNAL_TYPES:
+                        if shard_router.is_forwarded(websocket):
+                            await handle_shard_message(websocket, msg_type, message_data)
+                        continue
+
+                    # Spectators of remote games held by the relay are served from it
+                    if spectator_relay.is_watching(websocket):
+                        if msg_type == "request_game_state":
+                            await spectator_relay.send_latest_state(websocket)
+                            continue
+                        elif msg_type == "chat_message":
+                            username = message_data.get('username')
+                            if username:
+                                CLIENT_USERNAMES[client_id] = username
+                            await spectator_relay.send_chat(websocket, message_data.get('text', ''),
+                                                            CLIENT_USERNAMES.get(client_id))
+                            continue
+                        elif msg_type == "leave_game":
+                            spectator_relay.remove_spectator(websocket)
+                            await send_message(websocket, {
+                                "type": "status",
+                                "message": "Left game. Ready to join a new game."
+                            })
+                            continue
+
+                    target_shard = None
+                    if client_id not in game_manager.player_to_game and client_id not in game_manager.spectator_to_game:
+                        target_shard = shard_router.route(websocket, msg_type, message_data)
+                    if target_shard is not None:
+                        spectator_relay.remove_spectator(websocket)
+                        if shard_router.is_forwarded(websocket):
+                            # Already proxied by another worker: let that edge move the connection
+                            await websocket.send(json.dumps(shard_router.build_redirect(target_shard, message_data)))
+                        else:
+                            await shard_router.forward(websocket, target_shard, message_str)
+                            break
+                        continue
+
+                # Multiplexed TV channel: watch several games (or the top games) on this connection
+                if msg_type == "tv_subscribe":
+                    game_ids = message_data.get("game_ids") or []
+                    top = message_data.get("top") or 0
+                    if not isinstance(game_ids, list) or not isinstance(top, int):
+                        await send_message(websocket, {
+                            "type": "error",
+                            "message": "tv_subscribe expects a list of game_ids and/or an integer top"
+                        })
+                        continue
+                    await tv_channel.subscribe(websocket, game_ids, top)
+                    logger.info(f"Client {client_id} subscribed to TV: games={game_ids}, top={top}")
+                    continue
+                elif msg_type == "get_thumbnails":
+                    # Resolve lobby thumbnail references (content hashes) to SVGs
+                    keys = message_data.get("keys")
+                    if not isinstance(keys, list):
+                        keys = []
+                    thumbnail_cache = get_thumbnail_cache()
+                    svgs = {}
+                    for key in keys[:MAX_THUMBNAILS_PER_REQUEST]:
+                        svg = thumbnail_cache.get_svg(key) if isinstance(key, str) else None
+                        if svg is not None:
+                            svgs[key] = svg
+                    await send_message(websocket, {"type": "thumbnails", "svgs": svgs})
+                    continue
+                elif msg_type == "tv_unsubscribe":
+                    game_ids = message_data.get("game_ids")
+                    tv_channel.unsubscribe(websocket, game_ids if isinstance(game_ids, list) else None,
+                                           bool(message_data.get("top")))
+                    logger.info(f"Client {client_id} unsubscribed from TV")
                     continue
 
                 # Handle chat messages specially
@@ -207,24 +483,12 @@ async def handler(websocket):
                             "username": sender_display  # Include the username explicitly
                         }
 
-                        # Broadcast to all clients in the lobby EXCEPT the sender
-                        for client in ALL_CONNECTED_CLIENTS:
-                            try:
-                                # Skip the sender
-                                if client == websocket:
-                                    logger.info(f"Skipping sender client {client_id}")
-                                    continue
-
-                                # Also skip if client ID matches the sender ID
-                                current_client_id = id(client)
-                                if current_client_id == client_id:
-                                    logger.info(f"Skipping sender client by ID match: {current_client_id}")
-                                    continue
-
-                                await client.send(json.dumps(chat_message))
-                                logger.info(f"Sent lobby chat message to client {id(client)}")
-                            except Exception as e:
-                                logger.error(f"Error sending lobby chat message: {str(e)}")
+                        # Broadcast to all clients in the lobby EXCEPT the sender, in every server process
+                        await message_bus.publish(LOBBY_CHAT_TOPIC, {
+                            "message": chat_message,
+                            "sender_id": client_id,
+                            "origin": os.getpid()
+                        }, AT_LEAST_ONCE)
 
                         continue
 
@@ -300,10 +564,10 @@ async def handler(websocket):
 
                         # Just register the client, don't add to queue
                         try:
-                            await websocket.send(json.dumps({
+                            await send_message(websocket, {
                                 "type": "status",
                                 "message": "Connected to lobby. Select an option to continue."
-                            }))
+                            })
                             logger.info(f"Sent lobby join confirmation to client {client_id}")
                         except Exception as e:
                             logger.error(f"Error sending lobby join confirmation to client {client_id}: {str(e)}")
@@ -337,10 +601,10 @@ async def handler(websocket):
 
                         # Send confirmation to the client
                         try:
-                            await websocket.send(json.dumps({
+                            await send_message(websocket, {
                                 "type": "status",
                                 "message": "Joined queue. Waiting for opponent..."
-                            }))
+                            })
                             logger.info(f"Sent queue join confirmation to client {client_id}")
 
                             # IMPORTANT: Try to match players immediately
@@ -355,10 +619,10 @@ async def handler(websocket):
                         lobby.remove_player(websocket)
                         logger.info(f"Client {client_id} removed from queue")
                         try:
-                            await websocket.send(json.dumps({
+                            await send_message(websocket, {
                                 "type": "status",
                                 "message": "Left queue. Returned to main menu."
-                            }))
+                            })
                             logger.info(f"Sent queue leave confirmation to client {client_id}")
                         except Exception as e:
                             logger.error(f"Error sending queue leave confirmation to client {client_id}: {str(e)}")
@@ -381,13 +645,9 @@ async def handler(websocket):
                                 game_id = provided_game_id
                                 logger.info(f"Using provided game_id: {game_id}")
 
-                                # CRITICAL FIX: If force_end is True, mark the game as ended
+                                # With force_end the game ends with the game_over broadcast below
                                 if force_end:
-                                    logger.info(f"CRITICAL: Marking game {game_id} as ended due to force_end flag")
-                                    game_session = game_manager.active_games.get(game_id)
-                                    if game_session:
-                                        game_session.is_game_over = True
-                                        logger.info(f"CRITICAL: Game {game_id} marked as ended")
+                                    logger.info(f"CRITICAL: Game {game_id} is ended due to force_end flag")
                             else:
                                 logger.warning(f"Provided game_id {provided_game_id} is not valid")
                                 # Continue with the normal flow to check if the client is in a game
@@ -464,7 +724,7 @@ async def handler(websocket):
                                                 "timestamp": int(time.time() * 1000)  # Add timestamp for ordering
                                             }
                                             logger.info(f"CRITICAL: Sending win_notification to remaining player: {win_notification}")
-                                            await opponent_websocket.send(json.dumps(win_notification))
+                                            await send_message(opponent_websocket, win_notification)
                                             logger.info(f"CRITICAL: Successfully sent win_notification")
 
                                             # Add a small delay to ensure the win_notification is processed first
@@ -484,7 +744,7 @@ async def handler(websocket):
                                                 "timestamp": int(time.time() * 1000)  # Add timestamp for ordering
                                             }
                                             logger.info(f"CRITICAL: Sending direct game_over message to remaining player: {game_over_message}")
-                                            await opponent_websocket.send(json.dumps(game_over_message))
+                                            await send_message(opponent_websocket, game_over_message)
                                             logger.info(f"CRITICAL: Successfully sent direct game_over message")
 
                                             # Add a small delay to ensure the game_over message is processed
@@ -500,7 +760,7 @@ async def handler(websocket):
                                                 "timestamp": int(time.time() * 1000)  # Add timestamp for ordering
                                             }
                                             logger.info(f"CRITICAL: Sending direct opponent_disconnected message to remaining player: {direct_message}")
-                                            await opponent_websocket.send(json.dumps(direct_message))
+                                            await send_message(opponent_websocket, direct_message)
                                             logger.info(f"CRITICAL: Successfully sent direct opponent_disconnected message")
 
                                             # Add another small delay to ensure the messages are processed
@@ -522,7 +782,7 @@ async def handler(websocket):
                                                 "timestamp": int(time.time() * 1000)  # Add timestamp for ordering
                                             }
                                             logger.info(f"CRITICAL: Sending final game update to remaining player: {final_update}")
-                                            await opponent_websocket.send(json.dumps(final_update))
+                                            await send_message(opponent_websocket, final_update)
                                             logger.info(f"CRITICAL: Successfully sent final game update")
 
                                             # Add another small delay to ensure all messages are processed
@@ -538,7 +798,7 @@ async def handler(websocket):
                                                 "isSystem": True
                                             }
                                             logger.info(f"CRITICAL: Sending system chat message to remaining player: {chat_message}")
-                                            await opponent_websocket.send(json.dumps(chat_message))
+                                            await send_message(opponent_websocket, chat_message)
                                             logger.info(f"CRITICAL: Successfully sent system chat message")
 
                                             # CRITICAL FIX: Send a special forced win message that will be displayed regardless of client state
@@ -551,7 +811,7 @@ async def handler(websocket):
                                                 "timestamp": int(time.time() * 1000)
                                             }
                                             logger.info(f"CRITICAL: Sending forced win message to remaining player: {forced_win_message}")
-                                            await opponent_websocket.send(json.dumps(forced_win_message))
+                                            await send_message(opponent_websocket, forced_win_message)
                                             logger.info(f"CRITICAL: Successfully sent forced win message")
 
                                             # CRITICAL FIX: Send an alert message that will be displayed regardless of client state
@@ -562,7 +822,7 @@ async def handler(websocket):
                                                 "timestamp": int(time.time() * 1000)
                                             }
                                             logger.info(f"CRITICAL: Sending alert message to remaining player: {alert_message}")
-                                            await opponent_websocket.send(json.dumps(alert_message))
+                                            await send_message(opponent_websocket, alert_message)
                                             logger.info(f"CRITICAL: Successfully sent alert message")
                                         except Exception as e:
                                             logger.error(f"CRITICAL ERROR: Error sending direct messages: {str(e)}")
@@ -579,10 +839,10 @@ async def handler(websocket):
 
                             # Send confirmation
                             try:
-                                await websocket.send(json.dumps({
+                                await send_message(websocket, {
                                     "type": "status",
                                     "message": "Left game. Ready to join a new game."
-                                }))
+                                })
                                 logger.info(f"Sent game leave confirmation to client {client_id}")
                             except Exception as e:
                                 logger.error(f"Error sending game leave confirmation to client {client_id}: {str(e)}")
@@ -601,28 +861,54 @@ async def handler(websocket):
 
                             # Send an error message to the client
                             try:
-                                await websocket.send(json.dumps({
+                                await send_message(websocket, {
                                     "type": "error",
                                     "message": f"Error listing games: {str(e)}"
-                                }))
+                                })
                             except Exception as e2:
                                 logger.error(f"Error sending error message to client {client_id}: {str(e2)}")
 
                     elif msg_type == "spectate_game":
                         game_id_to_spectate = message_data.get('game_id')
-                        if game_id_to_spectate:
+                        if game_id_to_spectate and shard_router.relay_spectators and \
+                                not shard_router.is_local(game_id_to_spectate):
+                            # Another worker owns the game: watch it through this worker's relay
+                            success = await spectator_relay.add_spectator(websocket, game_id_to_spectate)
+                            if not success:
+                                await send_message(websocket, {
+                                    "type": "error",
+                                    "message": f"Game {game_id_to_spectate} not found."
+                                })
+                        elif game_id_to_spectate:
                             success = await game_manager.add_spectator_to_game(
                                 game_id_to_spectate, websocket)
                             if not success:
-                                await websocket.send(json.dumps({
+                                await send_message(websocket, {
                                     "type": "error",
                                     "message": f"Game {game_id_to_spectate} not found."
-                                }))
+                                })
                         else:
-                            await websocket.send(json.dumps({
+                            await send_message(websocket, {
                                 "type": "error",
                                 "message": "Missing game_id parameter."
-                            }))
+                            })
+
+                    elif msg_type == "resume_game":
+                        # A player reconnecting to their game (e.g. after a failover to the standby)
+                        game_id_to_resume = message_data.get('game_id')
+                        username = message_data.get('username')
+                        if username:
+                            CLIENT_USERNAMES[client_id] = username
+                        lobby.remove_player(websocket)
+                        resumed = isinstance(game_id_to_resume, str) and \
+                            await game_manager.resume_player(websocket, game_id_to_resume, message_data.get('token'))
+                        if resumed:
+                            logger.info(f"Client {client_id} resumed game {game_id_to_resume}")
+                        else:
+                            await send_message(websocket, {
+                                "type": "error",
+                                "message": f"Game {game_id_to_resume} not found."
+                            })
 
                     elif msg_type == "chat_message":
                         # Get the message text and game ID
@@ -698,33 +984,15 @@ async def handler(websocket):
                                 "username": sender_id  # Include the username explicitly
                             }
 
-                            chat_json = json.dumps(chat_message)
                             logger.info(f"Broadcasting lobby chat message: {chat_message}")
 
-                            # Broadcast to ALL clients in the lobby, EXCEPT the sender
-                            # This matches the working implementation's broadcast function
-                            for client in ALL_CONNECTED_CLIENTS:
-                                try:
-                                    # Skip the sender
-                                    if client == websocket:
-                                        logger.info(f"Skipping sender client {client_id}")
-                                        continue
-
-                                    # Get the current client ID
-                                    current_client_id = id(client)
-
-                                    # Also skip if client ID matches the sender ID
-                                    if current_client_id == client_id:
-                                        logger.info(f"Skipping sender client by ID match: {current_client_id}")
-                                        continue
-
-                                    # Only send to clients that are not in a game
-                                    if (current_client_id not in game_manager.player_to_game and
-                                        current_client_id not in game_manager.spectator_to_game):
-                                        await client.send(chat_json)
-                                        logger.info(f"Sent lobby chat message to client {current_client_id}")
-                                except Exception as e:
-                                    logger.error(f"Error sending lobby chat message: {str(e)}")
+                            # Broadcast to the clients in the lobby (not in a game), EXCEPT the sender
+                            await message_bus.publish(LOBBY_CHAT_TOPIC, {
+                                "message": chat_message,
+                                "sender_id": client_id,
+                                "origin": os.getpid(),
+                                "lobby_only": True
+                            }, AT_LEAST_ONCE)
 
                     elif msg_type == "request_game_state":
                         # Handle request for game state update
@@ -744,7 +1012,7 @@ async def handler(websocket):
                             logger.info(f"Client {client_id} requested game state update, using their player game ID: {player_game_id}")
                             game_session = game_manager.active_games.get(player_game_id)
                             if game_session:
-                                await game_session.broadcast_game_state()
+                                game_session.send_game_state(websocket)
                                 return
                             else:
                                 logger.warning(f"Player {client_id} has game ID {player_game_id} but no active game session found")
@@ -755,7 +1023,7 @@ async def handler(websocket):
                             logger.info(f"Client {client_id} requested game state update, using their spectator game ID: {spectator_game_id}")
                             game_session = game_manager.active_games.get(spectator_game_id)
                             if game_session:
-                                await game_session.broadcast_game_state()
+                                game_session.send_game_state(websocket)
                                 return
                             else:
                                 logger.warning(f"Spectator {client_id} has game ID {spectator_game_id} but no active game session found")
@@ -767,27 +1035,27 @@ async def handler(websocket):
                             game_session = game_manager.active_games[game_id]
 
                             # CRITICAL FIX: Check if the game is over
-                            if game_session.is_game_over:
+                            if game_session.finished:
                                 logger.info(f"CRITICAL: Game {game_id} is over, sending game_over message")
 
                                 # Send a game_over message to the client
                                 try:
-                                    await websocket.send(json.dumps({
+                                    await send_message(websocket, {
                                         "type": "game_over",
                                         "game_id": game_id,
                                         "result": "game_ended",
                                         "details": "This game has ended.",
                                         "timestamp": int(time.time() * 1000)
-                                    }))
+                                    })
                                     logger.info(f"CRITICAL: Sent game_over message to client {client_id}")
 
                                     # Also send an alert message
-                                    await websocket.send(json.dumps({
+                                    await send_message(websocket, {
                                         "type": "alert",
                                         "message": "This game has ended. Please start a new game.",
                                         "game_id": game_id,
                                         "timestamp": int(time.time() * 1000)
-                                    }))
+                                    })
                                     logger.info(f"CRITICAL: Sent alert message to client {client_id}")
                                 except Exception as e:
                                     logger.error(f"CRITICAL ERROR: Error sending game_over message: {str(e)}")
@@ -804,7 +1072,7 @@ async def handler(websocket):
                                 logger.info(f"Client {client_id} is already spectating game {game_id}, updating spectator mapping")
                                 game_manager.spectator_to_game[client_id] = game_id
 
-                            await game_session.broadcast_game_state()
+                            game_session.send_game_state(websocket)
                         else:
                             # CRITICAL FIX: Don't send an error for this - it's likely just a client that reconnected
                             # and is trying to get the state of a game that no longer exists
@@ -816,28 +1084,29 @@ async def handler(websocket):
                             return
                     else:
                         logger.error(f"Unknown command: {msg_type}")
-                        await websocket.send(json.dumps({
+                        await send_message(websocket, {
                             "type": "error",
                             "message": f"Unknown command: {msg_type}"
-                        }))
+                        })
 
             except json.JSONDecodeError:
-                await websocket.send(json.dumps({
+                await send_message(websocket, {
                     "type": "error",
                     "message": "Invalid JSON message."
-                }))
+                })
             except Exception as e:
                 logger.error(f"Error processing message: {str(e)}")
-                await websocket.send(json.dumps({
+                await send_message(websocket, {
                     "type": "error",
                     "message": f"Server error: {str(e)}"
-                }))
+                })
 
     finally:
         # Clean up when the connection is closed
         try:
             if websocket in ALL_CONNECTED_CLIENTS:
                 ALL_CONNECTED_CLIENTS.remove(websocket)
+            connection_profiles.release(websocket)
 
             # Remove from game if they were playing or spectating
             try:
@@ -851,6 +1120,15 @@ async def handler(websocket):
             except Exception as e:
                 logger.error(f"Error removing client from lobby: {str(e)}")
 
+            # Forget the latency estimate
+            remove_latency_tracker(client_id)
+
+            # Drop TV subscriptions
+            tv_channel.remove(websocket)
+
+            # Stop relaying a remote game
+            spectator_relay.remove_spectator(websocket)
+
             # Remove from username map
             try:
                 if client_id in CLIENT_USERNAMES:
@@ -885,43 +1163,124 @@ async def main():
 
     # Create the server with the simplest possible configuration
     try:
+        if REPLICATION_ROLE == "standby":
+            # Keep replicas of the primary's games until it goes away, then take over its port
+            await standby_replica.follow()
+            standby_replica.promote(game_manager)
+
+        # Games checkpointed by a server that drained before this one started
+        drain_controller.load_checkpoint()
+
+        # Lobby chat from every server process reaches this process's clients through the bus
+        await message_bus.start()
+        message_bus.subscribe(LOBBY_CHAT_TOPIC, deliver_lobby_chat)
+
+        if shard_router.enabled:
+            # Other workers proxy connections for this shard's games through a Unix socket
+            socket_path = shard_socket_path(shard_router.shard_index)
+            if os.path.exists(socket_path):
+                os.unlink(socket_path)
+            await websockets.unix_serve(shard_router.wrap_handler(handler), socket_path,
+                                        ping_interval=None, max_size=None, compression=None,
+                                        select_subprotocol=select_subprotocol)
+            logger.info(f"Worker {shard_router.shard_index}/{shard_router.worker_count} accepting shard traffic on {socket_path}")
+
+        # The listening socket is created here (or inherited from the server this one replaces)
+        # so that a draining server can hand it to its successor.
+        # Workers of a sharded server share the port; the kernel spreads connections across them
+        listen_socket = open_listening_socket(host, port, reuse_port=shard_router.enabled)
+
         # CRITICAL FIX: Use a more robust server configuration
         # This configuration is known to work with most clients
-        await websockets.serve(
+        server = await websockets.serve(
             handler,
-            host,
-            port,
+            sock=listen_socket,
             # IMPORTANT: Disable ping/pong to avoid connection issues
             # Some browsers have issues with WebSocket ping/pong
             ping_interval=None,
             ping_timeout=None,
             # Don't restrict origins to allow connections from any client
             origins=None,
-            # Increase max message size
-            max_size=10 * 1024 * 1024,  # 10 MB
+            # Bound each connection's receive buffer (per-type limits are checked in the handler)
+            max_size=MAX_MESSAGE_SIZE,
+            max_queue=MAX_QUEUE,
             # Set a longer close timeout
             close_timeout=10,
-            # Disable compression which can cause issues in some environments
+            # Answer plain HTTP requests for the read-only API before the WebSocket handshake
+            process_request=process_request,
+            # Wire formats a client can ask for (JSON text unless it opts into binary frames)
+            select_subprotocol=select_subprotocol,
+            # permessage-deflate is offered per connection, by process_request (see compression.py)
             compression=None
         )
 
         print(f"WebSocket server started successfully on {host}:{port}!")
         print(f"Waiting for connections...")
 
-        # Run forever
-        await asyncio.Future()
+        # SIGTERM/SIGINT drain the server, SIGHUP drains it into a successor on the same socket
+        drain_controller.attach_server(server, listen_socket)
+        loop = asyncio.get_running_loop()
+        loop.add_signal_handler(signal.SIGTERM, drain_controller.request)
+        loop.add_signal_handler(signal.SIGINT, drain_controller.request)
+        loop.add_signal_handler(signal.SIGHUP, drain_controller.request, True)
+
+        if REPLICATION_ROLE:
+            if REPLICATION_ROLE == "standby":
+                standby_replica.mark_serving()
+            # A promoted standby is the primary now: a restarted standby follows it
+            await get_replication_publisher().start(game_manager)
+
+        # Run until drained
+        await drain_controller.stopped
     except Exception as e:
         print(f"ERROR starting WebSocket server: {e}")
         logger.error(f"Failed to start WebSocket server: {e}")
         sys.exit(1)
 
+async def run_workers(worker_count):
+    """
+    Run a sharded server: one worker process per shard and per relay worker,
+    restarted if it dies, plus the message bus broker the workers talk through.
+
+    Args:
+        worker_count: Number of worker processes owning games
+    """
+    # An explicitly configured broker socket means the broker is run separately (python bus.py)
+    broker = BusBroker() if BUS_BACKEND == "unix" and not os.environ.get("CHESS_BUS_SOCKET") else None
+    if broker is not None:
+        await broker.start()
+
+    def spawn(shard):
+        env = dict(os.environ, CHESS_SHARD_INDEX=str(shard))
+        return subprocess.Popen([sys.executable, os.path.abspath(__file__)], env=env)
+
+    workers = [spawn(shard) for shard in range(worker_count + RELAY_WORKER_COUNT)]
+    print(f"Started {len(workers)} workers: {[worker.pid for worker in workers]}")
+    try:
+        while True:
+            await asyncio.sleep(1)
+            for shard, worker in enumerate(workers):
+                if worker.poll() is not None:
+                    logger.error(f"Worker {shard} exited with code {worker.returncode}, restarting it")
+                    workers[shard] = spawn(shard)
+    finally:
+        for worker in workers:
+            worker.terminate()
+        for worker in workers:
+            worker.wait()
+        if broker is not None:
+            await broker.close()
+
 if __name__ == "__main__":
     # CRITICAL FIX: Use a more robust way to run the server
     # This handles keyboard interrupts and other exceptions better
     try:
         print("Starting Chess WebSocket Server...")
-        print("Press Ctrl+C to stop the server")
-        asyncio.run(main())
+        print("Press Ctrl+C to drain and stop the server (twice to stop without waiting for games)")
+        if WORKER_COUNT + RELAY_WORKER_COUNT > 1 and SHARD_INDEX is None:
+            asyncio.run(run_workers(WORKER_COUNT))
+        else:
+            asyncio.run(main())
     except KeyboardInterrupt:
         print("\nServer stopped by user")
     except Exception as e:
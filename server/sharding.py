@@ -0,0 +1,352 @@
+# server/sharding.py
+import os
+import json
+import uuid
+import zlib
+import asyncio
+import itertools
+import websockets
+from websockets.exceptions import ConnectionClosed
+from thumbnails import get_thumbnail_cache
+from codec import send_message
+from config import WORKER_COUNT, RELAY_WORKER_COUNT, SHARD_INDEX, SHARD_SOCKET_DIR, FEATURED_GAMES_COUNT, \
+    SPECTATOR_RELAY
+
+# Shard whose lobby runs the matchmaking queue
+MATCHMAKING_SHARD = 0
+
+# Sent by a worker to the edge proxying a connection: reconnect to another shard and replay a message
+REDIRECT_TYPE = "shard_redirect"
+REDIRECT_PREFIX = '{"type": "%s"' % REDIRECT_TYPE
+
+# Messages workers send each other; they are only accepted on proxied connections
+SHARD_INTERNAL_TYPES = {"join_match", "shard_list_games", "relay_intro"}
+
+# Seconds to wait for another shard's answer (game list, spectator intro)
+REMOTE_REQUEST_TIMEOUT = 2.0
+
+
+def shard_for_game(game_id, worker_count=WORKER_COUNT):
+    """
+    Get the shard owning a game.
+
+    Args:
+        game_id: The game ID
+        worker_count: Number of shards
+
+    Returns:
+        int: The owning shard index
+    """
+    return zlib.crc32(game_id.encode()) % worker_count
+
+
+def shard_socket_path(shard):
+    """Path of the Unix socket a shard accepts proxied connections on."""
+    return os.path.join(SHARD_SOCKET_DIR, f"chess-shard-{shard}.sock")
+
+
+class ForwardedConnection:
+    """
+    A client connection proxied by this worker (the edge) to the shard owning its traffic.
+
+    Frames are relayed unchanged in both directions. When the shard answers with a
+    shard_redirect, the backend connection is replaced by one to the named shard
+    and the redirect's message is replayed there.
+    """
+
+    def __init__(self, websocket):
+        self.websocket = websocket
+        self.backend = None
+        self.shard = None
+
+    async def connect(self, shard, first_message):
+        """Open a backend connection to a shard and send the first message."""
+        # The shard encodes frames in the wire format the client negotiated with this edge
+        subprotocol = self.websocket.subprotocol
+        backend = await websockets.unix_connect(shard_socket_path(shard), ping_interval=None,
+                                                max_size=None, compression=None,
+                                                subprotocols=[subprotocol] if subprotocol else None)
+        await backend.send(first_message)
+        old_backend, self.backend, self.shard = self.backend, backend, shard
+        if old_backend is not None:
+            await old_backend.close()
+
+    async def run(self, shard, first_message):
+        """
+        Relay frames until the client or the backend goes away.
+
+        Args:
+            shard: The shard to connect to first
+            first_message: Message (as received) that triggered the forwarding
+        """
+        await self.connect(shard, first_message)
+        upstream = asyncio.create_task(self._client_to_backend())
+        try:
+            await self._backend_to_client()
+        finally:
+            upstream.cancel()
+            await self.backend.close()
+
+    async def _client_to_backend(self):
+        async for message in self.websocket:
+            backend = self.backend
+            try:
+                await backend.send(message)
+            except ConnectionClosed:
+                # The backend was swapped by a redirect in the meantime: resend to the new one
+                if self.backend is backend:
+                    return
+                await self.backend.send(message)
+        # The client is gone: closing the backend ends the downstream relay
+        await self.backend.close()
+
+    async def _backend_to_client(self):
+        while True:
+            backend = self.backend
+            redirect = None
+            async for message in backend:
+                if isinstance(message, str) and message.startswith(REDIRECT_PREFIX):
+                    redirect = json.loads(message)
+                    break
+                await self.websocket.send(message)
+
+            if redirect is None:
+                # The backend closed (or the client left and we closed it)
+                await self.websocket.close(1012, "Shard unavailable")
+                return
+
+            print(f"Redirecting client {id(self.websocket)} from shard {self.shard} to shard {redirect['shard']}")
+            await self.connect(redirect["shard"], json.dumps(redirect["replay"]))
+
+
+class ShardRouter:
+    """
+    Game-affinity routing between worker processes.
+
+    Every worker listens on the public port (SO_REUSEPORT), so a connection lands
+    on an arbitrary worker. Messages that belong to a game owned by another shard
+    (spectating it, resuming it) and queue joins (matchmaking runs on one shard)
+    make the worker proxy the connection to the right shard. A worker that receives
+    such a message on a connection it already serves for another worker answers
+    with a shard_redirect instead, so the edge re-targets the proxy.
+
+    Matched games are placed round-robin across shards; game IDs are drawn so that
+    they hash to the shard the game is created on. Relay workers (shard indices
+    from worker_count on) own no games. When there are any, spectators landing on
+    the worker that owns their game are handed to a relay worker (round-robin), so
+    the owner publishes each frame once and holds no spectators itself.
+    """
+
+    def __init__(self, shard_index=SHARD_INDEX, worker_count=WORKER_COUNT, relay_worker_count=RELAY_WORKER_COUNT):
+        """
+        Initialize the router.
+
+        Args:
+            shard_index: This worker's shard index (None when not running sharded)
+            worker_count: Number of workers owning games
+            relay_worker_count: Number of relay-only workers
+        """
+        self.shard_index = shard_index or 0
+        self.worker_count = max(worker_count, 1)
+        self.relay_worker_count = relay_worker_count
+        self.enabled = shard_index is not None and self.worker_count + relay_worker_count > 1
+        self.is_relay_worker = self.shard_index >= self.worker_count
+        # Spectators of remote games are held here and fed from the bus (see relay.py)
+        self.relay_spectators = self.enabled and SPECTATOR_RELAY
+        self.forwarded = set()  # Connections other workers proxy to this one
+        self.relaying = set()   # Client connections this worker proxies to a shard
+        self.forwards = 0       # Connections this worker proxied to a shard (for metrics)
+        self._placement = itertools.cycle(range(self.worker_count))
+        self._relay_placement = itertools.cycle(range(self.worker_count, self.worker_count + relay_worker_count))
+
+    def owner(self, game_id):
+        """Return the shard owning a game."""
+        return shard_for_game(game_id, self.worker_count) if self.enabled else self.shard_index
+
+    def is_local(self, game_id):
+        """Return True if the game is owned by this worker."""
+        return not self.enabled or self.owner(game_id) == self.shard_index
+
+    def new_game_id(self):
+        """Generate a game ID owned by this worker."""
+        while True:
+            game_id = str(uuid.uuid4())
+            if self.is_local(game_id):
+                return game_id
+
+    def place_game(self):
+        """Pick the shard a newly matched game is created on."""
+        return next(self._placement)
+
+    def is_forwarded(self, websocket):
+        """Return True if the connection is proxied to this worker by another one."""
+        return websocket in self.forwarded
+
+    def route(self, websocket, msg_type, message_data):
+        """
+        Decide whether a message must be handled by another shard.
+
+        Args:
+            websocket: The connection the message arrived on
+            msg_type: The message type
+            message_data: The parsed message
+
+        Returns:
+            int or None: The shard to hand the connection to, or None to handle it here
+        """
+        if not self.enabled:
+            return None
+
+        if msg_type == "join_queue":
+            # Queued players are always proxied, so they can be redirected once matched
+            if self.shard_index == MATCHMAKING_SHARD and self.is_forwarded(websocket):
+                return None
+            return MATCHMAKING_SHARD
+
+        if msg_type == "spectate_game" and self.relay_spectators:
+            # Spectators of remote games stay here (fed by the relay); spectators of
+            # this worker's own games go to a relay worker, if there is one
+            game_id = message_data.get("game_id")
+            if self.relay_worker_count and not self.is_relay_worker and \
+                    isinstance(game_id, str) and game_id and self.is_local(game_id):
+                return next(self._relay_placement)
+            return None
+
+        if msg_type in ("spectate_game", "request_game_state", "resume_game"):
+            game_id = message_data.get("game_id")
+            if isinstance(game_id, str) and game_id and not self.is_local(game_id):
+                return self.owner(game_id)
+        return None
+
+    def build_redirect(self, shard, replay):
+        """Build the shard_redirect message telling an edge to move a connection."""
+        return {"type": REDIRECT_TYPE, "shard": shard, "replay": replay}
+
+    async def forward(self, websocket, shard, first_message):
+        """
+        Proxy a client connection to a shard for the rest of its lifetime.
+
+        Args:
+            websocket: The client's WebSocket connection
+            shard: The target shard
+            first_message: The message that triggered the hand-off
+        """
+        self.forwards += 1
+        self.relaying.add(websocket)
+        print(f"Forwarding client {id(websocket)} to shard {shard}")
+        try:
+            await ForwardedConnection(websocket).run(shard, first_message)
+        except ConnectionClosed:
+            # One side went away without a clean close: the relay just ends
+            print(f"Stopped forwarding client {id(websocket)}")
+        except OSError as e:
+            print(f"Error forwarding client {id(websocket)} to shard {shard}: {str(e)}")
+            try:
+                await send_message(websocket, {
+                    "type": "error",
+                    "message": "Game server unavailable. Please try again."
+                })
+            except Exception:
+                pass
+        finally:
+            self.relaying.discard(websocket)
+
+    def wrap_handler(self, handler):
+        """
+        Wrap the connection handler for the Unix socket other workers connect to.
+
+        Args:
+            handler: The regular connection handler
+
+        Returns:
+            coroutine function: Handler marking its connections as forwarded
+        """
+        async def shard_handler(websocket):
+            self.forwarded.add(websocket)
+            try:
+                await handler(websocket)
+            finally:
+                self.forwarded.discard(websocket)
+        return shard_handler
+
+    async def request(self, shard, message, reply_type):
+        """
+        Send a request to another shard over its Unix socket and wait for the answer.
+
+        Args:
+            shard: The shard to ask
+            message: The request message (one of SHARD_INTERNAL_TYPES)
+            reply_type: Type of the answer message
+
+        Returns:
+            dict or None: The answer, or None if the shard closed the connection first
+        """
+        async def exchange():
+            async with websockets.unix_connect(shard_socket_path(shard), ping_interval=None,
+                                               max_size=None, compression=None) as connection:
+                await send_message(connection, message)
+                async for frame in connection:
+                    data = json.loads(frame)
+                    if data.get("type") == reply_type:
+                        return data
+            return None
+        return await asyncio.wait_for(exchange(), REMOTE_REQUEST_TIMEOUT)
+
+    async def _fetch_games(self, shard):
+        """Ask another shard for its games. Returns (games, [(game_id, score), ...])."""
+        data = await self.request(shard, {"type": "shard_list_games"}, "shard_games")
+        if data is None:
+            return [], []
+        return data["games"], [tuple(entry) for entry in data["featured"]]
+
+    async def gather_games(self, games, featured):
+        """
+        Merge this worker's games with those of every other shard.
+
+        Args:
+            games: Local game descriptions (GameManager.get_active_games_info)
+            featured: Local featured games as (game_id, score) pairs
+
+        Returns:
+            tuple: (all games, featured game IDs best first)
+        """
+        shards = [shard for shard in range(self.worker_count) if shard != self.shard_index]
+        results = await asyncio.gather(*(self._fetch_games(shard) for shard in shards), return_exceptions=True)
+
+        games = list(games)
+        featured = list(featured)
+        thumbnail_cache = get_thumbnail_cache()
+        for shard, result in zip(shards, results):
+            if isinstance(result, BaseException):
+                print(f"Error listing games of shard {shard}: {str(result)}")
+                continue
+            remote_games, remote_featured = result
+            for game in remote_games:
+                # Thumbnails are content-addressed: render them here so get_thumbnails can resolve them
+                if game.get("fen"):
+                    game["thumbnail"] = thumbnail_cache.get_ref(game["fen"])
+            games.extend(remote_games)
+            featured.extend(remote_featured)
+
+        featured.sort(key=lambda entry: -entry[1])
+        featured_ids = [game_id for game_id, _ in featured[:FEATURED_GAMES_COUNT]]
+        for game in games:
+            game["featured"] = game["id"] in featured_ids
+        return games, featured_ids
+
+
+# Shard router of this worker process
+_shard_router = None
+
+
+def get_shard_router():
+    """
+    Get the process-wide shard router.
+
+    Returns:
+        ShardRouter: The shared router
+    """
+    global _shard_router
+    if _shard_router is None:
+        _shard_router = ShardRouter()
+    return _shard_router
@@ -0,0 +1,199 @@
+# server/spectator_delay.py
+import heapq
+import asyncio
+import itertools
+from collections import deque
+
+# Maximum number of frames buffered per delayed game. Under a ply delay a ply keeps at
+# most two frames (see DelayedSpectatorStream.push), and the buffer always has room for
+# the plies still held back. Only frames waiting for the time delay alone can be dropped,
+# oldest first (every game_update frame is a full state, so spectators just skip one).
+DELAY_BUFFER_FRAMES = 1024
+
+
+class DelayedSpectatorStream:
+    """
+    Per-game ring buffer of encoded frames for delayed spectators.
+
+    Frames are encoded once when the players' update is broadcast and released
+    to all spectators of the game once they are both `delay_seconds` old and
+    `delay_plies` plies behind the live game. After the game ends only the
+    time delay applies, so the final frames are released too.
+
+    Under a ply delay, the clock ticks of a ply are coalesced: the ply keeps its
+    first frame (the move, with last_move) and the latest tick, so a ply that
+    comes due releases at most two frames however long it was thought about.
+    """
+
+    def __init__(self, session, delay_seconds=0.0, delay_plies=0, capacity=DELAY_BUFFER_FRAMES):
+        """
+        Initialize the stream.
+
+        Args:
+            session: The GameSession whose spectators receive the frames
+            delay_seconds: Minimum age of a frame before release
+            delay_plies: Minimum number of plies the live game must be ahead of a frame
+            capacity: Maximum number of buffered frames (raised to hold the plies held back)
+        """
+        self.session = session
+        self.delay_seconds = delay_seconds
+        self.delay_plies = delay_plies
+        # Two frames for each ply held back, plus the game_over frame
+        capacity = max(capacity, 2 * delay_plies + 2)
+        self.frames = deque(maxlen=capacity)  # (due time, ply, frame json, state, result)
+        self.live_ply = 0
+        self.finished = False
+        self.released_json = None    # Last frame released to spectators
+        self.released_state = None   # State dict of the last game_update frame released
+        self.released_result = None  # Game result, once the game_over frame is released
+
+    def push(self, now, ply, frame_json, state=None, result=None):
+        """
+        Buffer a frame.
+
+        Args:
+            now: Event loop time the frame was produced
+            ply: Ply of the live game when the frame was produced
+            frame_json: The encoded frame
+            state: The state dict of a game_update frame
+            result: The game result of a game_over frame
+        """
+        self.live_ply = max(self.live_ply, ply)
+        frames = self.frames
+        if self.delay_plies > 0 and not self.finished and state is not None and len(frames) >= 2 and \
+                frames[-1][1] == ply and frames[-2][1] == ply and frames[-1][3] is not None:
+            # A later tick of the same ply: it supersedes the previous tick
+            frames[-1] = (now + self.delay_seconds, ply, frame_json, state, None)
+            return
+        frames.append((now + self.delay_seconds, ply, frame_json, state, result))
+
+    def finish(self):
+        """Mark the game as over: from now on frames wait for the time delay only."""
+        self.finished = True
+
+    def next_due(self):
+        """Return the due time of the oldest frame, or None if the buffer is empty."""
+        return self.frames[0][0] if self.frames else None
+
+    def pop_due(self, now):
+        """
+        Remove the frames that can be released.
+
+        Args:
+            now: Current event loop time
+
+        Returns:
+            list: Encoded frames, oldest first
+        """
+        released = []
+        while self.frames:
+            due, ply, frame_json, state, result = self.frames[0]
+            if due > now or (not self.finished and self.live_ply - ply < self.delay_plies):
+                break
+            self.frames.popleft()
+            released.append(frame_json)
+            self.released_json = frame_json
+            if state is not None:
+                self.released_state = state
+            if result is not None:
+                self.released_result = result
+        return released
+
+
+class DelayedBroadcastScheduler:
+    """
+    Single scheduler draining the delayed streams of all games.
+
+    Streams with buffered frames are kept in a min-heap keyed by the due time
+    of their oldest frame, and one event-loop timer is armed for the earliest.
+    """
+
+    def __init__(self):
+        self._heap = []  # (due time, seq, stream)
+        self._counter = itertools.count()
+        self._scheduled = set()  # Streams currently in the heap
+        self._timer = None
+        self._timer_deadline = None
+        self._tasks = set()
+
+    def push(self, stream, ply, frame_json, state=None, result=None):
+        """
+        Buffer a frame on a stream and make sure it will be released.
+
+        Args:
+            stream: The game's DelayedSpectatorStream
+            ply: Ply of the live game
+            frame_json: The encoded frame
+            state: The state dict of a game_update frame
+            result: The game result of a game_over frame
+        """
+        loop = asyncio.get_running_loop()
+        stream.push(loop.time(), ply, frame_json, state, result)
+        # A new ply may unblock frames that were only waiting for the ply delay
+        self._release(stream, loop)
+
+    def _schedule(self, stream, loop):
+        """Put a stream in the heap for the due time of its oldest frame."""
+        due = stream.next_due()
+        if due is None or stream in self._scheduled:
+            return
+        heapq.heappush(self._heap, (due, next(self._counter), stream))
+        self._scheduled.add(stream)
+        if self._timer is None or due < self._timer_deadline:
+            self._arm(loop)
+
+    def _arm(self, loop):
+        """(Re)arm the timer for the earliest due stream, if any."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._heap:
+            self._timer_deadline = self._heap[0][0]
+            self._timer = loop.call_at(self._timer_deadline, self._fire)
+
+    def _release(self, stream, loop):
+        """Send a stream's due frames and reschedule it."""
+        frames = stream.pop_due(loop.time())
+        if frames:
+            task = loop.create_task(stream.session.send_to_spectators(frames))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        self._schedule(stream, loop)
+
+    def _fire(self):
+        """Release the frames of every stream whose oldest frame is due."""
+        self._timer = None
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+
+        while self._heap and self._heap[0][0] <= now:
+            _, _, stream = heapq.heappop(self._heap)
+            self._scheduled.discard(stream)
+            frames = stream.pop_due(now)
+            if frames:
+                task = loop.create_task(stream.session.send_to_spectators(frames))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+            elif stream.next_due() is not None and stream.next_due() <= now:
+                # Due by time but held back by the ply delay: the next push releases it
+                continue
+            self._schedule(stream, loop)
+
+        self._arm(loop)
+
+
+# Shared scheduler instance for all delayed games
+_delayed_broadcaster = None
+
+
+def get_delayed_broadcaster():
+    """
+    Get the process-wide delayed spectator broadcaster.
+
+    Returns:
+        DelayedBroadcastScheduler: The shared scheduler
+    """
+    global _delayed_broadcaster
+    if _delayed_broadcaster is None:
+        _delayed_broadcaster = DelayedBroadcastScheduler()
+    return _delayed_broadcaster
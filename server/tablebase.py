@@ -0,0 +1,179 @@
+# server/tablebase.py
+import os
+import asyncio
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import chess
+import chess.polyglot
+import chess.syzygy
+from config import SYZYGY_PATH
+
+
+class TablebaseProber:
+    """
+    Optional Syzygy endgame tablebase probing.
+
+    Probes touch the table files on disk, so they run on a dedicated worker
+    thread instead of the event loop. Results are cached per position in a
+    bounded LRU, since the same endgame positions tend to be probed repeatedly.
+    """
+
+    def __init__(self, directory, cache_size=10000):
+        """
+        Initialize the prober. The tables are not opened until the first probe.
+
+        Args:
+            directory: Directory containing .rtbw/.rtbz files (None disables probing)
+            cache_size: Maximum number of cached probe results
+        """
+        self.directory = directory
+        self.cache_size = cache_size
+        self.max_pieces = 0
+        self._tablebase = None
+        self._unavailable = directory is None
+        self._cache = OrderedDict()  # Maps zobrist hash -> probe result
+        self._executor = None
+
+    def _get_tablebase(self):
+        """
+        Open the tablebase directory on first use.
+
+        Returns:
+            chess.syzygy.Tablebase or None: The tablebase, or None if unavailable
+        """
+        if self._tablebase is None and not self._unavailable:
+            try:
+                tablebase = chess.syzygy.open_tablebase(self.directory)
+            except OSError as e:
+                print(f"Syzygy tablebase unavailable ({self.directory}): {str(e)}")
+                self._unavailable = True
+                return None
+
+            if not tablebase.wdl:
+                print(f"No Syzygy tables found in {self.directory}")
+                tablebase.close()
+                self._unavailable = True
+                return None
+
+            # Table names look like "KRPvKR": every letter except the 'v' is a piece
+            self.max_pieces = max(len(name) - 1 for name in tablebase.wdl)
+            self._tablebase = tablebase
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="syzygy")
+            print(f"Syzygy tablebase opened: {len(tablebase.wdl)} tables, up to {self.max_pieces} pieces")
+        return self._tablebase
+
+    def can_probe(self, board):
+        """
+        Check whether a position is covered by the available tables.
+
+        Args:
+            board: chess.Board to check
+
+        Returns:
+            bool: True if the position can be probed
+        """
+        if self._get_tablebase() is None:
+            return False
+        # Syzygy tables don't cover positions with castling rights
+        return chess.popcount(board.occupied) <= self.max_pieces and not board.castling_rights
+
+    def _probe_sync(self, board):
+        """
+        Probe WDL and DTZ for a position (runs on the worker thread).
+
+        Args:
+            board: Private copy of the board to probe
+
+        Returns:
+            dict or None: {"wdl": ..., "dtz": ...} from the side to move's point of view
+        """
+        try:
+            wdl = self._tablebase.probe_wdl(board)
+        except (KeyError, chess.syzygy.MissingTableError):
+            return None
+
+        try:
+            dtz = self._tablebase.probe_dtz(board)
+        except (KeyError, chess.syzygy.MissingTableError):
+            dtz = None
+
+        return {"wdl": wdl, "dtz": dtz}
+
+    async def probe(self, board):
+        """
+        Probe a position without blocking the event loop.
+
+        Args:
+            board: chess.Board to probe (it is copied, so the caller may keep playing)
+
+        Returns:
+            dict or None: {"wdl": ..., "dtz": ...}, or None if the position isn't covered
+        """
+        if not self.can_probe(board):
+            return None
+
+        key = chess.polyglot.zobrist_hash(board)
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            return self._cache[key]
+
+        board_copy = board.copy(stack=False)
+        loop = asyncio.get_running_loop()
+        result = await loop.run_in_executor(self._executor, self._probe_sync, board_copy)
+
+        if result is not None:
+            self._cache[key] = result
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return result
+
+    def close(self):
+        """Close the table files and stop the worker thread."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+        if self._tablebase is not None:
+            self._tablebase.close()
+            self._tablebase = None
+
+
+def result_from_probe(board, probe):
+    """
+    Convert a tablebase probe into a game result dictionary.
+
+    Cursed wins and blessed losses (|wdl| == 1) can't be forced within the
+    50-move rule, so they are adjudicated as draws.
+
+    Args:
+        board: The probed position
+        probe: Result of TablebaseProber.probe()
+
+    Returns:
+        dict: Result in the same format as ChessGame.get_game_result()
+    """
+    side_to_move = "white" if board.turn == chess.WHITE else "black"
+    other_side = "black" if side_to_move == "white" else "white"
+
+    if probe["wdl"] == 2:
+        return {"outcome": "tablebase_win", "winner": side_to_move, "dtz": probe["dtz"]}
+    if probe["wdl"] == -2:
+        return {"outcome": "tablebase_win", "winner": other_side, "dtz": probe["dtz"]}
+    return {"outcome": "tablebase_draw"}
+
+
+# Shared prober instance, opened lazily on the first probe
+_tablebase_prober = None
+
+
+def get_tablebase():
+    """
+    Get the process-wide tablebase prober.
+
+    Returns:
+        TablebaseProber: The shared prober for SYZYGY_PATH
+    """
+    global _tablebase_prober
+    if _tablebase_prober is None:
+        directory = SYZYGY_PATH if SYZYGY_PATH and os.path.isdir(SYZYGY_PATH) else None
+        _tablebase_prober = TablebaseProber(directory)
+    return _tablebase_prober
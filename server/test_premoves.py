@@ -0,0 +1,71 @@
+# server/test_premoves.py
+import json
+import asyncio
+from game_session import GameSession
+
+
+class FakeWebSocket:
+    """Player connection collecting the messages the session sends it."""
+
+    subprotocol = None
+
+    def __init__(self):
+        self.sent = []
+
+    async def send(self, frame):
+        self.sent.append(json.loads(frame))
+
+    def messages(self, msg_type):
+        return [message for message in self.sent if message.get("type") == msg_type]
+
+
+def new_session():
+    white, black = FakeWebSocket(), FakeWebSocket()
+    session = GameSession("premove-test", white, black)
+    session.chess_game.start_clock()
+    return session, white, black
+
+
+async def move(session, websocket, uci_move, premove=False):
+    await session.handle_message(websocket, json.dumps({"type": "make_move", "move": uci_move, "premove": premove}))
+
+
+def test_own_move_supersedes_own_premoves():
+    async def run():
+        session, white, black = new_session()
+        # Both sides have premoves queued while white is to move
+        session.premoves = {"white": ["d2d4"], "black": ["e7e5", "g8f6"]}
+
+        await move(session, white, "e2e4")
+
+        moves = [move.uci() for move in session.chess_game.board.move_stack]
+        # Black's first premove answers white's move; white's queue was planned for another position
+        assert moves == ["e2e4", "e7e5"]
+        assert "white" not in session.premoves
+        assert session.premoves["black"] == ["g8f6"]
+        assert white.messages("premoves_cancelled")[-1]["moves"] == ["d2d4"]
+        assert white.messages("premoves_cancelled")[-1]["reason"] == "superseded"
+
+        # White's next move is answered by black's remaining premove, and d2d4 is never played
+        await move(session, white, "g1f3")
+        moves = [move.uci() for move in session.chess_game.board.move_stack]
+        assert moves == ["e2e4", "e7e5", "g1f3", "g8f6"]
+        assert not session.premoves.get("black")
+    asyncio.run(run())
+
+
+def test_premove_is_played_at_the_turn_flip():
+    async def run():
+        session, white, black = new_session()
+        await move(session, white, "e2e4")
+
+        # White premoves while black thinks; black's move plays it at once
+        await move(session, white, "g1f3", premove=True)
+        await move(session, black, "e7e5")
+
+        moves = [move.uci() for move in session.chess_game.board.move_stack]
+        assert moves == ["e2e4", "e7e5", "g1f3"]
+        assert session.chess_game.get_turn_color_string() == "black"
+        assert not session.premoves.get("white")
+        assert white.messages("move_confirmed")[-1]["premove"] is True
+    asyncio.run(run())
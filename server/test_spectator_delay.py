@@ -0,0 +1,81 @@
+# server/test_spectator_delay.py
+from spectator_delay import DelayedSpectatorStream, DELAY_BUFFER_FRAMES
+
+TICK = 0.1  # Clock tick interval of the timer loop (seconds)
+
+
+def play(stream, think_times, released):
+    """
+    Push a move frame and then a clock tick every TICK seconds for each ply,
+    collecting the (ply, tick) of the frames the stream releases.
+
+    Args:
+        stream: The DelayedSpectatorStream under test
+        think_times: Seconds spent on each ply
+        released: List the released (ply, tick) pairs are appended to
+
+    Returns:
+        float: Time at the end of the game
+    """
+    now = 0.0
+    for ply, think_time in enumerate(think_times):
+        for tick in range(int(think_time / TICK) + 1):
+            state = {"ply": ply, "tick": tick}
+            stream.push(now, ply, f"{ply}:{tick}", state)
+            released.extend(tuple(map(int, frame.split(":"))) for frame in stream.pop_due(now))
+            now += TICK
+    return now
+
+
+def test_ply_delay_releases_move_and_latest_tick():
+    stream = DelayedSpectatorStream(None, delay_plies=1)
+    released = []
+    play(stream, [120, 120, 120, 120], released)
+
+    # Each ply comes due when the next one starts, with its move frame and last tick only
+    assert released == [(0, 0), (0, 1200), (1, 0), (1, 1200), (2, 0), (2, 1200)]
+    assert len(stream.frames) <= 2
+    assert stream.released_state == {"ply": 2, "tick": 1200}
+
+
+def test_ply_delay_keeps_plies_held_back():
+    stream = DelayedSpectatorStream(None, delay_plies=2)
+    released = []
+    play(stream, [60, 120, 90, 120, 60], released)
+
+    assert [ply for ply, tick in released] == [0, 0, 1, 1, 2, 2]
+    assert released[0] == (0, 0)
+
+
+def test_long_ply_delay_is_never_evicted():
+    plies = DELAY_BUFFER_FRAMES
+    stream = DelayedSpectatorStream(None, delay_plies=plies)
+    released = []
+    play(stream, [0.2] * (plies + 3), released)
+
+    assert sorted({ply for ply, tick in released}) == [0, 1, 2]
+
+
+def test_finished_game_releases_rest_after_time_delay():
+    stream = DelayedSpectatorStream(None, delay_seconds=5, delay_plies=2)
+    released = []
+    now = play(stream, [30, 30, 30], released)
+    stream.finish()
+    stream.push(now, 2, "game_over", result={"outcome": "resignation", "winner": "white"})
+
+    # Ply 1 and the move of ply 2 are old enough; the last tick and the result are not yet
+    assert stream.pop_due(now) == ["1:0", "1:300", "2:0"]
+    assert stream.released_result is None
+    assert stream.pop_due(now + 5) == ["2:300", "game_over"]
+    assert stream.released_result == {"outcome": "resignation", "winner": "white"}
+
+
+def test_time_delay_keeps_every_tick():
+    stream = DelayedSpectatorStream(None, delay_seconds=1)
+    released = []
+    play(stream, [3, 3], released)
+
+    # Without a ply delay nothing is coalesced: spectators see the clock run
+    pushed = [(ply, tick) for ply in range(2) for tick in range(31)]
+    assert len(released) > 40
+    assert released == pushed[:len(released)]
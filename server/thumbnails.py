@@ -0,0 +1,135 @@
+# server/thumbnails.py
+import os
+import hashlib
+from collections import OrderedDict
+import chess
+import chess.svg
+from config import THUMBNAIL_CACHE_SIZE, THUMBNAIL_SPILL_DIR, THUMBNAIL_SIZE
+
+
+def thumbnail_key(fen):
+    """
+    Get the content address of a position's thumbnail.
+
+    Only the piece placement is drawn, so positions that differ only in
+    side to move, castling rights or move counters share a thumbnail.
+
+    Args:
+        fen: FEN string (full or piece placement only)
+
+    Returns:
+        str: Hex digest identifying the thumbnail
+    """
+    placement = fen.split(" ", 1)[0]
+    return hashlib.sha1(placement.encode("ascii")).hexdigest()[:16]
+
+
+class ThumbnailCache:
+    """
+    Board thumbnails rendered with chess.svg, content-addressed by FEN hash.
+
+    Rendered SVGs are kept in a bounded LRU. If a spill directory is
+    configured, evicted thumbnails are written there and read back on a miss
+    instead of being rendered again.
+    """
+
+    def __init__(self, capacity=THUMBNAIL_CACHE_SIZE, spill_dir=THUMBNAIL_SPILL_DIR, size=THUMBNAIL_SIZE):
+        """
+        Initialize the cache.
+
+        Args:
+            capacity: Maximum number of thumbnails kept in memory
+            spill_dir: Directory evicted thumbnails are written to (None to drop them)
+            size: Width and height of the rendered board in pixels
+        """
+        self.capacity = capacity
+        self.spill_dir = spill_dir
+        self.size = size
+        self._svgs = OrderedDict()  # Maps key -> SVG string
+        self.renders = 0  # Number of boards rendered (for metrics)
+
+    def _spill_path(self, key):
+        return os.path.join(self.spill_dir, f"{key}.svg")
+
+    def _store(self, key, svg):
+        """Insert an SVG, evicting (and spilling) the least recently used ones."""
+        self._svgs[key] = svg
+        self._svgs.move_to_end(key)
+        while len(self._svgs) > self.capacity:
+            evicted_key, evicted_svg = self._svgs.popitem(last=False)
+            if self.spill_dir:
+                path = self._spill_path(evicted_key)
+                if not os.path.exists(path):
+                    try:
+                        os.makedirs(self.spill_dir, exist_ok=True)
+                        with open(path, "w") as f:
+                            f.write(evicted_svg)
+                    except OSError as e:
+                        print(f"Error spilling thumbnail {evicted_key}: {str(e)}")
+
+    def get_ref(self, fen):
+        """
+        Make sure a position's thumbnail exists and return its key.
+
+        Args:
+            fen: FEN string of the position
+
+        Returns:
+            str: The thumbnail key, to be resolved with get_svg()
+        """
+        key = thumbnail_key(fen)
+        if key in self._svgs:
+            self._svgs.move_to_end(key)
+        elif self._load_spilled(key) is None:
+            board = chess.Board(fen) if " " in fen else chess.BaseBoard(fen)
+            self.renders += 1
+            self._store(key, chess.svg.board(board, size=self.size, coordinates=False))
+        return key
+
+    def _load_spilled(self, key):
+        """Move a spilled thumbnail back into memory. Returns the SVG or None."""
+        if not self.spill_dir:
+            return None
+        try:
+            with open(self._spill_path(key)) as f:
+                svg = f.read()
+        except OSError:
+            return None
+        self._store(key, svg)
+        return svg
+
+    def get_svg(self, key):
+        """
+        Get a thumbnail by key.
+
+        Args:
+            key: Key returned by get_ref()
+
+        Returns:
+            str or None: The SVG, or None if the key is unknown
+        """
+        svg = self._svgs.get(key)
+        if svg is not None:
+            self._svgs.move_to_end(key)
+            return svg
+        # Keys come from clients: only well-formed ones may touch the spill directory
+        if len(key) != 16 or any(c not in "0123456789abcdef" for c in key):
+            return None
+        return self._load_spilled(key)
+
+
+# Shared thumbnail cache for the process
+_thumbnail_cache = None
+
+
+def get_thumbnail_cache():
+    """
+    Get the process-wide thumbnail cache.
+
+    Returns:
+        ThumbnailCache: The shared cache
+    """
+    global _thumbnail_cache
+    if _thumbnail_cache is None:
+        _thumbnail_cache = ThumbnailCache()
+    return _thumbnail_cache
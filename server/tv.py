@@ -0,0 +1,245 @@
+# server/tv.py
+import asyncio
+from codec import send_message, Frame
+from config import TV_TICK_SECONDS, TV_MAX_GAMES
+
+# Fields of a game_update forwarded to TV viewers
+TV_STATE_FIELDS = ("fen", "turn", "time_white", "time_black", "time_elapsed", "is_game_over",
+                   "result", "last_move", "opening", "timestamp")
+
+
+def compact_state(game_id, state):
+    """
+    Reduce a game_update message to the fields shown on a TV board.
+
+    Args:
+        game_id: The game ID
+        state: The game_update message
+
+    Returns:
+        dict: The compact game entry of a tv_update frame
+    """
+    entry = {"game_id": game_id}
+    for field in TV_STATE_FIELDS:
+        if field in state:
+            entry[field] = state[field]
+    return entry
+
+
+class TvSubscription:
+    """Games one connection watches: explicit game IDs and/or the top-games feed."""
+
+    __slots__ = ("game_ids", "top")
+
+    def __init__(self):
+        self.game_ids = set()
+        self.top = 0  # Number of top games followed automatically (0 for none)
+
+
+class TvChannel:
+    """
+    Multiplexed spectator channel.
+
+    A connection subscribes to several games (or to the top-games feed) and
+    receives their updates batched into a single tv_update frame per tick.
+    Only the latest update of each game is kept between ticks, and viewers
+    watching the same set of updated games share one encoded frame.
+    """
+
+    def __init__(self):
+        self.game_manager = None
+        self.subscriptions = {}     # Maps websocket -> TvSubscription
+        self.game_subscribers = {}  # Maps game_id -> set of websockets subscribed explicitly
+        self.top_subscribers = 0    # Number of connections following the top-games feed
+        self._pending = {}          # Maps game_id -> latest game_update since the last tick
+        self._ticker = None
+
+    def bind(self, game_manager):
+        """Attach the game manager used to look up games and the top-games feed."""
+        self.game_manager = game_manager
+
+    def is_watched(self, game_id):
+        """Return True if any TV viewer may need updates of the game."""
+        return self.top_subscribers > 0 or game_id in self.game_subscribers
+
+    def publish(self, game_id, state):
+        """
+        Record a game's latest state for the next tick.
+
+        Args:
+            game_id: The game ID
+            state: The game_update message (as sent to spectators)
+        """
+        if self.is_watched(game_id):
+            self._pending[game_id] = state
+
+    def _top_game_ids(self, count):
+        """Get the IDs of the top games (see GameManager.get_top_game_ids)."""
+        if self.game_manager is None or count <= 0:
+            return []
+        return self.game_manager.get_top_game_ids(count)
+
+    async def subscribe(self, websocket, game_ids=None, top=0):
+        """
+        Subscribe a connection to games and/or the top-games feed.
+
+        Args:
+            websocket: The viewer's WebSocket connection
+            game_ids: Game IDs to add to the subscription
+            top: Follow this many top games (0 to keep the current setting)
+
+        Returns:
+            TvSubscription: The connection's subscription
+        """
+        subscription = self.subscriptions.get(websocket)
+        if subscription is None:
+            subscription = TvSubscription()
+            self.subscriptions[websocket] = subscription
+
+        active_games = self.game_manager.active_games if self.game_manager is not None else {}
+        for game_id in game_ids or ():
+            if len(subscription.game_ids) >= TV_MAX_GAMES:
+                break
+            if game_id in active_games:
+                subscription.game_ids.add(game_id)
+                self.game_subscribers.setdefault(game_id, set()).add(websocket)
+
+        if top:
+            if not subscription.top:
+                self.top_subscribers += 1
+            subscription.top = min(int(top), TV_MAX_GAMES)
+
+        if self._ticker is None:
+            self._ticker = asyncio.create_task(self._tick_loop())
+
+        # Send the current state of every watched game right away
+        game_ids = subscription.game_ids.union(self._top_game_ids(subscription.top))
+        games = []
+        for game_id in sorted(game_ids):
+            session = active_games.get(game_id)
+            if session is not None:
+                games.append(compact_state(game_id, session.get_spectator_state()))
+        await send_message(websocket, {
+            "type": "tv_update",
+            "games": games,
+            "subscribed": sorted(subscription.game_ids),
+            "top": subscription.top
+        })
+        return subscription
+
+    def unsubscribe(self, websocket, game_ids=None, top=False):
+        """
+        Remove games (or everything, if game_ids is None and top is False) from a subscription.
+
+        Args:
+            websocket: The viewer's WebSocket connection
+            game_ids: Game IDs to remove
+            top: Stop following the top-games feed
+        """
+        subscription = self.subscriptions.get(websocket)
+        if subscription is None:
+            return
+
+        remove_all = game_ids is None and not top
+        for game_id in list(subscription.game_ids) if remove_all else game_ids or ():
+            subscription.game_ids.discard(game_id)
+            subscribers = self.game_subscribers.get(game_id)
+            if subscribers is not None:
+                subscribers.discard(websocket)
+                if not subscribers:
+                    del self.game_subscribers[game_id]
+
+        if (top or remove_all) and subscription.top:
+            subscription.top = 0
+            self.top_subscribers -= 1
+
+        if not subscription.game_ids and not subscription.top:
+            del self.subscriptions[websocket]
+
+    def remove(self, websocket):
+        """Drop all subscriptions of a connection (on disconnect)."""
+        self.unsubscribe(websocket)
+
+    def game_ended(self, game_id):
+        """
+        Forget a finished game once its last update has been sent.
+
+        Args:
+            game_id: The game ID
+        """
+        for websocket in list(self.game_subscribers.get(game_id, ())):
+            self.unsubscribe(websocket, [game_id])
+
+    async def _tick_loop(self):
+        """Send one batched frame per viewer per tick, while there are viewers."""
+        try:
+            while self.subscriptions:
+                await asyncio.sleep(TV_TICK_SECONDS)
+                await self._flush()
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            print(f"Error in TV tick loop: {str(e)}")
+        finally:
+            self._ticker = None
+
+    async def _flush(self):
+        """Send the updates collected since the last tick."""
+        pending, self._pending = self._pending, {}
+        if not pending:
+            return
+
+        # Group viewers by the set of updated games they watch, so each group shares one frame
+        top_ids = {}  # Maps top count -> top game IDs, computed once per tick
+        groups = {}
+        for websocket, subscription in self.subscriptions.items():
+            watched = subscription.game_ids
+            if subscription.top:
+                if subscription.top not in top_ids:
+                    top_ids[subscription.top] = self._top_game_ids(subscription.top)
+                watched = watched.union(top_ids[subscription.top])
+            key = frozenset(game_id for game_id in watched if game_id in pending)
+            if key:
+                groups.setdefault(key, []).append(websocket)
+
+        entries = {}  # Compact entries, built at most once per game per tick
+        failed = []
+        for key, websockets in groups.items():
+            games = []
+            for game_id in sorted(key):
+                if game_id not in entries:
+                    entries[game_id] = compact_state(game_id, pending[game_id])
+                games.append(entries[game_id])
+            frame = Frame({"type": "tv_update", "games": games})
+
+            for websocket in websockets:
+                try:
+                    await websocket.send(frame.for_connection(websocket))
+                except Exception as e:
+                    print(f"Error sending TV frame to {id(websocket)}: {str(e)}")
+                    failed.append(websocket)
+
+        for websocket in failed:
+            self.remove(websocket)
+
+        # Finished games are dropped from explicit subscriptions after their final update
+        for game_id, state in pending.items():
+            if state.get("is_game_over"):
+                self.game_ended(game_id)
+
+
+# Shared TV channel for the process
+_tv_channel = None
+
+
+def get_tv_channel():
+    """
+    Get the process-wide TV channel.
+
+    Returns:
+        TvChannel: The shared channel
+    """
+    global _tv_channel
+    if _tv_channel is None:
+        _tv_channel = TvChannel()
+    return _tv_channel